@@ -1,4 +1,5 @@
 import os
+import shutil
 from google import genai
 import markdown
 import pdfkit
@@ -36,8 +37,9 @@ def markdown_to_pdf(markdown_text: str, output_pdf_path: str):
     </html>
     """
     
-    # 指定 wkhtmltopdf 的路徑（請根據實際安裝路徑調整）
-    path_wkhtmltopdf = r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
+    # 依序從環境變數 WKHTMLTOPDF、PATH 尋找 wkhtmltopdf，最後才使用 Windows 的預設安裝路徑
+    path_wkhtmltopdf = (os.getenv("WKHTMLTOPDF") or shutil.which("wkhtmltopdf")
+                        or r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe")
     config = pdfkit.configuration(wkhtmltopdf=path_wkhtmltopdf)
     
     # 加入啟用 local file access 的選項，避免載入本地資源時產生錯誤
@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import pandas as pd
+
+
+def count_records(csv_file_path, chunk_size=10000):
+    """只讀第一個欄位來計算總筆數，不需要把整個檔案載入記憶體"""
+    return sum(len(chunk) for chunk in pd.read_csv(csv_file_path, usecols=[0], chunksize=chunk_size))
+
+
+def iter_chunks(csv_file_path, chunk_size=1000):
+    """逐批讀取 CSV，回傳 (起始索引, 批次資料)"""
+    for idx, chunk in enumerate(pd.read_csv(csv_file_path, chunksize=chunk_size)):
+        yield idx * chunk_size, chunk
+
+
+class ConversationLog:
+    """將對話紀錄逐批附加到 CSV，不在記憶體中累積所有訊息"""
+
+    def __init__(self, output_file, columns=None):
+        self.output_file = output_file
+        self.columns = columns
+        # 每次執行都重新開始一份紀錄
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+    def append(self, records):
+        if not records:
+            return
+        first_write = not os.path.exists(self.output_file)
+        df = pd.DataFrame(records, columns=self.columns)
+        # 第一次寫入時加上 BOM（utf-8-sig），方便 Excel 開啟
+        df.to_csv(self.output_file, mode="a", index=False, header=first_write,
+                  encoding="utf-8-sig" if first_write else "utf-8")
+
+
+class TeamPool:
+    """固定數量的 team 實例，用完後 reset 再交給下一個批次重複使用"""
+
+    def __init__(self, make_team, size):
+        self.make_team = make_team
+        self.size = size
+        self._queue = asyncio.Queue()
+        self._created = 0
+
+    async def acquire(self):
+        if self._queue.empty() and self._created < self.size:
+            self._created += 1
+            return self.make_team()
+        return await self._queue.get()
+
+    async def release(self, team):
+        try:
+            await team.reset()
+        except BaseException:
+            # reset 失敗的 team 不再重複使用，讓下一次 acquire 重新建立一個
+            self._created -= 1
+            raise
+        self._queue.put_nowait(team)
+
+
+class BatchRunner:
+    """以串流方式逐批讀取資料，同時最多只有 max_in_flight 個批次在和模型對話"""
+
+    def __init__(self, make_team, process_chunk, log, max_in_flight=2, ledger=None, model=None):
+        self.pool = TeamPool(make_team, max_in_flight)
+        self.process_chunk = process_chunk
+        self.log = log
+        self.max_in_flight = max_in_flight
+        # 選用的 usage.UsageLedger，每個批次記錄一筆 token 用量與耗時
+        self.ledger = ledger
+        self.model = model
+
+    async def _run_one(self, semaphore, chunk, start_idx, total_records):
+        # 不論 team 的 reset 是否成功都要歸還 semaphore，否則空位會越來越少直到卡死
+        try:
+            team = await self.pool.acquire()
+            try:
+                started = time.perf_counter()
+                records = await self.process_chunk(team, chunk, start_idx, total_records)
+                if self.ledger is not None:
+                    self.ledger.record(
+                        "dataAgent", self.model, f"batch_{start_idx}",
+                        prompt_tokens=sum(r.get("prompt_tokens") or 0 for r in records),
+                        completion_tokens=sum(r.get("completion_tokens") or 0 for r in records),
+                        latency=time.perf_counter() - started, backend="autogen",
+                    )
+                self.log.append(records)
+                return len(records)
+            finally:
+                await self.pool.release(team)
+        finally:
+            semaphore.release()
+
+    async def run(self, chunks, total_records):
+        """chunks 為 (起始索引, 批次資料) 的 iterator；在有空位時才讀取下一批，記憶體用量與總筆數無關"""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        total_messages = 0
+        try:
+            for start_idx, chunk in chunks:
+                await semaphore.acquire()
+                task = asyncio.create_task(self._run_one(semaphore, chunk, start_idx, total_records))
+                tasks.add(task)
+                done = {t for t in tasks if t.done()}
+                for t in done:
+                    total_messages += t.result()
+                tasks -= done
+            for count in await asyncio.gather(*tasks):
+                total_messages += count
+        except BaseException:
+            # 任一批次失敗時取消其餘批次並等待它們結束，不留下未等待的 task
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return total_messages
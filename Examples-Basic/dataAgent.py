@@ -1,8 +1,12 @@
 import os
+import sys
 import asyncio
-import pandas as pd
 from dotenv import load_dotenv
-import io
+from batchRunner import BatchRunner, ConversationLog, count_records, iter_chunks
+
+# 與主 pipeline 共用 usage.py 的用量紀錄格式
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from usage import UsageLedger
 
 # 根據你的專案結構調整下列 import
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
@@ -14,7 +18,24 @@ from autogen_ext.agents.web_surfer import MultimodalWebSurfer
 
 load_dotenv()
 
-async def process_chunk(chunk, start_idx, total_records, model_client, termination_condition):
+# 同時與模型對話的批次數上限（也是 team 實例的數量）
+MAX_IN_FLIGHT = 2
+
+LOG_COLUMNS = ["batch_start", "batch_end", "source", "content", "type", "prompt_tokens", "completion_tokens"]
+
+def make_team(model_client):
+    """建立四個代理人組成的 team；team 會在批次之間 reset 後重複使用
+    （終止條件帶有狀態，因此每個 team 各自建立一個，不在同時執行的 team 之間共用）"""
+    data_agent = AssistantAgent("data_agent", model_client)
+    web_surfer = MultimodalWebSurfer("web_surfer", model_client)
+    assistant = AssistantAgent("assistant", model_client)
+    user_proxy = UserProxyAgent("user_proxy")
+    return RoundRobinGroupChat(
+        [data_agent, web_surfer, assistant, user_proxy],
+        termination_condition=TextMentionTermination("exit")
+    )
+
+async def process_chunk(team, chunk, start_idx, total_records):
     """
     處理單一批次資料：
       - 將該批次資料轉成 dict 格式
@@ -39,18 +60,8 @@ async def process_chunk(chunk, start_idx, total_records, model_client, terminati
         "請各代理人協同合作，提供一份完整且具參考價值的建議。"
     )
     
-    # 為每個批次建立新的 agent 與 team 實例
-    local_data_agent = AssistantAgent("data_agent", model_client)
-    local_web_surfer = MultimodalWebSurfer("web_surfer", model_client)
-    local_assistant = AssistantAgent("assistant", model_client)
-    local_user_proxy = UserProxyAgent("user_proxy")
-    local_team = RoundRobinGroupChat(
-        [local_data_agent, local_web_surfer, local_assistant, local_user_proxy],
-        termination_condition=termination_condition
-    )
-    
     messages = []
-    async for event in local_team.run_stream(task=prompt):
+    async for event in team.run_stream(task=prompt):
         if isinstance(event, TextMessage):
             # 印出目前哪個 agent 正在運作，方便追蹤
             print(f"[{event.source}] => {event.content}\n")
@@ -72,40 +83,29 @@ async def main():
         return
 
     # 初始化模型用戶端 (此處示範使用 gemini-2.0-flash)
+    model_name = "gemini-2.0-flash"
     model_client = OpenAIChatCompletionClient(
-        model="gemini-2.0-flash",
+        model=model_name,
         api_key=gemini_api_key,
     )
-    
-    termination_condition = TextMentionTermination("exit")
-    
-    # 使用 pandas 以 chunksize 方式讀取 CSV 檔案
+
+    # 使用 pandas 以 chunksize 方式逐批讀取 CSV 檔案，不一次載入所有批次
     csv_file_path = "cuboai_baby_diary.csv"
     chunk_size = 1000
-    chunks = list(pd.read_csv(csv_file_path, chunksize=chunk_size))
-    total_records = sum(chunk.shape[0] for chunk in chunks)
-    
-    # 利用 map 與 asyncio.gather 同時處理所有批次（避免使用傳統 for 迴圈）
-    tasks = list(map(
-        lambda idx_chunk: process_chunk(
-            idx_chunk[1],
-            idx_chunk[0] * chunk_size,
-            total_records,
-            model_client,
-            termination_condition
-        ),
-        enumerate(chunks)
-    ))
-    
-    results = await asyncio.gather(*tasks)
-    # 將所有批次的訊息平坦化成一個清單
-    all_messages = [msg for batch in results for msg in batch]
-    
-    # 將對話紀錄整理成 DataFrame 並存成 CSV
-    df_log = pd.DataFrame(all_messages)
+    total_records = count_records(csv_file_path)
+
+    # 同時最多 MAX_IN_FLIGHT 個批次在執行，每完成一個批次就把對話紀錄附加到 CSV
     output_file = "all_conversation_log.csv"
-    df_log.to_csv(output_file, index=False, encoding="utf-8-sig")
-    print(f"已將所有對話紀錄輸出為 {output_file}")
+    runner = BatchRunner(
+        make_team=lambda: make_team(model_client),
+        process_chunk=process_chunk,
+        log=ConversationLog(output_file, columns=LOG_COLUMNS),
+        max_in_flight=MAX_IN_FLIGHT,
+        ledger=UsageLedger("usage.jsonl"),
+        model=model_name,
+    )
+    total_messages = await runner.run(iter_chunks(csv_file_path, chunk_size), total_records)
+    print(f"已將 {total_messages} 筆對話紀錄輸出為 {output_file}")
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+from workspace import artifact_keys
+
+# 預設建立索引的目錄（各 LLM 階段的輸出）
+DEFAULT_DIRS = ["clusterSummary", "clusterAnalysis", "epochSummary"]
+INDEX_FILE = ".artifact_index.json"
+
+# BM25 參數
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 查詢中的 Depth / Epoch / Cluster 條件，例如「深度2epoch1」、「Depth 2, Epoch 1, Cluster 3」
+QUERY_PATTERNS = {
+    "depth": re.compile(r"(?:depth|深度)\s*_?\s*(\d+)", re.IGNORECASE),
+    "epoch": re.compile(r"(?:epoch|世代)\s*_?\s*(\d+)", re.IGNORECASE),
+    "cluster": re.compile(r"(?:cluster|群集|群)\s*_?\s*(\d+)", re.IGNORECASE),
+}
+
+# 英數字以單字切分，中日韓文字以單字元切分
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[一-鿿]")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class ArtifactIndex:
+    """LLM 輸出檔案的本地索引：依檔名解析 Depth / Epoch / Cluster，並以 BM25 排序內容"""
+
+    def __init__(self, root_dir, dirs=None, index_file=None):
+        self.root_dir = os.path.abspath(root_dir)
+        self.dirs = dirs or DEFAULT_DIRS
+        self.index_file = index_file or os.path.join(self.root_dir, INDEX_FILE)
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def save(self):
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def refresh(self):
+        """只重新讀取新增或 mtime / size 改變的檔案，並移除已刪除的檔案"""
+        seen = set()
+        changed = False
+        for directory in self.dirs:
+            full_dir = os.path.join(self.root_dir, directory)
+            if not os.path.isdir(full_dir):
+                continue
+            for entry in os.scandir(full_dir):
+                if not entry.is_file() or not entry.name.endswith(".txt"):
+                    continue
+                rel_path = os.path.relpath(entry.path, self.root_dir)
+                seen.add(rel_path)
+                stat = entry.stat()
+                cached = self.entries.get(rel_path)
+                if cached and cached["mtime"] == stat.st_mtime and cached["size"] == stat.st_size:
+                    continue
+                self.entries[rel_path] = self.build_entry(entry.path, directory, stat)
+                changed = True
+
+        for rel_path in list(self.entries):
+            if rel_path not in seen:
+                del self.entries[rel_path]
+                changed = True
+
+        if changed:
+            self.save()
+        return changed
+
+    def build_entry(self, path, directory, stat):
+        with open(path, "r", encoding="utf-8") as f:
+            tokens = tokenize(f.read())
+        depth, epoch, cluster = artifact_keys(path)
+        return {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "kind": directory,
+            "depth": depth,
+            "epoch": epoch,
+            "cluster": cluster,
+            "length": len(tokens),
+            "tf": dict(Counter(tokens)),
+        }
+
+    @staticmethod
+    def parse_query(query):
+        """取出查詢中的 Depth / Epoch / Cluster 條件，以及剩餘的關鍵字"""
+        filters = {}
+        remaining = query
+        for key, pattern in QUERY_PATTERNS.items():
+            match = pattern.search(remaining)
+            if match:
+                filters[key] = int(match.group(1))
+                remaining = remaining[:match.start()] + " " + remaining[match.end():]
+        return filters, tokenize(remaining)
+
+    def matches(self, entry, filters):
+        return all(entry.get(key) == value for key, value in filters.items())
+
+    def bm25_scores(self, candidates, terms):
+        """以整個索引的統計量計算候選檔案的 BM25 分數"""
+        total = len(self.entries)
+        avg_length = sum(entry["length"] for entry in self.entries.values()) / total if total else 0
+        scores = {}
+        for term in set(terms):
+            df = sum(1 for entry in self.entries.values() if term in entry["tf"])
+            if not df:
+                continue
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for rel_path in candidates:
+                entry = self.entries[rel_path]
+                tf = entry["tf"].get(term, 0)
+                if not tf:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * entry["length"] / (avg_length or 1))
+                scores[rel_path] = scores.get(rel_path, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=10):
+        """回傳符合查詢的檔案相對路徑：有 Depth / Epoch / Cluster 條件時回傳所有符合的檔案，否則取 BM25 前 top_k 名"""
+        self.refresh()
+        filters, terms = self.parse_query(query)
+        candidates = [rel_path for rel_path, entry in self.entries.items() if self.matches(entry, filters)]
+
+        if filters:
+            # 條件明確時全部回傳，依 Depth / Epoch / Cluster 的數值排序
+            def numeric_key(rel_path):
+                entry = self.entries[rel_path]
+                return tuple(-1 if entry[key] is None else entry[key] for key in ("depth", "epoch", "cluster"))
+            return sorted(candidates, key=numeric_key)
+
+        scores = self.bm25_scores(candidates, terms)
+        ranked = sorted(scores, key=lambda rel_path: -scores[rel_path])
+        return ranked[:top_k]
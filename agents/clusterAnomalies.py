@@ -0,0 +1,176 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from schema import parse_timestamp, read_header, read_table, value_as_float
+from manifest import Manifest, write_text_artifact
+from selection import ALL
+from workspace import artifact_keys
+from agents.evidence import anomalies_filename
+
+# Value 的 robust z-score 門檻（Iglewicz & Hoaglin 建議 3.5）
+ROBUST_Z = 3.5
+# 時間突增：同一個時間窗內的筆數至少 BURST_MIN_ROWS，且為該 cluster 每個有交易的時間窗中位數的 BURST_FACTOR 倍
+BURST_WINDOW_SECONDS = 3600
+BURST_MIN_ROWS = 5
+BURST_FACTOR = 5
+# 單一 From / To 佔 cluster 交易的比例達此門檻視為過度集中（cluster 至少 DOMINANT_MIN_ROWS 筆）
+DOMINANT_SHARE = 0.5
+DOMINANT_MIN_ROWS = 10
+# 在整份資料中佔比低於此門檻的 TokenSymbol 視為罕見
+RARE_SHARE = 0.01
+# 每個 cluster 保留的異常數與離群交易範例數
+MAX_ANOMALIES = 8
+EXAMPLES = 3
+
+
+def shared_features(df):
+    """所有 Cluster 欄位共用的特徵只計算一次：log Value、時間窗編號、From / To / TokenSymbol 編碼與整體佔比"""
+    token_codes, tokens = pd.factorize(df["TokenSymbol"], use_na_sentinel=False)
+    features = {
+        "hash": df["Hash"].to_numpy(),
+        "value": df["Value"].to_numpy(),
+        "log_value": np.log10(1 + np.clip(value_as_float(df["Value"]).to_numpy(), 0, None)),
+        "window": ((parse_timestamp(df["TimeStamp"]) - pd.Timestamp(0)).dt.total_seconds() // BURST_WINDOW_SECONDS).to_numpy(),
+        "token": token_codes,
+    }
+    names = {"token": np.asarray(tokens, dtype=object)}
+    global_share = {"token": np.bincount(token_codes) / len(df)}
+    for col in ["From", "To"]:
+        codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        features[col] = codes
+        names[col] = np.asarray(uniques, dtype=object)
+        global_share[col] = np.bincount(codes) / len(df)
+    return pd.DataFrame(features), names, global_share
+
+
+def value_outliers(frame):
+    """各 cluster 內 log Value 的 robust z-score（以中位數與 MAD 計算，不受極端值影響）"""
+    median = frame.groupby("cluster")["log_value"].transform("median")
+    deviation = frame["log_value"] - median
+    mad = deviation.abs().groupby(frame["cluster"]).transform("median")
+    z = (0.6745 * deviation / mad.where(mad > 0)).fillna(0.0)
+    outliers = frame.assign(z=z)[z.abs() > ROBUST_Z]
+    counts = outliers.groupby("cluster").size()
+    examples = outliers.reindex(outliers["z"].abs().sort_values(ascending=False).index).groupby("cluster").head(EXAMPLES)
+
+    anomalies = {}
+    for cluster, count in counts.items():
+        rows = examples[examples["cluster"] == cluster]
+        anomalies.setdefault(cluster, []).append({
+            "type": "value_outliers",
+            "rows": int(count),
+            "threshold": ROBUST_Z,
+            "examples": [{"hash": h, "value": v, "z": round(float(score), 2)}
+                         for h, v, score in zip(rows["hash"], rows["value"], rows["z"])],
+            "severity": round(float(rows["z"].abs().max()) / ROBUST_Z, 2),
+        })
+    return anomalies
+
+
+def bursts(frame):
+    """各 cluster 在單一時間窗內交易量突增的區段"""
+    counts = frame.groupby(["cluster", "window"]).size()
+    median = counts.groupby(level="cluster").transform("median")
+    hits = counts[(counts >= BURST_MIN_ROWS) & (counts >= BURST_FACTOR * median)]
+    factor = (hits / median[hits.index]).sort_values(ascending=False)
+
+    anomalies = {}
+    for (cluster, window), ratio in factor.groupby(level="cluster").head(EXAMPLES).items():
+        anomalies.setdefault(cluster, []).append({
+            "type": "burst",
+            "start": pd.Timestamp(window * BURST_WINDOW_SECONDS, unit="s").isoformat(),
+            "window_seconds": BURST_WINDOW_SECONDS,
+            "rows": int(counts[(cluster, window)]),
+            "median_rows": float(median[(cluster, window)]),
+            "severity": round(float(ratio) / BURST_FACTOR, 2),
+        })
+    return anomalies
+
+
+def dominant_participants(frame, sizes, names, global_share):
+    """各 cluster 中佔比最高的 From / To，佔比達 DOMINANT_SHARE 時列出"""
+    anomalies = {}
+    for col, kind in [("From", "dominant_from"), ("To", "dominant_to")]:
+        counts = frame.groupby(["cluster", col]).size()
+        share = counts / sizes.reindex(counts.index.get_level_values("cluster")).to_numpy()
+        top = share.groupby(level="cluster").idxmax()
+        for cluster, (_, code) in top.items():
+            if sizes[cluster] < DOMINANT_MIN_ROWS or share[(cluster, code)] < DOMINANT_SHARE:
+                continue
+            anomalies.setdefault(cluster, []).append({
+                "type": kind,
+                "address": str(names[col][code]),
+                "share": round(float(share[(cluster, code)]), 4),
+                "global_share": round(float(global_share[col][code]), 4),
+                "severity": round(float(share[(cluster, code)]) / DOMINANT_SHARE, 2),
+            })
+    return anomalies
+
+
+def rare_tokens(frame, names, global_share):
+    """各 cluster 中出現的罕見 TokenSymbol（以整份資料的佔比判斷）"""
+    rare = frame[global_share["token"][frame["token"].to_numpy()] < RARE_SHARE]
+    counts = rare.groupby(["cluster", "token"]).size()
+
+    anomalies = {}
+    for (cluster, code), count in counts.items():
+        anomalies.setdefault(cluster, []).append({
+            "type": "rare_token",
+            "token": str(names["token"][code]),
+            "rows": int(count),
+            "global_share": round(float(global_share["token"][code]), 5),
+            "severity": round(RARE_SHARE / max(float(global_share["token"][code]), 1e-9), 2),
+        })
+    return anomalies
+
+
+def column_anomalies(labels, features, names, global_share, selection=ALL):
+    """單一 Cluster_Depth_i_Epoch_j 欄位：各 cluster 依嚴重程度排序的異常清單"""
+    valid = labels.notna().to_numpy()
+    frame = features[valid].assign(cluster=labels[valid].astype(int).to_numpy())
+    sizes = frame.groupby("cluster").size()
+    if sizes.empty:
+        return None
+
+    found = {}
+    for anomalies in (value_outliers(frame), bursts(frame), dominant_participants(frame, sizes, names, global_share),
+                      rare_tokens(frame, names, global_share)):
+        for cluster, items in anomalies.items():
+            found.setdefault(int(cluster), []).extend(items)
+
+    clusters = {}
+    for cluster, size in sizes.items():
+        if not selection.match_cluster(int(cluster), int(size)):
+            continue
+        items = sorted(found.get(int(cluster), []), key=lambda item: -item["severity"])
+        clusters[str(cluster)] = {"rows": int(size), "anomalies": items[:MAX_ANOMALIES]}
+    return clusters
+
+
+def compute_cluster_anomalies(input_file="data_encoded.csv", output_dir="clusterAnomalies", selection=ALL):
+    """對所有 Cluster_Depth_i_Epoch_j 欄位一次找出各 cluster 的異常，存成 anomalies_Depth_i_Epoch_j.json"""
+    os.makedirs(output_dir, exist_ok=True)
+    header = read_header(input_file)
+    df = read_table(input_file, usecols=selection.usecols(header))
+    features, names, global_share = shared_features(df)
+
+    manifest = Manifest(output_dir)
+    outputs = []
+    for column in selection.cluster_columns(df.columns):
+        depth, epoch, _ = artifact_keys(column)
+        clusters = column_anomalies(df[column], features, names, global_share, selection)
+        if clusters is None:
+            continue
+        output_filename = os.path.join(output_dir, anomalies_filename(depth, epoch))
+        result = {"depth": depth, "epoch": epoch, "column": column, "clusters": clusters}
+        write_text_artifact(manifest, output_filename, json.dumps(result, ensure_ascii=False, indent=2),
+                            depth=depth, epoch=epoch)
+        print(f"Saved anomalies: {output_filename}")
+        outputs.append(output_filename)
+    manifest.save()
+    return outputs
+
+
+if __name__ == "__main__":
+    compute_cluster_anomalies()
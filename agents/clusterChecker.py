@@ -1,7 +1,12 @@
 import os
-import glob
-from llm import get_llm_response  # 使用 LLM 來分析
+import re
+from manifest import Manifest, discover, write_alias_artifact, write_text_artifact
+from workspace import artifact_keys
+from selection import ALL
+from llm import get_llm_response, limits_from_format  # 使用 LLM 來分析
+from agents.evidence import load_metrics, format_evidence
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # 系統提示詞
 SYSTEM_PROMPT = """
@@ -39,42 +44,120 @@ You are part of an experimental pipeline analyzing blockchain transaction cluste
    - Any unexpected similarities or anomalies detected between clusters.
 """
 
-def analyze_clusters(input_dir="clusterSummary", output_dir="clusterAnalysis"):
-    """分析同 Depth、同 Epoch 下的 Clusters 並產生比較結果"""
+# 比較所有 Clusters 需要較長的回應
+LIMITS = limits_from_format(SYSTEM_PROMPT, max_tokens=1200)
+
+def build_prompt(depth, epoch, summaries, evidence=None):
+    """組合單一 (Depth, Epoch) 的比較 prompt（planner 也以此估算 token 數）"""
+    combined_prompt = f"{SYSTEM_PROMPT}\n\n"
+    if evidence:
+        # 數值指標比摘要文字更精確，請 LLM 以此作為分群依據的佐證
+        combined_prompt += f"📐 **Depth {depth}, Epoch {epoch} - 數值指標（請以此佐證 Justification for Clustering）：**\n{evidence}\n\n"
+    combined_prompt += f"🔍 **Depth {depth}, Epoch {epoch} - 所有 Clusters 的摘要：**\n\n"
+    combined_prompt += "\n".join(summaries)  # 將所有該組合內的 Clusters 內容合併
+    return combined_prompt
+
+def analyze_group(depth, epoch, summaries, output_dir="clusterAnalysis", evidence=None, manifest=None, clusters=None):
+    """讓 LLM 比較單一 (Depth, Epoch) 組合內所有 Clusters 的摘要，evidence 為 clusterMetrics 計算出的數值指標，
+    clusters 為這些摘要的 cluster 編號"""
+    combined_prompt = build_prompt(depth, epoch, summaries, evidence)
+
+    # 讓 LLM 產生比較分析
+    output_filename = os.path.join(output_dir, f"analysis_Depth_{depth}_Epoch_{epoch}.txt")
+    response = get_llm_response(combined_prompt, stage="cluster-comparison", artifact=os.path.basename(output_filename),
+                                limits=LIMITS)
+
+    # 儲存比較結果（單獨呼叫時自行更新 manifest）；記錄比較了哪些 clusters，之後沿用時據此改寫 cluster 編號
+    save_manifest = manifest is None
+    manifest = manifest or Manifest(output_dir)
+    write_text_artifact(manifest, output_filename, response, depth=depth, epoch=epoch, clusters=clusters)
+    if save_manifest:
+        manifest.save()
+
+    print(f"Saved analysis: {output_filename}")
+    return output_filename
+
+def relabel_clusters(text, mapping):
+    """將分析中的 Cluster 編號依 mapping（原 Epoch 的 cluster -> 此 Epoch 的 cluster）一次全部改寫"""
+    return re.sub(r"\b(Cluster[ _])(\d+)\b", lambda m: f"{m.group(1)}{mapping.get(int(m.group(2)), m.group(2))}", text)
+
+def analyze_clusters(input_dir="clusterSummary", output_dir="clusterAnalysis", max_workers=1, selection=ALL, metrics_dir=None):
+    """分析同 Depth、同 Epoch 下的 Clusters 並產生比較結果（metrics_dir 有指標時一併提供給 LLM）"""
     os.makedirs(output_dir, exist_ok=True)  # 確保輸出目錄存在
 
-    # 讀取所有 `summary_Depth_i_Epoch_j_Cluster_k.txt` 檔案
-    summary_files = glob.glob(os.path.join(input_dir, "summary_Depth_*_Epoch_*_Cluster_*.txt"))
+    # 從 manifest 取得所有 `summary_Depth_i_Epoch_j_Cluster_k.txt` 檔案（已依數值排序）
+    entries = discover(input_dir, "summary_Depth_*_Epoch_*_Cluster_*.txt", selection)
 
-    # 根據 Depth & Epoch 分組
+    # 根據 Depth & Epoch 分組；記錄每組摘要沿用的來源 Epoch，全部沿用同一個 Epoch 代表分群相同，
+    # 並記錄原 Epoch 的 cluster 對應到此 Epoch 的哪個 cluster（分群相同但標籤可能不同）
     grouped_summaries = defaultdict(list)
-
-    for file in summary_files:
-        filename = os.path.basename(file)
-        parts = filename.split("_")
-        depth, epoch, cluster = parts[2], parts[4], parts[6].split(".")[0]
+    grouped_clusters = defaultdict(list)
+    alias_sources = defaultdict(set)
+    relabeling = defaultdict(dict)
+
+    for entry in entries:
+        depth, epoch, cluster = entry["depth"], entry["epoch"], entry["cluster"]
+        grouped_clusters[(depth, epoch)].append(cluster)
+        if entry.get("reused_from"):
+            _, source, source_cluster = artifact_keys(entry["reused_from"])
+            alias_sources[(depth, epoch)].add(source)
+            relabeling[(depth, epoch)][source_cluster] = cluster
+        else:
+            alias_sources[(depth, epoch)].add(None)
 
         # 讀取摘要內容
-        with open(file, "r", encoding="utf-8") as f:
+        with open(entry["full_path"], "r", encoding="utf-8") as f:
             content = f.read()
 
         grouped_summaries[(depth, epoch)].append(f"📌 **Cluster {cluster} Summary:**\n{content}\n")
 
     # 遍歷所有 (Depth, Epoch) 組合，讓 LLM 進行比較
-    for (depth, epoch), summaries in grouped_summaries.items():
-        combined_prompt = f"{SYSTEM_PROMPT}\n\n"
-        combined_prompt += f"🔍 **Depth {depth}, Epoch {epoch} - 所有 Clusters 的摘要：**\n\n"
-        combined_prompt += "\n".join(summaries)  # 將所有該組合內的 Clusters 內容合併
-
-        # 讓 LLM 產生比較分析
-        response = get_llm_response(combined_prompt)
-
-        # 儲存比較結果
+    def evidence(depth, epoch):
+        metrics = load_metrics(metrics_dir, depth, epoch)
+        return format_evidence(metrics) if metrics else None
+
+    def source_epoch(depth, epoch):
+        sources = alias_sources[(depth, epoch)]
+        return next(iter(sources)) if len(sources) == 1 and None not in sources else None
+
+    groups = [(depth, epoch) for depth, epoch in grouped_summaries if source_epoch(depth, epoch) is None]
+    reused = [(depth, epoch) for depth, epoch in grouped_summaries if source_epoch(depth, epoch) is not None]
+
+    manifest = Manifest(output_dir)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(analyze_group, depth, epoch, grouped_summaries[(depth, epoch)], output_dir,
+                               evidence(depth, epoch), manifest, grouped_clusters[(depth, epoch)])
+                   for depth, epoch in groups]
+        for future in futures:
+            future.result()
+
+    # 分群與先前 Epoch 相同時直接沿用其分析，標籤不同時改寫其中的 cluster 編號；
+    # 找不到原分析（例如原 Epoch 未被選取），或原分析比較的 clusters 與此 Epoch 對應不上時才呼叫 LLM
+    for depth, epoch in reused:
+        source = source_epoch(depth, epoch)
+        mapping = relabeling[(depth, epoch)]
+        source_name = f"analysis_Depth_{depth}_Epoch_{source}.txt"
+        source_entry = manifest.lookup(os.path.join(output_dir, source_name))
+        if not os.path.exists(os.path.join(output_dir, source_name)) or source_entry is None \
+                or sorted(source_entry.get("clusters") or []) != sorted(mapping):
+            analyze_group(depth, epoch, grouped_summaries[(depth, epoch)], output_dir, evidence(depth, epoch), manifest,
+                          grouped_clusters[(depth, epoch)])
+            continue
         output_filename = os.path.join(output_dir, f"analysis_Depth_{depth}_Epoch_{epoch}.txt")
-        with open(output_filename, "w", encoding="utf-8") as f:
-            f.write(response)
-
-        print(f"Saved analysis: {output_filename}")
+        if all(source_cluster == cluster for source_cluster, cluster in mapping.items()):
+            note = (f"> Depth {depth}, Epoch {epoch} has the same partition and cluster labels as Epoch {source}; "
+                    f"the analysis below is reused from {source_name}.")
+            rewrite = None
+        else:
+            renamed = ", ".join(f"Cluster {source_cluster} → Cluster {cluster}"
+                                for source_cluster, cluster in sorted(mapping.items()) if source_cluster != cluster)
+            note = (f"> Depth {depth}, Epoch {epoch} has the same partition as Epoch {source} with different cluster labels; "
+                    f"the analysis below is reused from {source_name} with cluster IDs rewritten ({renamed}).")
+            rewrite = lambda text, mapping=mapping: relabel_clusters(text, mapping)
+        write_alias_artifact(manifest, output_filename, os.path.join(output_dir, source_name), note, rewrite=rewrite,
+                             depth=depth, epoch=epoch, clusters=grouped_clusters[(depth, epoch)])
+        print(f"♻ Reused analysis: {output_filename}")
+    manifest.save()
 
 if __name__ == "__main__":
     analyze_clusters()
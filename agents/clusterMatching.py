@@ -0,0 +1,115 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from schema import read_header, read_table
+from manifest import Manifest, write_text_artifact
+from selection import ALL
+from workspace import artifact_keys
+from agents.evidence import DEPTH_MATCHING_FILE, matching_filename
+
+# 判斷 cluster 延續 / 分裂 / 合併的門檻
+STABLE_JACCARD = 0.5
+SPLIT_SHARE = 0.2
+
+
+def contingency(source, target):
+    """兩組分群標籤（已依 Hash 去重）的列聯表：交集筆數、各自 cluster ID 與大小"""
+    source_ids, source_labels = np.unique(source[~pd.isna(source)].astype(int), return_inverse=True)
+    target_ids, target_labels = np.unique(target[~pd.isna(target)].astype(int), return_inverse=True)
+    source_sizes = np.bincount(source_labels, minlength=len(source_ids))
+    target_sizes = np.bincount(target_labels, minlength=len(target_ids))
+
+    # 只有兩邊都有標籤的交易才算交集
+    both = ~pd.isna(source) & ~pd.isna(target)
+    rows = np.searchsorted(source_ids, source[both].astype(int))
+    cols = np.searchsorted(target_ids, target[both].astype(int))
+    overlap = np.zeros((len(source_ids), len(target_ids)), dtype=np.int64)
+    np.add.at(overlap, (rows, cols), 1)
+    return overlap, source_ids, target_ids, source_sizes, target_sizes
+
+
+def match_partitions(source, target, source_name, target_name):
+    """以 Jaccard 對齊兩組分群，回傳轉移矩陣與 stable / split / merged / new / dissolved 事件"""
+    overlap, source_ids, target_ids, source_sizes, target_sizes = contingency(source, target)
+    union = source_sizes[:, None] + target_sizes[None, :] - overlap
+    jaccard = np.where(union > 0, overlap / np.maximum(union, 1), 0.0)
+    # 轉移矩陣：來源 cluster 的成員流向各目標 cluster 的比例
+    transition = overlap / np.maximum(source_sizes[:, None], 1)
+    received = overlap / np.maximum(target_sizes[None, :], 1)
+
+    events = []
+    for i, cluster in enumerate(source_ids):
+        best = int(jaccard[i].argmax()) if len(target_ids) else None
+        targets = target_ids[transition[i] >= SPLIT_SHARE]
+        if best is not None and jaccard[i, best] >= STABLE_JACCARD:
+            events.append({"type": "stable", "source": [int(cluster)], "target": [int(target_ids[best])],
+                           "jaccard": round(float(jaccard[i, best]), 3)})
+        elif len(targets) >= 2:
+            events.append({"type": "split", "source": [int(cluster)], "target": [int(t) for t in targets],
+                           "shares": [round(float(s), 3) for s in transition[i][transition[i] >= SPLIT_SHARE]]})
+        elif len(targets) == 0:
+            events.append({"type": "dissolved", "source": [int(cluster)], "target": []})
+    for j, cluster in enumerate(target_ids):
+        sources = source_ids[received[:, j] >= SPLIT_SHARE]
+        if len(sources) >= 2:
+            events.append({"type": "merged", "source": [int(s) for s in sources], "target": [int(cluster)],
+                           "shares": [round(float(s), 3) for s in received[:, j][received[:, j] >= SPLIT_SHARE]]})
+        elif len(sources) == 0:
+            events.append({"type": "new", "source": [], "target": [int(cluster)]})
+
+    return {
+        "source": source_name,
+        "target": target_name,
+        "source_clusters": [int(c) for c in source_ids],
+        "target_clusters": [int(c) for c in target_ids],
+        "transition": np.round(transition, 3).tolist(),
+        "jaccard": np.round(jaccard, 3).tolist(),
+        "events": events,
+    }
+
+
+def compute_cluster_matching(input_file="data_encoded.csv", output_dir="clusterMatching", selection=ALL):
+    """對齊相鄰 Epoch（同 Depth）與相鄰 Depth（各取最後一個 Epoch）的 clusters，存成 matching_Depth_i.json 與 matching_depths.json"""
+    os.makedirs(output_dir, exist_ok=True)
+    header = read_header(input_file)
+    columns = selection.cluster_columns(header)
+    # 只需要 Hash 與分群欄位；同一筆交易可能出現多次，以 Hash 去重後才是成員集合
+    df = read_table(input_file, usecols=["Hash"] + columns).drop_duplicates(subset="Hash")
+
+    epochs_by_depth = defaultdict(list)
+    for column in columns:
+        depth, epoch, _ = artifact_keys(column)
+        epochs_by_depth[depth].append(epoch)
+
+    def labels(depth, epoch):
+        return df[f"Cluster_Depth_{depth}_Epoch_{epoch}"].to_numpy(dtype=float, na_value=np.nan)
+
+    manifest = Manifest(output_dir)
+    outputs = []
+    for depth, epochs in sorted(epochs_by_depth.items()):
+        epochs.sort()
+        transitions = [match_partitions(labels(depth, a), labels(depth, b), f"Epoch {a}", f"Epoch {b}")
+                       for a, b in zip(epochs, epochs[1:])]
+        output_filename = os.path.join(output_dir, matching_filename(depth))
+        result = {"depth": depth, "epochs": epochs, "transitions": transitions}
+        write_text_artifact(manifest, output_filename, json.dumps(result, ensure_ascii=False, indent=2), depth=depth)
+        print(f"Saved matching: {output_filename}")
+        outputs.append(output_filename)
+
+    depths = sorted(epochs_by_depth)
+    transitions = [match_partitions(labels(a, epochs_by_depth[a][-1]), labels(b, epochs_by_depth[b][-1]),
+                                    f"Depth {a} (Epoch {epochs_by_depth[a][-1]})", f"Depth {b} (Epoch {epochs_by_depth[b][-1]})")
+                   for a, b in zip(depths, depths[1:])]
+    output_filename = os.path.join(output_dir, DEPTH_MATCHING_FILE)
+    result = {"depths": depths, "transitions": transitions}
+    write_text_artifact(manifest, output_filename, json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Saved matching: {output_filename}")
+    outputs.append(output_filename)
+    manifest.save()
+    return outputs
+
+
+if __name__ == "__main__":
+    compute_cluster_matching()
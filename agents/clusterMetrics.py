@@ -0,0 +1,176 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from schema import parse_timestamp, read_header, read_table, value_as_float
+from manifest import Manifest, write_text_artifact
+from selection import ALL
+from workspace import artifact_keys
+from agents.evidence import metrics_filename
+
+# 用來衡量 cluster 分離程度的數值特徵（Value 取 log 以免極端值主導距離）
+NUMERIC_FEATURES = ["BlockNumber", "TimeStamp", "Value"]
+SILHOUETTE_SAMPLE = 2000
+VALUE_BINS = 20
+TOP_PAIRS = 5
+
+
+def numeric_matrix(df):
+    """將數值特徵轉成標準化後的矩陣（缺值以中位數補齊），回傳 (矩陣, 特徵名稱)"""
+    columns, names = [], []
+    for col in NUMERIC_FEATURES:
+        if col not in df.columns:
+            continue
+        if col == "TimeStamp":
+            values = (parse_timestamp(df[col]) - pd.Timestamp(0)).dt.total_seconds().to_numpy(dtype=float)
+        else:
+            values = value_as_float(df[col]).to_numpy()
+        if col == "Value":
+            values = np.log10(1 + np.clip(values, 0, None))
+        median = np.nanmedian(values) if np.isfinite(values).any() else 0.0
+        values = np.where(np.isfinite(values), values, median)
+        std = values.std()
+        columns.append((values - values.mean()) / std if std else np.zeros_like(values))
+        names.append(col)
+    return (np.column_stack(columns) if columns else np.zeros((len(df), 0))), names
+
+
+def js_divergence(counts):
+    """每一列為一個 cluster 的分布計數，回傳兩兩之間的 Jensen-Shannon divergence（以 2 為底，介於 0~1）"""
+    totals = counts.sum(axis=1, keepdims=True)
+    p = counts / np.where(totals == 0, 1, totals)
+
+    def kl(a, b):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = np.where(a > 0, a * np.log2(a / np.where(b > 0, b, 1)), 0.0)
+        return terms.sum(axis=-1)
+
+    # 逐列計算（一次只有 k x n 的中間陣列），避免 cluster 多、類別多時展開成 k x k x n
+    divergence = np.zeros((len(p), len(p)))
+    for i, row in enumerate(p):
+        m = (row + p) / 2
+        divergence[i] = (kl(row, m) + kl(p, m)) / 2
+    return divergence
+
+
+def sampled_silhouette(features, labels, n_clusters, sample_size=SILHOUETTE_SAMPLE, seed=0):
+    """在抽樣的資料點上計算 silhouette，回傳 (整體平均, 各 cluster 平均)"""
+    rng = np.random.default_rng(seed)
+    if len(labels) > sample_size:
+        idx = rng.choice(len(labels), sample_size, replace=False)
+        features, labels = features[idx], labels[idx]
+
+    squared = (features ** 2).sum(axis=1)
+    distances = np.sqrt(np.maximum(squared[:, None] + squared[None, :] - 2 * features @ features.T, 0))
+    one_hot = np.eye(n_clusters)[labels]
+    counts = one_hot.sum(axis=0)
+    sums = distances @ one_hot
+
+    own = labels
+    own_counts = counts[own]
+    a = np.where(own_counts > 1, sums[np.arange(len(own)), own] / np.maximum(own_counts - 1, 1), 0.0)
+    others = np.where(counts > 0, sums / np.where(counts > 0, counts, 1), np.inf)
+    others[np.arange(len(own)), own] = np.inf
+    b = others.min(axis=1)
+    denominator = np.maximum(a, b)
+    scores = np.where((own_counts > 1) & np.isfinite(b) & (denominator > 0), (b - a) / np.where(denominator > 0, denominator, 1), 0.0)
+
+    per_cluster = np.bincount(own, weights=scores, minlength=n_clusters) / np.maximum(counts, 1)
+    return float(scores.mean()) if len(scores) else 0.0, per_cluster
+
+
+def top_pairs(cluster_ids, matrix, n=TOP_PAIRS, largest=True):
+    """取出矩陣中最大（或最小）的 n 組 cluster 配對"""
+    rows, cols = np.triu_indices(len(cluster_ids), k=1)
+    values = matrix[rows, cols]
+    order = np.argsort(-values if largest else values)[:n]
+    return [{"clusters": [int(cluster_ids[rows[i]]), int(cluster_ids[cols[i]])], "value": round(float(values[i]), 4)}
+            for i in order]
+
+
+def column_metrics(df, column, features, feature_names, token_codes, n_tokens, value_bins, selection=ALL):
+    """計算單一 Cluster_Depth_i_Epoch_j 欄位的所有指標"""
+    labels_raw = df[column].to_numpy(dtype=float, na_value=np.nan)
+    valid = ~pd.isna(labels_raw)
+    cluster_ids, labels = np.unique(labels_raw[valid].astype(int), return_inverse=True)
+    sizes = np.bincount(labels, minlength=len(cluster_ids))
+    if len(cluster_ids) == 0:
+        return None
+
+    keep = np.array([selection.match_cluster(int(c), int(s)) for c, s in zip(cluster_ids, sizes)])
+    x = features[valid]
+    k = len(cluster_ids)
+
+    # 各 cluster 的中心點與中心點間的歐氏距離
+    centroids = np.zeros((k, x.shape[1]))
+    np.add.at(centroids, labels, x)
+    centroids /= sizes[:, None]
+    centroid_distances = np.sqrt(((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=-1))
+
+    # TokenSymbol 與 Value 分布的列聯表（cluster x 類別）
+    token_counts = np.zeros((k, n_tokens))
+    np.add.at(token_counts, (labels, token_codes[valid]), 1)
+    value_counts = np.zeros((k, VALUE_BINS))
+    np.add.at(value_counts, (labels, value_bins[valid]), 1)
+    token_js = js_divergence(token_counts)
+    value_js = js_divergence(value_counts)
+
+    nearest = np.where(np.eye(k, dtype=bool), np.inf, centroid_distances).argmin(axis=1)
+    silhouette, per_cluster_silhouette = (sampled_silhouette(x, labels, k) if k > 1 and x.shape[1]
+                                          else (0.0, np.zeros(k)))
+
+    clusters = []
+    for i in np.flatnonzero(keep):
+        clusters.append({
+            "cluster": int(cluster_ids[i]),
+            "size": int(sizes[i]),
+            "share": round(float(sizes[i] / sizes.sum()), 4),
+            "centroid": {name: round(float(v), 3) for name, v in zip(feature_names, centroids[i])},
+            "silhouette": round(float(per_cluster_silhouette[i]), 4),
+            "nearest_cluster": int(cluster_ids[nearest[i]]) if k > 1 else None,
+        })
+
+    return {
+        "column": column,
+        "rows": int(valid.sum()),
+        "n_clusters": int(k),
+        "silhouette": round(silhouette, 4),
+        "clusters": clusters,
+        "closest_centroids": top_pairs(cluster_ids, centroid_distances, largest=False),
+        "token_divergence": top_pairs(cluster_ids, token_js),
+        "value_divergence": top_pairs(cluster_ids, value_js),
+    }
+
+
+def compute_cluster_metrics(input_file="data_encoded.csv", output_dir="clusterMetrics", selection=ALL):
+    """從完整資料與所有 Cluster_Depth_i_Epoch_j 欄位計算各 cluster 的數值指標，並存成 metrics_Depth_i_Epoch_j.json"""
+    os.makedirs(output_dir, exist_ok=True)
+    header = read_header(input_file)
+    df = read_table(input_file, usecols=selection.usecols(header))
+
+    # 所有欄位共用的特徵矩陣與類別編碼只計算一次
+    features, feature_names = numeric_matrix(df)
+    token_codes, tokens = pd.factorize(df["TokenSymbol"], use_na_sentinel=False)
+    log_value = np.log10(1 + np.clip(value_as_float(df["Value"]).fillna(0).to_numpy(), 0, None))
+    edges = np.histogram_bin_edges(log_value, bins=VALUE_BINS)
+    value_bins = np.clip(np.digitize(log_value, edges[1:-1]), 0, VALUE_BINS - 1)
+
+    manifest = Manifest(output_dir)
+    outputs = []
+    for column in selection.cluster_columns(df.columns):
+        depth, epoch, _ = artifact_keys(column)
+        metrics = column_metrics(df, column, features, feature_names, token_codes, len(tokens), value_bins, selection)
+        if metrics is None:
+            continue
+        metrics.update({"depth": depth, "epoch": epoch})
+        output_filename = os.path.join(output_dir, metrics_filename(depth, epoch))
+        write_text_artifact(manifest, output_filename, json.dumps(metrics, ensure_ascii=False, indent=2),
+                            depth=depth, epoch=epoch)
+        print(f"Saved metrics: {output_filename}")
+        outputs.append(output_filename)
+    manifest.save()
+    return outputs
+
+
+if __name__ == "__main__":
+    compute_cluster_metrics()
@@ -1,7 +1,11 @@
-import pandas as pd
 import os
-import glob
-from llm import get_llm_response  # 引入 llm.py 的函數
+from concurrent.futures import ThreadPoolExecutor
+from manifest import Manifest, discover, write_alias_artifact, write_text_artifact
+from schema import read_table
+from workspace import artifact_keys
+from selection import ALL
+from llm import get_llm_response, limits_from_format  # 引入 llm.py 的函數
+from agents.evidence import format_anomalies, load_anomalies
 
 # 系統提示詞
 # 系統提示詞
@@ -34,34 +38,88 @@ You are part of an experimental pipeline analyzing blockchain transaction cluste
    - Any other patterns or anomalies detected in this cluster.
 """
 
+# 輸出長度上限與必要段落（由上面的輸出格式推導）；摘要只需三個段落，CPU 推論時長度決定大部分的延遲
+LIMITS = limits_from_format(SYSTEM_PROMPT, max_tokens=600)
 
 
-def summarize_clustered_data(input_dir="clustered_csv", output_dir="clusterSummary"):
-    """處理所有 cluster CSV，並產生對應的 LLM 摘要"""
-    os.makedirs(output_dir, exist_ok=True)  # 確保輸出目錄存在
 
-    csv_files = glob.glob(os.path.join(input_dir, "Depth_*_Epoch_*_Cluster_*.csv"))
+def build_prompt(df, anomalies=None):
+    """以 cluster 的前 10 筆資料組成 prompt，anomalies 為 clusterAnomalies 對全部資料算出的異常（planner 也以此估算 token 數）"""
+    csv_content = df.head(10).to_string(index=False)
+    prompt = f"{SYSTEM_PROMPT}\n\n以下是數據樣本：\n{csv_content}\n\n"
+    if anomalies:
+        # 10 筆樣本看不出異常，改由全部資料預先算出，請 LLM 據此撰寫 Additional Observations
+        prompt += f"🚩 **以全部資料計算的異常（依嚴重程度排序，請據此撰寫 Additional Observations）：**\n{format_anomalies(anomalies)}\n\n"
+    return prompt + "請產生摘要："
+
+
+def summarize_cluster_file(file, output_dir="clusterSummary", selection=ALL, manifest=None, anomalies_dir=None, keys=None):
+    """為單一 cluster CSV 產生 LLM 摘要，未達 selection.min_cluster_size 的 cluster 會略過（anomalies_dir 有異常時一併提供給 LLM）；
+    keys 為 (depth, epoch, cluster)，摘要別名 cluster 時檔名是原 cluster 的 CSV，需另外指定"""
+    df = read_table(file, parse_time=True)
+    if len(df) < selection.min_cluster_size:
+        return None
 
-    for file in csv_files:
-        df = pd.read_csv(file)
+    # 取得檔名資訊
+    depth, epoch, cluster = keys or artifact_keys(file)
 
-        # 取得檔名資訊
-        filename = os.path.basename(file)
-        depth, epoch, cluster = filename.split("_")[1], filename.split("_")[3], filename.split("_")[5].split(".")[0]
+    # 轉換 CSV 內容為文字摘要格式（取前 10 筆資料）
+    prompt = build_prompt(df, load_anomalies(anomalies_dir, depth, epoch, cluster))
 
-        # 轉換 CSV 內容為文字摘要格式
-        csv_content = df.head(10).to_string(index=False)  # 取前 10 筆資料
-        prompt = f"{SYSTEM_PROMPT}\n\n以下是數據樣本：\n{csv_content}\n\n請產生摘要："
+    # 調用 LLM
+    output_filename = os.path.join(output_dir, f"summary_Depth_{depth}_Epoch_{epoch}_Cluster_{cluster}.txt")
+    response = get_llm_response(prompt, stage="summary", artifact=os.path.basename(output_filename),
+                                limits=LIMITS)
 
-        # 調用 LLM
-        response = get_llm_response(prompt)
+    # 儲存摘要（單獨呼叫時自行更新 manifest）
+    save_manifest = manifest is None
+    manifest = manifest or Manifest(output_dir)
+    write_text_artifact(manifest, output_filename, response, depth=depth, epoch=epoch, cluster=cluster, rows=len(df))
+    if save_manifest:
+        manifest.save()
 
-        # 儲存摘要
-        output_filename = os.path.join(output_dir, f"summary_Depth_{depth}_Epoch_{epoch}_Cluster_{cluster}.txt")
-        with open(output_filename, "w", encoding="utf-8") as f:
-            f.write(response)
+    print(f"Saved summary: {output_filename}")
+    return output_filename
+
+
+def summarize_clustered_data(input_dir="clustered_csv", output_dir="clusterSummary", max_workers=1, selection=ALL,
+                             anomalies_dir=None):
+    """處理所有 cluster CSV，並產生對應的 LLM 摘要（max_workers 控制同時進行的 LLM 呼叫數）"""
+    os.makedirs(output_dir, exist_ok=True)  # 確保輸出目錄存在
 
-        print(f"Saved summary: {output_filename}")
+    # manifest 已記錄每個 cluster 的筆數，未達 min_cluster_size 的 cluster 不需要讀檔
+    entries = discover(input_dir, "Depth_*_Epoch_*_Cluster_*.csv", selection)
+    manifest = Manifest(output_dir)
+
+    # 與先前 Epoch 相同的 cluster（alias_of）不呼叫 LLM，等原 cluster 的摘要完成後直接沿用
+    originals = [entry for entry in entries if not entry.get("alias_of")]
+    aliases = [entry for entry in entries if entry.get("alias_of")]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(lambda entry: summarize_cluster_file(entry["full_path"], output_dir, selection, manifest,
+                                                            anomalies_dir), originals))
+
+    for entry in aliases:
+        reuse_summary(entry, output_dir, manifest, selection, anomalies_dir)
+    manifest.save()
+
+
+def reuse_summary(entry, output_dir, manifest, selection=ALL, anomalies_dir=None):
+    """將原 cluster 的摘要以別名檔的形式提供給重複的 cluster；找不到原摘要（例如原 Epoch 未被選取）時才呼叫 LLM"""
+    depth, epoch, cluster = entry["depth"], entry["epoch"], entry["cluster"]
+    source_file = os.path.join(output_dir, f"summary_{os.path.splitext(entry['alias_of'])[0]}.txt")
+    if not os.path.exists(source_file):
+        print(f"⚠ No summary found for {entry['alias_of']}, summarizing {entry['path']} directly")
+        # full_path 指向原 cluster 的 CSV，內容與此 cluster 相同
+        return summarize_cluster_file(entry["full_path"], output_dir, selection, manifest, anomalies_dir,
+                                      keys=(depth, epoch, cluster))
+    output_filename = os.path.join(output_dir, f"summary_Depth_{depth}_Epoch_{epoch}_Cluster_{cluster}.txt")
+    note = (f"> Depth {depth}, Epoch {epoch}, Cluster {cluster} contains exactly the same transactions as "
+            f"{entry['alias_of']}; the summary below is reused from {os.path.basename(source_file)}.")
+    write_alias_artifact(manifest, output_filename, source_file, note, depth=depth, epoch=epoch, cluster=cluster,
+                         rows=entry["rows"])
+    print(f"♻ Reused summary: {output_filename}")
+    return output_filename
 
 if __name__ == "__main__":
     summarize_clustered_data()
@@ -1,38 +1,52 @@
-import pandas as pd
 import os
+import hashlib
+import numpy as np
+import pandas as pd
+from manifest import Manifest, write_csv_artifact
+from schema import BASE_COLUMNS, read_header, read_table
+from selection import ALL
+from workspace import artifact_keys
+
+def partition_fingerprint(cluster_series):
+    """與標籤編號無關的分群指紋：依第一次出現的順序重新編號後雜湊，回傳 (指紋, 原標籤 -> 標準編號)"""
+    codes, labels = pd.factorize(cluster_series)
+    digest = hashlib.sha256()
+    digest.update(np.asarray(cluster_series.index, dtype=np.int64).tobytes())
+    digest.update(codes.astype(np.int32).tobytes())
+    return digest.hexdigest(), {str(int(label)): code for code, label in enumerate(labels)}
+
 
-def transfer_data(input_file="kmeans_clustered_results.csv", output_dir="output_csv"):
-    # 讀取 kmeans_clustered_results.csv
-    df = pd.read_csv(input_file)
+def transfer_data(input_file="kmeans_clustered_results.csv", output_dir="output_csv", selection=ALL):
+    """依 Depth / Epoch 拆分資料，selection 可限定只輸出部分 Depth / Epoch / Cluster"""
+    # 讀取 kmeans_clustered_results.csv，只投影被選取的分群欄位
+    header = read_header(input_file)
+    df = read_table(input_file, usecols=selection.usecols(header))
 
     # 確保輸出目錄存在
     os.makedirs(output_dir, exist_ok=True)
 
     # 定義固定欄位
-    base_columns = ["layer", "BlockNumber", "TimeStamp", "Hash", "From", "To", "Value", "TokenName", "TokenSymbol"]
-
-    # 找出所有 Cluster_Depth_i_Epoch_j 欄位
-    cluster_columns = [col for col in df.columns if col.startswith("Cluster_Depth_")]
-
-    # 解析不同的 Depth 和 Epoch
-    depth_epoch_set = set()
-    for col in cluster_columns:
-        parts = col.split("_")
-        depth = parts[2]
-        epoch = parts[4]
-        depth_epoch_set.add((depth, epoch))
-
-    # 依照 Depth 和 Epoch 建立獨立的 CSV
-    for depth, epoch in sorted(depth_epoch_set, key=lambda x: (int(x[0]), int(x[1]))):
-        column_name = f"Cluster_Depth_{depth}_Epoch_{epoch}"
-        
-        if column_name in df.columns:
-            subset_df = df[base_columns + [column_name]].copy()
-            subset_df.rename(columns={column_name: "Cluster_Value"}, inplace=True)
-            
-            output_filename = os.path.join(output_dir, f"Depth_{depth}_Epoch_{epoch}.csv")
-            subset_df.to_csv(output_filename, index=False, encoding="utf-8")
-            print(f"Saved: {output_filename}")
+    base_columns = BASE_COLUMNS
+
+    # 找出所有 Cluster_Depth_i_Epoch_j 欄位，依 Depth、Epoch 數值排序
+    cluster_columns = sorted(selection.cluster_columns(df.columns), key=artifact_keys)
+
+    # 依照 Depth 和 Epoch 建立獨立的 CSV，並登記到 manifest 供下一個階段讀取
+    manifest = Manifest(output_dir)
+    for column_name in cluster_columns:
+        depth, epoch, _ = artifact_keys(column_name)
+        subset_df = df[base_columns + [column_name]].copy()
+        subset_df.rename(columns={column_name: "Cluster_Value"}, inplace=True)
+        if not selection.selects_all:
+            subset_df = subset_df[selection.filter_clusters(subset_df["Cluster_Value"])]
+
+        # 記錄分群指紋，收斂後分群相同（僅標籤不同）的 Epoch 可直接沿用先前的摘要與分析
+        fingerprint, canonical_labels = partition_fingerprint(subset_df["Cluster_Value"])
+        output_filename = os.path.join(output_dir, f"Depth_{depth}_Epoch_{epoch}.csv")
+        write_csv_artifact(manifest, output_filename, subset_df, depth=depth, epoch=epoch,
+                           fingerprint=fingerprint, canonical_labels=canonical_labels)
+        print(f"Saved: {output_filename}")
+    manifest.save()
 
 if __name__ == "__main__":
     transfer_data()
@@ -1,6 +1,7 @@
 import os
-import glob
-from llm import get_llm_response  # 使用 LLM 來分析
+from manifest import Manifest, discover, write_text_artifact
+from llm import get_llm_response, limits_from_format  # 使用 LLM 來分析
+from agents.evidence import load_matching, format_transitions
 
 # 系統提示詞
 SYSTEM_PROMPT = """
@@ -45,20 +46,29 @@ You are part of an experimental pipeline analyzing blockchain transaction cluste
    - Any unexpected relationships or irregularities across depths.
 """
 
-def compare_depths(input_dir="epochSummary", output_dir="depthComparison"):
-    """分析不同 Depths 之間的分群策略差異，並產生總結報告"""
-    os.makedirs(output_dir, exist_ok=True)  # 確保輸出目錄存在
+# 最終報告涵蓋所有 Depth，輸出上限最高
+LIMITS = limits_from_format(SYSTEM_PROMPT, max_tokens=1500)
+
+def build_prompt(depth_summaries, matching=None):
+    """組合 Depth 比較的 prompt，matching 為相鄰 Depth 的對齊結果（planner 也以此估算 token 數）"""
+    combined_prompt = SYSTEM_PROMPT
+    if matching and matching["transitions"]:
+        combined_prompt += f"\n📐 **相鄰 Depth 間的 cluster 對齊（各取最後一個 Epoch）：**\n{format_transitions(matching)}\n\n"
+    combined_prompt += "\n".join(depth_summaries)
+    return combined_prompt
 
-    # 讀取所有 `summary_Depth_i.txt` 檔案
-    summary_files = glob.glob(os.path.join(input_dir, "summary_Depth_*.txt"))
+def compare_depths(input_dir="epochSummary", output_dir="depthComparison", matching_dir=None):
+    """分析不同 Depths 之間的分群策略差異，並產生總結報告（matching_dir 有對齊結果時一併提供給 LLM）"""
+    os.makedirs(output_dir, exist_ok=True)  # 確保輸出目錄存在
 
+    # 從 manifest 取得所有 `summary_Depth_i.txt` 檔案（依 Depth 數值排序，Depth_10 排在 Depth_2 之後）
     depth_summaries = []
 
-    for file in sorted(summary_files):  # 確保 Depth 順序排列
-        depth = os.path.basename(file).split("_")[2].split(".")[0]
+    for entry in discover(input_dir, "summary_Depth_*.txt"):
+        depth = entry["depth"]
 
         # 讀取分析內容
-        with open(file, "r", encoding="utf-8") as f:
+        with open(entry["full_path"], "r", encoding="utf-8") as f:
             content = f.read()
 
         depth_summaries.append(f"📌 **Depth {depth} Summary:**\n{content}\n")
@@ -68,15 +78,17 @@ def compare_depths(input_dir="epochSummary", output_dir="depthComparison"):
         return
 
     # 準備 LLM 輸入
-    combined_prompt = SYSTEM_PROMPT + "\n".join(depth_summaries)
+    combined_prompt = build_prompt(depth_summaries, load_matching(matching_dir))
 
     # 讓 LLM 產生最終比較
-    response = get_llm_response(combined_prompt)
+    response = get_llm_response(combined_prompt, stage="depth-comparison", artifact="final_summary.txt",
+                                limits=LIMITS)
 
     # 儲存最終比較結果
     output_filename = os.path.join(output_dir, "final_summary.txt")
-    with open(output_filename, "w", encoding="utf-8") as f:
-        f.write(response)
+    manifest = Manifest(output_dir)
+    write_text_artifact(manifest, output_filename, response)
+    manifest.save()
 
     print(f"✅ Saved final depth comparison summary: {output_filename}")
 
@@ -1,7 +1,10 @@
 import os
-import glob
-from llm import get_llm_response  # 使用 LLM 來分析
+from manifest import Manifest, discover, write_text_artifact
+from selection import ALL
+from llm import get_llm_response, limits_from_format  # 使用 LLM 來分析
+from agents.evidence import load_matching, format_transitions
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # 系統提示詞
 SYSTEM_PROMPT = """
@@ -45,43 +48,71 @@ You are part of an experimental pipeline analyzing blockchain transaction cluste
    - Any anomalies or unexpected clustering behaviors detected.
 """
 
+LIMITS = limits_from_format(SYSTEM_PROMPT, max_tokens=1200)
 
-def summarize_depths(input_dir="clusterAnalysis", output_dir="epochSummary"):
-    """分析同 Depth 下的不同 Epochs，並產生比較與共通點的總結"""
+
+def build_prompt(depth, analyses, transitions=None):
+    """組合單一 Depth 的 Epoch 比較 prompt（planner 也以此估算 token 數）"""
+    # combined_prompt = SYSTEM_PROMPT.format(depth=depth)
+    combined_prompt = SYSTEM_PROMPT
+    if transitions:
+        # 以成員重疊度（Jaccard over Hash）算出的確切延續 / 分裂 / 合併，不需要 LLM 從文字推測
+        combined_prompt += f"\n📐 **Depth {depth} - 相鄰 Epoch 間的 cluster 對齊（stable / split / merged / new / dissolved）：**\n{transitions}\n\n"
+    combined_prompt += "\n".join(analyses)  # 將所有該 Depth 內的 Epochs 內容合併
+    return combined_prompt
+
+
+def summarize_depth(depth, analyses, output_dir="epochSummary", transitions=None, manifest=None):
+    """讓 LLM 比較單一 Depth 內所有 Epochs 的分析，transitions 為 clusterMatching 算出的 cluster 對齊事實"""
+    combined_prompt = build_prompt(depth, analyses, transitions)
+
+    # 讓 LLM 產生比較分析
+    output_filename = os.path.join(output_dir, f"summary_Depth_{depth}.txt")
+    response = get_llm_response(combined_prompt, stage="epoch-comparison", artifact=os.path.basename(output_filename),
+                                limits=LIMITS)
+
+    # 儲存比較結果（單獨呼叫時自行更新 manifest）
+    save_manifest = manifest is None
+    manifest = manifest or Manifest(output_dir)
+    write_text_artifact(manifest, output_filename, response, depth=depth)
+    if save_manifest:
+        manifest.save()
+
+    print(f"Saved depth summary: {output_filename}")
+    return output_filename
+
+
+def summarize_depths(input_dir="clusterAnalysis", output_dir="epochSummary", max_workers=1, selection=ALL, matching_dir=None):
+    """分析同 Depth 下的不同 Epochs，並產生比較與共通點的總結（matching_dir 有對齊結果時一併提供給 LLM）"""
     os.makedirs(output_dir, exist_ok=True)  # 確保輸出目錄存在
 
-    # 讀取所有 `analysis_Depth_i_Epoch_j.txt` 檔案
-    analysis_files = glob.glob(os.path.join(input_dir, "analysis_Depth_*_Epoch_*.txt"))
+    # 從 manifest 取得所有 `analysis_Depth_i_Epoch_j.txt` 檔案（已依數值排序）
+    entries = discover(input_dir, "analysis_Depth_*_Epoch_*.txt", selection)
 
     # 根據 Depth 分組
     grouped_analyses = defaultdict(list)
 
-    for file in analysis_files:
-        filename = os.path.basename(file)
-        parts = filename.split("_")
-        depth, epoch = parts[2], parts[4].split(".")[0]
+    for entry in entries:
+        depth, epoch = entry["depth"], entry["epoch"]
 
         # 讀取分析內容
-        with open(file, "r", encoding="utf-8") as f:
+        with open(entry["full_path"], "r", encoding="utf-8") as f:
             content = f.read()
 
         grouped_analyses[depth].append(f"📌 **Epoch {epoch} Analysis:**\n{content}\n")
 
     # 遍歷所有 Depth，讓 LLM 進行 Epochs 間的比較與共通性分析
-    for depth, analyses in grouped_analyses.items():
-        # combined_prompt = SYSTEM_PROMPT.format(depth=depth)
-        combined_prompt = SYSTEM_PROMPT
-        combined_prompt += "\n".join(analyses)  # 將所有該 Depth 內的 Epochs 內容合併
-
-        # 讓 LLM 產生比較分析
-        response = get_llm_response(combined_prompt)
-
-        # 儲存比較結果
-        output_filename = os.path.join(output_dir, f"summary_Depth_{depth}.txt")
-        with open(output_filename, "w", encoding="utf-8") as f:
-            f.write(response)
-
-        print(f"Saved depth summary: {output_filename}")
+    def transitions(depth):
+        matching = load_matching(matching_dir, depth)
+        return format_transitions(matching) if matching else None
+
+    manifest = Manifest(output_dir)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(summarize_depth, depth, analyses, output_dir, transitions(depth), manifest)
+                   for depth, analyses in grouped_analyses.items()]
+        for future in futures:
+            future.result()
+    manifest.save()
 
 if __name__ == "__main__":
     summarize_depths()
@@ -0,0 +1,116 @@
+import os
+import json
+from collections import defaultdict
+
+# clusterMetrics / clusterMatching / clusterAnomalies 的輸出檔名，以及讀取後整理成 prompt 文字的函數
+# （只依賴標準函式庫，比較階段不需要載入 numpy / pandas）
+DEPTH_MATCHING_FILE = "matching_depths.json"
+
+
+def metrics_filename(depth, epoch):
+    return f"metrics_Depth_{depth}_Epoch_{epoch}.json"
+
+
+def matching_filename(depth):
+    return f"matching_Depth_{depth}.json"
+
+
+def anomalies_filename(depth, epoch):
+    return f"anomalies_Depth_{depth}_Epoch_{epoch}.json"
+
+
+def load_metrics(metrics_dir, depth, epoch):
+    """讀取某個 (Depth, Epoch) 的指標，不存在時回傳 None"""
+    if not metrics_dir:
+        return None
+    path = os.path.join(metrics_dir, metrics_filename(depth, epoch))
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_evidence(metrics):
+    """將指標整理成精簡的文字，附加在 Cluster Comparison 的 prompt 中"""
+    lines = [f"Overall silhouette (sampled): {metrics['silhouette']} across {metrics['n_clusters']} clusters, {metrics['rows']} rows."]
+    for cluster in metrics["clusters"]:
+        centroid = ", ".join(f"{name}={value}" for name, value in cluster["centroid"].items())
+        lines.append(f"- Cluster {cluster['cluster']}: size {cluster['size']} ({cluster['share']:.1%}), "
+                     f"silhouette {cluster['silhouette']}, standardized centroid [{centroid}], "
+                     f"nearest cluster {cluster['nearest_cluster']}")
+
+    def pairs(title, items):
+        text = "; ".join(f"{a}-{b}: {item['value']}" for item in items for a, b in [item["clusters"]])
+        return f"{title}: {text}" if text else None
+
+    for line in (pairs("Closest centroids (distance)", metrics["closest_centroids"]),
+                 pairs("Most different TokenSymbol distributions (JS divergence)", metrics["token_divergence"]),
+                 pairs("Most different Value distributions (JS divergence)", metrics["value_divergence"])):
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def load_matching(matching_dir, depth=None):
+    """讀取某個 Depth 的 Epoch 對齊結果（depth=None 時讀取 Depth 間的對齊），不存在時回傳 None"""
+    if not matching_dir:
+        return None
+    filename = DEPTH_MATCHING_FILE if depth is None else matching_filename(depth)
+    path = os.path.join(matching_dir, filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_transitions(matching):
+    """將對齊結果整理成逐條的事實，附加在 Epoch / Depth Comparison 的 prompt 中"""
+    lines = []
+    for transition in matching["transitions"]:
+        counts = defaultdict(int)
+        for event in transition["events"]:
+            counts[event["type"]] += 1
+        summary = ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+        lines.append(f"{transition['source']} → {transition['target']} "
+                     f"({len(transition['source_clusters'])} → {len(transition['target_clusters'])} clusters): {summary}")
+        for event in transition["events"]:
+            source = ", ".join(map(str, event["source"])) or "-"
+            target = ", ".join(map(str, event["target"])) or "-"
+            detail = f" (Jaccard {event['jaccard']})" if "jaccard" in event else (
+                f" (shares {', '.join(map(str, event['shares']))})" if "shares" in event else "")
+            lines.append(f"  - {event['type']}: cluster {source} → cluster {target}{detail}")
+    return "\n".join(lines)
+
+
+def load_anomalies(anomalies_dir, depth, epoch, cluster):
+    """讀取某個 cluster 的異常（已依嚴重程度排序），不存在時回傳 None"""
+    if not anomalies_dir:
+        return None
+    path = os.path.join(anomalies_dir, anomalies_filename(depth, epoch))
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["clusters"].get(str(cluster))
+
+
+def format_anomalies(anomalies):
+    """將單一 cluster 的異常整理成依嚴重程度排序的條列，附加在 Cluster Summary 的 prompt 中"""
+    rows = anomalies["rows"]
+    lines = []
+    for rank, item in enumerate(anomalies["anomalies"], start=1):
+        if item["type"] == "value_outliers":
+            examples = ", ".join(f"{e['hash']} (Value {e['value']}, z {e['z']})" for e in item["examples"])
+            text = (f"Value outliers: {item['rows']} of {rows} transactions have a robust z-score above {item['threshold']} "
+                    f"on log Value; most extreme: {examples}")
+        elif item["type"] == "burst":
+            text = (f"Burst: {item['rows']} transactions in the {item['window_seconds'] // 60}-minute window starting "
+                    f"{item['start']} (median {item['median_rows']:g} per active window)")
+        elif item["type"] in ("dominant_from", "dominant_to"):
+            role = "sender (From)" if item["type"] == "dominant_from" else "receiver (To)"
+            text = (f"Dominant {role} {item['address']}: {item['share']:.0%} of this cluster's transactions "
+                    f"vs {item['global_share']:.1%} of all transactions")
+        else:
+            text = (f"Rare token {item['token']}: {item['rows']} transactions here, "
+                    f"{item['global_share']:.2%} of all transactions")
+        lines.append(f"{rank}. {text}")
+    return "\n".join(lines) if lines else f"No anomalies detected across all {rows} transactions."
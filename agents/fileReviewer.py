@@ -1,19 +1,31 @@
 import os
 import re
 import json
-import requests
-from dotenv import load_dotenv
+import hashlib
+import llm
+from workspace import RunWorkspace
+from agents.artifactIndex import ArtifactIndex, DEFAULT_DIRS
+
+# 檔案摘要的持久化快取（以內容雜湊為 key，內容不變就不需要再請 LLM 摘要）
+SUMMARY_MEMO_FILE = ".summary_memo.json"
 
 class FileReviewer:
-    def __init__(self, allowed_dirs=None, token_threshold=1000):
-        self.root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    def __init__(self, allowed_dirs=None, token_threshold=1000, root_dir=None, use_index=True, backend="gemini", model=None):
+        # root_dir 可指向某個 run 目錄，未指定時使用專案根目錄
+        self.root_dir = os.path.abspath(root_dir or os.path.join(os.path.dirname(__file__), ".."))
         self.token_threshold = token_threshold
         self.allowed_dirs = allowed_dirs if allowed_dirs is not None else []
+        # 本地索引可直接回答「深度2 epoch1」這類查詢，不需要先請 LLM 挑選檔案
+        self.index = ArtifactIndex(self.root_dir, dirs=self.allowed_dirs or DEFAULT_DIRS) if use_index else None
+
+        # 目錄快取：path -> (mtime_ns, [(name, is_dir), ...])；檔案內容快取：path -> ((mtime_ns, size), content)
+        self._dir_cache = {}
+        self._content_cache = {}
+        self.summary_memo_file = os.path.join(self.root_dir, SUMMARY_MEMO_FILE)
+        self.summary_memo = self.load_summary_memo()
 
-        load_dotenv()
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise Exception("請在 .env 檔中設定 GEMINI_API_KEY")
+        # 與 pipeline 共用 llm.py 的 backend（連線池、重試與回應快取）；backend="fake" 可離線測試
+        self.llm = llm.get_backend(backend, model)
 
     def build_file_tree(self, current_path):
         tree = {
@@ -22,14 +34,13 @@ class FileReviewer:
             "type": "directory",
             "children": []
         }
-        try:
-            entries = os.listdir(current_path)
-        except Exception:
+        entries = self.list_dir(current_path)
+        if entries is None:
             return tree
-        
-        for entry in entries:
+
+        for entry, is_dir in entries:
             full_path = os.path.join(current_path, entry)
-            if os.path.isdir(full_path):
+            if is_dir:
                 tree["children"].append(self.build_file_tree(full_path))
             else:
                 tree["children"].append({
@@ -39,6 +50,24 @@ class FileReviewer:
                 })
         return tree
 
+    def list_dir(self, path):
+        """列出目錄內容；目錄的 mtime 沒變時直接使用快取，不重新 scandir"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._dir_cache.pop(path, None)
+            return None
+        cached = self._dir_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with os.scandir(path) as it:
+                entries = [(entry.name, entry.is_dir()) for entry in it]
+        except OSError:
+            return None
+        self._dir_cache[path] = (mtime, entries)
+        return entries
+
     def get_file_structure(self):
         trees = []
         if self.allowed_dirs:
@@ -49,27 +78,16 @@ class FileReviewer:
             return {"name": os.path.basename(self.root_dir), "path": ".", "type": "directory", "children": trees}
         else:
             children = []
-            for entry in os.listdir(self.root_dir):
-                full_path = os.path.join(self.root_dir, entry)
-                if os.path.isfile(full_path):
+            for entry, is_dir in self.list_dir(self.root_dir) or []:
+                if not is_dir:
                     children.append({"name": entry, "path": entry, "type": "file"})
             return {"name": os.path.basename(self.root_dir), "path": ".", "type": "directory", "children": children}
 
-    def call_gemini(self, prompt_text):
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
-        payload = {"contents": [{"parts": [{"text": prompt_text}]}]}
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(url, json=payload, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Gemini API 呼叫失敗：{response.text}")
+    def call_llm(self, prompt_text, artifact=None):
+        return llm.get_llm_response(prompt_text, backend=self.llm, stage="file-review", artifact=artifact)
 
-    def extract_json_from_response(self, response):
+    def extract_json_from_response(self, output_text):
         try:
-            if "candidates" not in response or not response["candidates"]:
-                return {}
-            output_text = response["candidates"][0]["content"]["parts"][0]["text"]
             match = re.search(r"```json\s*(.*?)\s*```", output_text, re.DOTALL)
             if match:
                 json_text = match.group(1).strip()
@@ -79,6 +97,12 @@ class FileReviewer:
             return {}
 
     def choose_files(self, query):
+        if self.index is not None:
+            selected_files = self.index.search(query)
+            if selected_files:
+                return {"selected_files": selected_files}
+
+        # 索引找不到符合的檔案時，才將檔案架構交給 LLM 挑選
         file_structure = self.get_file_structure()
         file_structure_str = json.dumps(file_structure, ensure_ascii=False, indent=2)
         prompt = (
@@ -96,19 +120,45 @@ class FileReviewer:
             "```\n"
             "請確保回覆格式正確，並且僅回傳 JSON 結果，不要提供額外的解釋。"
         )
-        gemini_response = self.call_gemini(prompt)
-        return self.extract_json_from_response(gemini_response)
+        llm_response = self.call_llm(prompt)
+        return self.extract_json_from_response(llm_response)
 
     def open_file(self, file_rel_path):
         file_path = os.path.join(self.root_dir, file_rel_path)
         if not os.path.exists(file_path):
             raise Exception(f"❌ 檔案 {file_rel_path} 不存在於 {self.root_dir}")
+        stat = os.stat(file_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._content_cache.get(file_path)
+        if cached and cached[0] == version:
+            return cached[1]
         with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+            content = f.read()
+        self._content_cache[file_path] = (version, content)
+        return content
+
+    def load_summary_memo(self):
+        if not os.path.exists(self.summary_memo_file):
+            return {}
+        try:
+            with open(self.summary_memo_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_summary_memo(self):
+        tmp_file = f"{self.summary_memo_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.summary_memo, f, ensure_ascii=False)
+        os.replace(tmp_file, self.summary_memo_file)
 
     def process_file_content(self, content):
         tokens = len(content.split())
         if tokens > self.token_threshold:
+            memo_key = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            if memo_key in self.summary_memo:
+                return self.summary_memo[memo_key]
+
             prompt = (
                 "請對下列內容做摘要，並用 JSON 回覆：\n"
                 "```json\n"
@@ -116,9 +166,13 @@ class FileReviewer:
                 "```\n"
                 "以下為內容：\n" + content
             )
-            gemini_response = self.call_gemini(prompt)
-            summary_json = self.extract_json_from_response(gemini_response)
-            return summary_json.get("summary", content)
+            llm_response = self.call_llm(prompt)
+            summary_json = self.extract_json_from_response(llm_response)
+            if "summary" not in summary_json:
+                return content
+            self.summary_memo[memo_key] = summary_json["summary"]
+            self.save_summary_memo()
+            return summary_json["summary"]
         return content
 
     def get_file_info(self, query):
@@ -138,10 +192,11 @@ class FileReviewer:
             
             return files_info  # 🚀 確保多個檔案資訊都被傳遞
         else:
-            raise Exception("❌ Gemini 無法選出合適的檔案")
+            raise Exception("❌ LLM 無法選出合適的檔案")
 
 if __name__ == '__main__':
-    reviewer = FileReviewer(allowed_dirs=["clusterSummary"])
+    latest_run = RunWorkspace.latest()
+    reviewer = FileReviewer(allowed_dirs=["clusterSummary"], root_dir=latest_run.run_dir if latest_run else None)
     query = "比較同樣為深度2epoch1時，每一個Cluster的差異"
 
     try:
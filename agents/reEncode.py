@@ -1,25 +1,33 @@
-import pandas as pd
 import os
 import json
+from schema import read_header, read_table
+from selection import ALL
 
-def re_encode_data(input_file="kmeans_clustered_results.csv", output_file="data_encoded.csv", map_file="encoding_map.json"):
-    """ 重新編碼 Hash、From、To 欄位，並產生新的 data_encoded.csv """
-
-    # 讀取 CSV
-    df = pd.read_csv(input_file)
+# 需要重新編碼的欄位
+COLUMNS_TO_ENCODE = ["Hash", "From", "To"]
 
-    # 需要重新編碼的欄位
-    columns_to_encode = ["Hash", "From", "To"]
+def encode_columns(df):
+    """依第一次出現的順序將 Hash / From / To 換成短 ID（例如 H0、F12），回傳編碼對應表"""
     encoding_map = {}
 
     # 針對每個欄位生成唯一 ID
-    for col in columns_to_encode:
+    for col in COLUMNS_TO_ENCODE:
         unique_values = df[col].unique()
         value_to_id = {value: f"{col[:1]}{idx}" for idx, value in enumerate(unique_values)}  # 產生 ID
         encoding_map[col] = value_to_id
 
         # 取代原本的值
         df[col] = df[col].map(value_to_id)
+    return encoding_map
+
+def re_encode_data(input_file="kmeans_clustered_results.csv", output_file="data_encoded.csv", map_file="encoding_map.json", selection=ALL):
+    """ 重新編碼 Hash、From、To 欄位，並產生新的 data_encoded.csv """
+
+    # 讀取 CSV（只讀入被選取的 Cluster_Depth_i_Epoch_j 欄位；From / To 為 category，對應只需套用在不重複的值上）
+    header = read_header(input_file)
+    df = read_table(input_file, usecols=selection.usecols(header))
+
+    encoding_map = encode_columns(df)
 
     # 儲存新的 CSV
     df.to_csv(output_file, index=False, encoding="utf-8")
@@ -1,20 +1,40 @@
-import pandas as pd
 import os
-import glob
+from manifest import Manifest, discover, write_csv_artifact
+from schema import read_table
+from selection import ALL
 
-def split_into_clusters(input_dir="output_csv", output_dir="clustered_csv"):
+def register_aliases(manifest, entry, source):
+    """分群與先前的 Epoch 相同時，不另外寫出 cluster CSV，只在 manifest 登記指向原 cluster 的別名"""
+    depth, epoch, source_epoch = entry["depth"], entry["epoch"], source["epoch"]
+    source_labels = {code: label for label, code in source["canonical_labels"].items()}
+    for label, code in entry["canonical_labels"].items():
+        source_entry = manifest.get(depth, source_epoch, int(source_labels[code]))
+        if source_entry is None:
+            continue
+        manifest.add(f"Depth_{depth}_Epoch_{epoch}_Cluster_{label}.csv", depth=depth, epoch=epoch, cluster=int(label),
+                     rows=source_entry["rows"], sha256=source_entry["sha256"], alias_of=source_entry["path"])
+    print(f"♻ Depth {depth}, Epoch {epoch} has the same partition as Epoch {source_epoch}; reusing its clusters.")
+
+
+def split_into_clusters(input_dir="output_csv", output_dir="clustered_csv", selection=ALL):
     # 確保輸出目錄存在
     os.makedirs(output_dir, exist_ok=True)
 
-    # 讀取所有 Depth_i_Epoch_j.csv 檔案
-    csv_files = glob.glob(os.path.join(input_dir, "Depth_*_Epoch_*.csv"))
+    # 從 manifest 取得所有 Depth_i_Epoch_j.csv 檔案（已依數值排序）
+    manifest = Manifest(output_dir)
+    partitions = {}  # (depth, 分群指紋) -> 第一個出現此分群的 Epoch
+    for entry in discover(input_dir, "Depth_*_Epoch_*.csv", selection):
+        file = entry["full_path"]
+        depth, epoch = entry["depth"], entry["epoch"]
 
-    for file in csv_files:
-        df = pd.read_csv(file)
+        fingerprint = entry.get("fingerprint")
+        if fingerprint and (depth, fingerprint) in partitions:
+            register_aliases(manifest, entry, partitions[(depth, fingerprint)])
+            continue
+        if fingerprint:
+            partitions[(depth, fingerprint)] = entry
 
-        # 提取檔名資訊
-        filename = os.path.basename(file)
-        depth, epoch = filename.split("_")[1], filename.split("_")[3]
+        df = read_table(file)
 
         # 確保 Cluster_Value 欄位存在
         if "Cluster_Value" not in df.columns:
@@ -23,9 +43,12 @@ def split_into_clusters(input_dir="output_csv", output_dir="clustered_csv"):
         
         # 依照 Cluster_Value 分群
         for cluster_id, cluster_df in df.groupby("Cluster_Value"):
+            if not selection.match_cluster(cluster_id, len(cluster_df)):
+                continue
             output_filename = os.path.join(output_dir, f"Depth_{depth}_Epoch_{epoch}_Cluster_{cluster_id}.csv")
-            cluster_df.to_csv(output_filename, index=False, encoding="utf-8")
+            write_csv_artifact(manifest, output_filename, cluster_df, depth=depth, epoch=epoch, cluster=int(cluster_id))
             print(f"Saved: {output_filename}")
+    manifest.save()
 
 if __name__ == "__main__":
     split_into_clusters()
@@ -0,0 +1,72 @@
+# bench_startup.py
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# 要量測的啟動情境：(名稱, 在全新直譯器中執行的程式碼)
+SCENARIOS = [
+    ("import llm", "import llm"),
+    ("import pipeline", "import pipeline"),
+    ("main.py (depth-comparison only)", "import main; main.parse_args(['--stages', 'depth-comparison'])"),
+]
+STAGE_SCENARIO = "import pipeline; pipeline.load_stage({stage!r})"
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def time_snippet(code, repeat):
+    """在全新的直譯器中執行 code，回傳每次的耗時（秒）；失敗時回傳錯誤訊息"""
+    timings = []
+    wrapper = f"import time; _start = time.perf_counter(); {code}; print(time.perf_counter() - _start)"
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", wrapper], cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings, None
+
+
+def slowest_imports(code, top_n):
+    """以 python -X importtime 找出最耗時的模組（累計時間，微秒）"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top_n]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure interpreter start-up and import time of the pipeline entry points.")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per scenario (default: %(default)s)")
+    parser.add_argument("--stages", action="store_true", help="also time importing each stage module")
+    parser.add_argument("--importtime", metavar="CODE", help="show the slowest imports of CODE (e.g. 'import pipeline')")
+    parser.add_argument("--top", type=int, default=15, help="rows shown with --importtime (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.importtime:
+        for cumulative_us, name in slowest_imports(args.importtime, args.top):
+            print(f"{cumulative_us / 1000:10.1f} ms  {name}")
+        return
+
+    scenarios = list(SCENARIOS)
+    if args.stages:
+        from pipeline import STAGES
+        scenarios += [(f"stage {stage}", STAGE_SCENARIO.format(stage=stage)) for stage in STAGES]
+
+    print(f"{'scenario':<32}{'median':>10}{'min':>10}")
+    for name, code in scenarios:
+        timings, error = time_snippet(code, args.repeat)
+        if error:
+            print(f"{name:<32}{'failed':>10}  {error}")
+            continue
+        print(f"{name:<32}{statistics.median(timings) * 1000:>8.1f}ms{min(timings) * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
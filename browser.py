@@ -0,0 +1,128 @@
+# browser.py
+
+import os
+import math
+import threading
+from collections import OrderedDict
+
+from manifest import MANIFEST_FILE, discover
+from report import render_markdown
+from workspace import DEFAULT_ROOT, RunWorkspace, list_runs
+
+# 可瀏覽的產物：類型 -> (目錄, 檔名樣式)
+ARTIFACT_KINDS = {
+    "Cluster Summary": ("clusterSummary", "summary_Depth_*_Epoch_*_Cluster_*.txt"),
+    "Cluster Comparison": ("clusterAnalysis", "analysis_Depth_*_Epoch_*.txt"),
+    "Epoch Comparison": ("epochSummary", "summary_Depth_*.txt"),
+    "Depth Comparison": ("depthComparison", "final_summary.txt"),
+    "Cluster CSV": ("clustered_csv", "Depth_*_Epoch_*_Cluster_*.csv"),
+}
+
+# 清單每頁的產物數、CSV 預覽每頁的筆數、快取的 Markdown 轉換結果數
+PAGE_SIZE = 50
+PREVIEW_ROWS = 50
+RENDER_CACHE_SIZE = 256
+
+# 目錄 -> (manifest 或目錄的 mtime, 產物清單)
+_listings = {}
+_listings_lock = threading.Lock()
+
+# (路徑, mtime, 大小) -> 轉換後的 HTML，超過 RENDER_CACHE_SIZE 時移除最久未使用的項目
+_rendered = OrderedDict()
+_rendered_lock = threading.Lock()
+
+
+def run_ids(root=DEFAULT_ROOT):
+    """所有 run 的 ID，最新的在前"""
+    return [os.path.basename(path) for path in reversed(list_runs(root))]
+
+
+def list_artifacts(directory, pattern):
+    """目錄內所有產物（依數值排序）；manifest（或目錄）沒有變動時直接使用快取，不重新讀取"""
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    try:
+        stamp = os.stat(manifest_path if os.path.exists(manifest_path) else directory).st_mtime_ns
+    except OSError:
+        return []
+    with _listings_lock:
+        cached = _listings.get(directory)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    entries = discover(directory, pattern)
+    with _listings_lock:
+        _listings[directory] = (stamp, entries)
+    return entries
+
+
+def paginate(items, page, page_size=PAGE_SIZE):
+    """回傳 (該頁的項目, 實際頁數, 總頁數)，超出範圍的頁數會自動調整"""
+    pages = max(1, math.ceil(len(items) / page_size))
+    page = min(max(1, int(page or 1)), pages)
+    start = (page - 1) * page_size
+    return items[start:start + page_size], page, pages
+
+
+def kind_entries(run_id, kind, root=DEFAULT_ROOT):
+    """某個 run 中某類產物的完整清單（run 不存在時為空）；中間產物（clustered_csv）可能在 tmpfs 上，
+    由 RunWorkspace 決定實際目錄，瀏覽時不建立任何目錄或檔案"""
+    directory, pattern = ARTIFACT_KINDS[kind]
+    try:
+        ws = RunWorkspace.resolve(root, run_id)
+    except FileNotFoundError:
+        return []
+    return list_artifacts(ws.locate(directory), pattern)
+
+
+def browse(run_id, kind, depth=None, epoch=None, page=1, root=DEFAULT_ROOT, page_size=PAGE_SIZE):
+    """某個 run 中某類產物的一頁清單，以及可篩選的 Depth / Epoch"""
+    entries = kind_entries(run_id, kind, root)
+    in_depth = [entry for entry in entries if depth is None or entry["depth"] == depth]
+    selected = [entry for entry in in_depth if epoch is None or entry["epoch"] == epoch]
+    items, page, pages = paginate(selected, page, page_size)
+    return {
+        "entries": items,
+        "page": page,
+        "pages": pages,
+        "total": len(selected),
+        "depths": sorted({entry["depth"] for entry in entries if entry["depth"] is not None}),
+        "epochs": sorted({entry["epoch"] for entry in in_depth if entry["epoch"] is not None}),
+    }
+
+
+def find_artifact(run_id, kind, name, root=DEFAULT_ROOT):
+    return next((entry for entry in kind_entries(run_id, kind, root) if entry["path"] == name), None)
+
+
+def render_artifact(path):
+    """將文字產物轉為 HTML，同一個檔案（mtime 與大小未變）只轉換一次"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _rendered_lock:
+        if key in _rendered:
+            _rendered.move_to_end(key)
+            return _rendered[key]
+    with open(path, "r", encoding="utf-8") as f:
+        rendered = render_markdown(f.read())
+    with _rendered_lock:
+        _rendered[key] = rendered
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
+    return rendered
+
+
+def count_rows(path):
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def preview_csv(entry, page=1, page_size=PREVIEW_ROWS):
+    """只讀取 CSV 的其中一頁（skiprows / nrows），回傳 (DataFrame, 實際頁數, 總頁數)；總筆數優先取自 manifest"""
+    # pandas 只在預覽 CSV 時才需要，瀏覽文字產物不必載入
+    from schema import read_table
+
+    rows = entry["rows"] if entry.get("rows") is not None else count_rows(entry["full_path"])
+    pages = max(1, math.ceil(rows / page_size))
+    page = min(max(1, int(page or 1)), pages)
+    start = (page - 1) * page_size
+    df = read_table(entry["full_path"], skiprows=range(1, start + 1), nrows=page_size)
+    return df, page, pages
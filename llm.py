@@ -1,10 +1,338 @@
 # llm.py
 
-from llama_index.llms.ollama import Ollama
+import os
+import re
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
 
-# 初始化 Ollama，統一管理 LLM 參數
-ollama_for_answers = Ollama(model="llama3.1", request_timeout=180.0)
+# 預設使用的 backend，可透過環境變數 LLM_BACKEND 切換（ollama / gemini / fake）
+DEFAULT_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+DEFAULT_MODEL = "llama3.1"
+REQUEST_TIMEOUT = 180.0
+MAX_RETRIES = 2
 
-def get_llm_response(prompt: str) -> str:
-    """使用 LLM (Ollama) 產生回應"""
-    return str(ollama_for_answers.complete(prompt))
+# 回應快取目錄（None 代表不使用快取）
+cache_dir = None
+
+# 續寫呼叫在用量紀錄中的產物名稱後綴
+CONTINUATION_SUFFIX = " (continuation)"
+
+# 記錄每次呼叫用量的 usage.UsageLedger（None 代表不記錄）
+usage_ledger = None
+
+
+@dataclass(frozen=True)
+class OutputLimits:
+    """單一階段的輸出長度上限與停止字串；required 為回應中必須出現的 (編號, 標題) 段落，缺少時以續寫呼叫補齊"""
+    max_tokens: Optional[int] = None
+    stop: Tuple[str, ...] = ()
+    required: Tuple[Tuple[int, str], ...] = ()
+    continuation_tokens: int = 400
+
+
+# 不限制輸出
+NO_LIMITS = OutputLimits()
+
+# SYSTEM_PROMPT 輸出格式中的編號段落，例如 `1. **Cluster Characteristics:**`
+SECTION_PATTERN = re.compile(r"^(\d+)\. \*\*(.+?):?\*\*", re.MULTILINE)
+# 回應中的編號段落標題，模型常加上 Markdown 標題符號或省略粗體，例如 `### 3. Additional Observations`
+HEADING_PATTERN = re.compile(r"^[ \t#>*]*(\d+)\.[ \t]*\**[ \t]*([^*:\n]+)", re.MULTILINE)
+
+
+def limits_from_format(system_prompt, max_tokens, continuation_tokens=400):
+    """由 SYSTEM_PROMPT 的 Output Format 推導必要段落；不設停止字串（段落內的編號粗體清單與段落標題無法區分），只以 max_tokens 限制長度"""
+    output_format = system_prompt[system_prompt.index("Output Format"):]
+    # 標題中的 {depth} 等佔位符號不會原樣出現在回應中，只保留佔位符號之前的文字
+    required = tuple((int(number), title.split("{")[0].strip()) for number, title in SECTION_PATTERN.findall(output_format))
+    return OutputLimits(max_tokens=max_tokens, required=required, continuation_tokens=continuation_tokens)
+
+
+def first_word(title):
+    words = re.findall(r"\w+", title.lower())
+    return words[0] if words else ""
+
+
+def missing_sections(text, required):
+    """回應中缺少的必要段落，回傳 `編號. 標題` 清單；編號相同且標題開頭的字相同即視為存在（模型常省略標題後半，例如 by LLM）"""
+    headings = {(int(number), first_word(title)) for number, title in HEADING_PATTERN.findall(text)}
+    lowered = text.lower()
+    return [f"{number}. {title}" for number, title in required
+            if (number, first_word(title)) not in headings and title.lower() not in lowered]
+
+
+@dataclass
+class Completion:
+    """LLM 的回應文字與 token 用量（backend 無法提供時為 None）"""
+    text: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class TransientLLMError(Exception):
+    """可重試的暫時性錯誤：逾時、連線失敗、429 與 5xx（設定錯誤或 4xx 不重試）"""
+
+
+def transient_status(status_code):
+    return status_code is not None and (status_code == 429 or 500 <= status_code < 600)
+
+
+class LLMBackend:
+    """所有 LLM backend 的共同介面：complete() 會自動重試暫時性的錯誤"""
+    name = "base"
+    default_model = DEFAULT_MODEL
+
+    def __init__(self, model=None, request_timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES):
+        self.model = model or self.default_model
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+
+    def complete(self, prompt: str, max_tokens: Optional[int] = None, stop: Tuple[str, ...] = ()) -> Completion:
+        """max_tokens 限制回應長度，產生 stop 中的任一字串時提早結束（回應不含該字串）"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._complete(prompt, max_tokens, stop)
+            except TransientLLMError as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = 2 ** attempt
+                print(f"⚠ {self.name} call failed ({e}), retrying in {wait}s...")
+                time.sleep(wait)
+
+    def _complete(self, prompt: str, max_tokens: Optional[int], stop: Tuple[str, ...]) -> Completion:
+        raise NotImplementedError
+
+
+class OllamaBackend(LLMBackend):
+    """本機 Ollama（透過 llama_index），每組輸出限制的 client 在第一次呼叫時才建立"""
+    name = "ollama"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, max_tokens=None, stop=()):
+        # num_predict / stop 是 Ollama 的生成選項，llama_index 透過 additional_kwargs 傳入
+        options = {}
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        if stop:
+            options["stop"] = list(stop)
+        key = (max_tokens, tuple(stop))
+        with self._lock:
+            if key not in self._clients:
+                from llama_index.llms.ollama import Ollama
+                self._clients[key] = Ollama(model=self.model, request_timeout=self.request_timeout,
+                                            additional_kwargs=options)
+        return self._clients[key]
+
+    def _complete(self, prompt, max_tokens, stop):
+        import httpx
+        try:
+            response = self.client(max_tokens, stop).complete(prompt)
+        except (httpx.TransportError, ConnectionError, TimeoutError) as e:
+            raise TransientLLMError(f"Ollama 連線失敗：{e}") from e
+        except Exception as e:
+            # ollama.ResponseError 帶有 status_code，httpx.HTTPStatusError 則放在 response 中
+            status_code = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+            if transient_status(status_code):
+                raise TransientLLMError(f"Ollama 暫時無法回應（{status_code}）：{e}") from e
+            raise
+        raw = response.raw or {}
+        return Completion(str(response), raw.get("prompt_eval_count"), raw.get("eval_count"))
+
+
+# 所有 Gemini backend 共用同一個 HTTP session，重複使用連線
+_session = None
+_session_lock = threading.Lock()
+SESSION_POOL_SIZE = 16
+
+
+def shared_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=SESSION_POOL_SIZE, pool_maxsize=SESSION_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini REST API，API key 讀取自 .env 的 GEMINI_API_KEY"""
+    name = "gemini"
+    default_model = "gemini-2.0-flash"
+    url = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+
+    @property
+    def api_key(self):
+        from dotenv import load_dotenv
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise Exception("請在 .env 檔中設定 GEMINI_API_KEY")
+        return api_key
+
+    # Gemini 最多接受 5 個 stopSequences
+    max_stop_sequences = 5
+
+    def _complete(self, prompt, max_tokens, stop):
+        generation_config = {}
+        if max_tokens:
+            generation_config["maxOutputTokens"] = max_tokens
+        if stop:
+            generation_config["stopSequences"] = list(stop)[:self.max_stop_sequences]
+        body = {"contents": [{"parts": [{"text": prompt}]}]}
+        if generation_config:
+            body["generationConfig"] = generation_config
+        import requests
+        api_key = self.api_key
+        try:
+            response = shared_session().post(
+                self.url.format(model=self.model),
+                params={"key": api_key},
+                json=body,
+                timeout=self.request_timeout,
+            )
+        except (requests.Timeout, requests.ConnectionError) as e:
+            raise TransientLLMError(f"Gemini API 連線失敗：{e}") from e
+        if transient_status(response.status_code):
+            raise TransientLLMError(f"Gemini API 暫時無法回應（{response.status_code}）：{response.text}")
+        if response.status_code != 200:
+            raise Exception(f"Gemini API 呼叫失敗：{response.text}")
+        data = response.json()
+        candidates = data.get("candidates") or []
+        text = candidates[0]["content"]["parts"][0]["text"] if candidates else ""
+        usage = data.get("usageMetadata", {})
+        return Completion(text, usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+
+class FakeBackend(LLMBackend):
+    """不需連線的替身 backend，用於離線測試與壓力測試（latency 可模擬推論時間）"""
+    name = "fake"
+    default_model = "fake"
+
+    def __init__(self, *args, latency=None, responder=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = float(os.getenv("FAKE_LLM_LATENCY", "0")) if latency is None else latency
+        self.responder = responder
+
+    def _complete(self, prompt, max_tokens, stop):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.responder:
+            text = self.responder(prompt)
+        else:
+            digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+            text = f"Fake response {digest} for a {len(prompt)}-character prompt."
+        # 以空白分隔的字詞模擬 token，套用與真實 backend 相同的停止字串與長度上限
+        for sequence in stop:
+            if sequence in text:
+                text = text[:text.index(sequence)]
+        if max_tokens and len(text.split()) > max_tokens:
+            text = " ".join(text.split()[:max_tokens])
+        return Completion(text, len(prompt.split()), len(text.split()))
+
+
+BACKENDS = {backend.name: backend for backend in (OllamaBackend, GeminiBackend, FakeBackend)}
+
+_backends = {}
+_backends_lock = threading.Lock()
+active_backend = None
+
+
+def get_backend(name=None, model=None, **kwargs) -> LLMBackend:
+    """取得（並重複使用）指定名稱與模型的 backend"""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    key = (name, model, tuple(sorted(kwargs.items())))
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = BACKENDS[name](model=model, **kwargs)
+        return _backends[key]
+
+
+def configure(backend=None, model=None, request_timeout=None, llm_cache_dir=None, ledger=None):
+    """在執行 pipeline 前調整 backend、模型、逾時、快取目錄與用量紀錄"""
+    global active_backend, cache_dir, usage_ledger
+    kwargs = {"request_timeout": request_timeout} if request_timeout else {}
+    active_backend = get_backend(backend, model, **kwargs)
+    if llm_cache_dir:
+        os.makedirs(llm_cache_dir, exist_ok=True)
+        cache_dir = llm_cache_dir
+    if ledger is not None:
+        usage_ledger = ledger
+
+
+def cache_path(prompt: str, backend: LLMBackend, max_tokens=None, stop=(), directory=None):
+    """以 backend、模型名稱、輸出限制與 prompt 的雜湊值作為快取檔名（沒有輸出限制時與舊的快取相容）；
+    directory 預設為 configure() 設定的快取目錄"""
+    directory = directory or cache_dir
+    if not directory:
+        return None
+    limits = f"{max_tokens}\n{stop!r}\n" if max_tokens or stop else ""
+    key = hashlib.sha256(f"{backend.name}\n{backend.model}\n{limits}{prompt}".encode("utf-8")).hexdigest()
+    return os.path.join(directory, f"{key}.txt")
+
+
+def record_usage(stage, artifact, backend, completion=None, latency=0.0, cached=False):
+    if usage_ledger is None:
+        return
+    usage_ledger.record(
+        stage, backend.model, artifact,
+        prompt_tokens=completion.prompt_tokens if completion else None,
+        completion_tokens=completion.completion_tokens if completion else None,
+        latency=latency, backend=backend.name, cached=cached,
+    )
+
+
+def generate(prompt: str, backend: LLMBackend, stage=None, artifact=None, max_tokens=None, stop=()) -> str:
+    """單次 LLM 呼叫，相同 prompt 與輸出限制會直接讀取快取；stage / artifact 用於用量紀錄"""
+    path = cache_path(prompt, backend, max_tokens, stop)
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            response = f.read()
+        record_usage(stage, artifact, backend, cached=True)
+        return response
+
+    started = time.perf_counter()
+    completion = backend.complete(prompt, max_tokens, stop)
+    record_usage(stage, artifact, backend, completion, time.perf_counter() - started)
+    response = completion.text
+
+    if path:
+        # 先寫入暫存檔再改名，避免多執行緒同時寫入時讀到不完整的內容
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(response)
+        os.replace(tmp_path, path)
+    return response
+
+
+def continuation_prompt(prompt, partial, missing):
+    """請 LLM 接續被截斷的回應，只補上缺少的段落"""
+    return (f"{prompt}\n\n{partial}\n\n---\nThe response above stopped before these required sections: "
+            f"{', '.join(missing)}. Continue it by writing only the missing sections, in the same format, "
+            f"without repeating anything above.")
+
+
+def get_llm_response(prompt: str, backend: Optional[LLMBackend] = None, stage=None, artifact=None,
+                     limits: OutputLimits = NO_LIMITS) -> str:
+    """使用 LLM 產生回應；limits 限制輸出長度，回應缺少必要段落（通常是被 max_tokens 截斷）時才續寫缺少的段落"""
+    backend = backend or active_backend or get_backend()
+    response = generate(prompt, backend, stage, artifact, limits.max_tokens, limits.stop)
+    missing = missing_sections(response, limits.required)
+    if not missing:
+        return response
+
+    print(f"✂ {artifact or stage or 'Response'} is missing {', '.join(missing)}; requesting a continuation.")
+    continuation = generate(continuation_prompt(prompt, response, missing), backend, stage,
+                            f"{artifact}{CONTINUATION_SUFFIX}" if artifact else None, limits.continuation_tokens, limits.stop)
+    return f"{response.rstrip()}\n\n{continuation.strip()}"
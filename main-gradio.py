@@ -1,110 +1,134 @@
 import os
 import gradio as gr
 
-import agents.reEncode as re_encode
-import agents.dataTransferringAgent as data_transfer
-import agents.toClustered as to_cluster
-import agents.clusterSummary as cluster_summary
-import agents.clusterChecker as cluster_checker
-import agents.epochComparison as epoch_comparison
-import agents.depthComparison as depth_comparison
-
-# 預設旗標值
-USE_ENCODED_DATA = True
-REFRESH_DATA_TRANSFER = True
-REGENERATE_SUMMARY = True
-REGENERATE_CLUSTER_COMPARISON = True
-REGENERATE_EPOCH_COMPARISON = True
-REGENERATE_DEPTH_SUMMARY = True
-REGENERATE_DEPTH_COMPARISON = True
-
-def main(data_file):
-    # 若 data_file 為 None，則使用預設的 data.csv
-    if not data_file:
-        data_file = "data.csv"
-    
-    if USE_ENCODED_DATA:
-        print("🔄 Re-encoding data...")
-        re_encode.re_encode_data()
-        # 使用重新編碼後的檔案
-        data_file = "data_encoded.csv"
-    else:
-        print("⚡ Skipping data re-encoding.")
-
-    if REFRESH_DATA_TRANSFER:
-        print("🔄 Starting data transfer...")
-        data_transfer.transfer_data(input_file=data_file)
-
-        print("🔄 Splitting data into clusters...")
-        to_cluster.split_into_clusters()
-    else:
-        print("⚡ Skipping data transfer and clustering.")
-
-    if REGENERATE_SUMMARY:
-        print("🔄 Generating summaries for clusters...")
-        cluster_summary.summarize_clustered_data()
-    else:
-        print("⚡ Skipping cluster summary generation.")
-
-    if REGENERATE_CLUSTER_COMPARISON:
-        print("🔍 Comparing clusters within each Depth and Epoch...")
-        cluster_checker.analyze_clusters()
-    else:
-        print("⚡ Skipping cluster comparison.")
-
-    if REGENERATE_EPOCH_COMPARISON:
-        print("🔍 Comparing Epochs within each Depth...")
-        epoch_comparison.summarize_depths()
-    else:
-        print("⚡ Skipping epoch comparison.")
-
-    if REGENERATE_DEPTH_SUMMARY:
-        print("🔍 Generating depth-wide summary...")
-        epoch_comparison.summarize_depths()
-    else:
-        print("⚡ Skipping depth-wide summary.")
-
-    if REGENERATE_DEPTH_COMPARISON:
-        print("🔍 Comparing all Depths...")
-        depth_comparison.compare_depths()
-    else:
-        print("⚡ Skipping depth comparison.")
-
-    print("✅ Processing complete!")
-    return "Processing complete!"
+import browser
+from pipeline import PipelineConfig, run_pipeline
+
+# 所有 run 的輸出根目錄，每次處理都會建立獨立的 run 目錄
+WORKSPACE_ROOT = "runs"
+
+# 設定是否將中間產物放在 RAM-disk / tmpfs
+INTERMEDIATES_IN_MEMORY = False
+
+def main(data_file, stages):
+    # 若 data_file 為 None，則使用預設的輸入檔
+    config = PipelineConfig(
+        input_file=data_file or PipelineConfig.input_file,
+        stages=stages,
+        output_root=WORKSPACE_ROOT,
+        intermediates_in_memory=INTERMEDIATES_IN_MEMORY,
+    )
+    ws = run_pipeline(config)
+    return f"Processing complete! Results saved in {ws.run_dir}"
 
 def process_data(uploaded_file, use_encoded_data, refresh_data_transfer, regenerate_summary,
                  regenerate_cluster_comparison, regenerate_epoch_comparison,
                  regenerate_depth_summary, regenerate_depth_comparison):
-    global USE_ENCODED_DATA, REFRESH_DATA_TRANSFER, REGENERATE_SUMMARY
-    global REGENERATE_CLUSTER_COMPARISON, REGENERATE_EPOCH_COMPARISON
-    global REGENERATE_DEPTH_SUMMARY, REGENERATE_DEPTH_COMPARISON
-
-    USE_ENCODED_DATA = use_encoded_data
-    REFRESH_DATA_TRANSFER = refresh_data_transfer
-    REGENERATE_SUMMARY = regenerate_summary
-    REGENERATE_CLUSTER_COMPARISON = regenerate_cluster_comparison
-    REGENERATE_EPOCH_COMPARISON = regenerate_epoch_comparison
-    REGENERATE_DEPTH_SUMMARY = regenerate_depth_summary
-    REGENERATE_DEPTH_COMPARISON = regenerate_depth_comparison
+    # 將勾選的旗標轉為要執行的階段（Epoch Comparison 與 Depth Summary 為同一個階段）
+    flags = [
+        ("encode", use_encoded_data),
+        ("transfer", refresh_data_transfer),
+        ("metrics", refresh_data_transfer),
+        ("matching", refresh_data_transfer),
+        ("anomalies", refresh_data_transfer),
+        ("summary", regenerate_summary),
+        ("cluster-comparison", regenerate_cluster_comparison),
+        ("epoch-comparison", regenerate_epoch_comparison or regenerate_depth_summary),
+        ("depth-comparison", regenerate_depth_comparison),
+        ("report", True),
+    ]
+    stages = [stage for stage, enabled in flags if enabled]
 
     # 檢查是否有上傳檔案
     data_file_path = None
     if uploaded_file is not None:
-        # 使用 binary 模式，上傳的檔案內容會是 bytes 物件
-        data_file_path = "uploaded_data.csv"
-        with open(data_file_path, "wb") as f:
-            f.write(uploaded_file)
-        print(f"Uploaded file saved as {data_file_path}")
+        # 使用 filepath 模式，Gradio 已將上傳內容串流寫入每個 session 各自的暫存檔，直接讀取該檔案
+        # （不複製到共用的固定檔名，同時處理的多個 session 不會互相覆蓋輸入）
+        data_file_path = uploaded_file
+        print(f"Using uploaded file {data_file_path}")
     else:
-        print("No file uploaded, using default 'data.csv'.")
-
-    return main(data_file_path)
+        print(f"No file uploaded, using default '{PipelineConfig.input_file}'.")
+
+    return main(data_file_path, stages)
+
+# 結果瀏覽：Depth / Epoch 下拉選單中代表「不篩選」的選項
+ALL_OPTION = "全部"
+
+def parse_option(value):
+    return None if value in (None, "", ALL_OPTION) else int(value)
+
+def list_page(run_id, kind, depth, epoch, page):
+    """更新目前這一頁的產物清單與 Depth / Epoch 選項"""
+    if not run_id:
+        return gr.update(choices=[], value=None), gr.update(), gr.update(), 1, "No runs found."
+    result = browser.browse(run_id, kind, parse_option(depth), parse_option(epoch), page, root=WORKSPACE_ROOT)
+    names = [entry["path"] for entry in result["entries"]]
+    depth_choices = [ALL_OPTION] + [str(d) for d in result["depths"]]
+    epoch_choices = [ALL_OPTION] + [str(e) for e in result["epochs"]]
+    info = f"Page {result['page']} / {result['pages']} ({result['total']} artifact(s))"
+    return (gr.update(choices=names, value=names[0] if names else None),
+            gr.update(choices=depth_choices, value=depth if depth in depth_choices else ALL_OPTION),
+            gr.update(choices=epoch_choices, value=epoch if epoch in epoch_choices else ALL_OPTION),
+            result["page"], info)
+
+def refresh_runs(run_id):
+    runs = browser.run_ids(WORKSPACE_ROOT)
+    return gr.update(choices=runs, value=run_id if run_id in runs else (runs[0] if runs else None))
+
+def first_page(run_id, kind, depth, epoch):
+    # 切換 run、產物類型或篩選條件時回到第一頁
+    return list_page(run_id, kind, depth, epoch, 1)
+
+def show_artifact(run_id, kind, name, row_page):
+    """顯示選取的產物：文字產物轉為 HTML，CSV 只讀取目前這一頁的資料列"""
+    entry = browser.find_artifact(run_id, kind, name, root=WORKSPACE_ROOT) if run_id and name else None
+    if entry is None:
+        return "", gr.update(value=None, visible=False), 1, ""
+    if not entry["path"].endswith(".csv"):
+        return browser.render_artifact(entry["full_path"]), gr.update(value=None, visible=False), 1, ""
+    df, page, pages = browser.preview_csv(entry, row_page)
+    note = f"> Alias of `{entry['alias_of']}`\n\n" if entry.get("alias_of") else ""
+    return note, gr.update(value=df, visible=True), page, f"Rows page {page} / {pages}"
+
+def show_first_rows(run_id, kind, name):
+    return show_artifact(run_id, kind, name, 1)
+
+def build_browser():
+    with gr.Blocks() as results:
+        runs = browser.run_ids(WORKSPACE_ROOT)
+        with gr.Row():
+            run_id = gr.Dropdown(label="Run", choices=runs, value=runs[0] if runs else None)
+            kind = gr.Dropdown(label="產物類型", choices=list(browser.ARTIFACT_KINDS), value="Cluster Summary")
+            depth = gr.Dropdown(label="Depth", choices=[ALL_OPTION], value=ALL_OPTION)
+            epoch = gr.Dropdown(label="Epoch", choices=[ALL_OPTION], value=ALL_OPTION)
+        with gr.Row():
+            page = gr.Number(label="頁數", value=1, precision=0)
+            page_info = gr.Markdown()
+            refresh = gr.Button("重新整理")
+        artifact = gr.Dropdown(label="產物", choices=[])
+        content = gr.HTML()
+        with gr.Row():
+            row_page = gr.Number(label="資料列頁數", value=1, precision=0)
+            row_info = gr.Markdown()
+        table = gr.Dataframe(visible=False, interactive=False)
+
+        filters = [run_id, kind, depth, epoch]
+        listing_outputs = [artifact, depth, epoch, page, page_info]
+        for trigger in (run_id.change, kind.change, depth.change, epoch.change):
+            trigger(first_page, inputs=filters, outputs=listing_outputs)
+        for trigger in (page.submit, refresh.click):
+            trigger(list_page, inputs=filters + [page], outputs=listing_outputs)
+        refresh.click(refresh_runs, inputs=run_id, outputs=run_id)
+        artifact_outputs = [content, table, row_page, row_info]
+        artifact.change(show_first_rows, inputs=[run_id, kind, artifact], outputs=artifact_outputs)
+        row_page.submit(show_artifact, inputs=[run_id, kind, artifact, row_page], outputs=artifact_outputs)
+        results.load(first_page, inputs=filters, outputs=listing_outputs)
+    return results
 
 iface = gr.Interface(
     fn=process_data,
     inputs=[
-        gr.File(label="上傳 CSV 檔案 (非必要)", type="binary"),
+        gr.File(label="上傳 CSV 檔案 (非必要)", type="filepath"),
         gr.Checkbox(label="使用重新編碼", value=True),
         gr.Checkbox(label="重新處理 Data Transfer (檢查是否有新 data.csv)", value=True),
         gr.Checkbox(label="重新產生 Cluster Summary", value=True),
@@ -118,5 +142,7 @@ iface = gr.Interface(
     description="請上傳 CSV 檔案（選擇性），並調整旗標設定以啟動資料處理流程。"
 )
 
+app = gr.TabbedInterface([iface, build_browser()], ["資料處理流程", "結果瀏覽"])
+
 if __name__ == "__main__":
-    iface.launch()
+    app.launch()
@@ -1,83 +1,69 @@
-import os
-import agents.reEncode as re_encode
-import agents.dataTransferringAgent as data_transfer
-import agents.toClustered as to_cluster
-import agents.clusterSummary as cluster_summary
-import agents.clusterChecker as cluster_checker
-import agents.epochComparison as epoch_comparison
-import agents.depthComparison as depth_comparison  # 新增
+import argparse
+
+from llm import BACKENDS
+from pipeline import STAGES, PipelineConfig, run_pipeline
+
+# 預設值集中在 PipelineConfig，這裡只負責把命令列參數轉成設定
+DEFAULTS = PipelineConfig()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the quantum clustering analysis pipeline.")
+    parser.add_argument("--input", dest="input_file", default=DEFAULTS.input_file,
+                        help="clustered results CSV (default: %(default)s)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=DEFAULTS.stages,
+                        help="stages to run, in pipeline order (default: all)")
+    parser.add_argument("--skip", nargs="+", choices=STAGES, default=[],
+                        help="stages to skip")
+    parser.add_argument("--output-root", default=DEFAULTS.output_root,
+                        help="root directory for run workspaces (default: %(default)s)")
+    parser.add_argument("--run-id", help="reuse an existing run instead of creating a new one")
+    parser.add_argument("--intermediates-in-memory", action="store_true",
+                        help="place output_csv / clustered_csv on tmpfs")
+    parser.add_argument("--discard-intermediates", action="store_true",
+                        help="remove intermediates when the run finishes")
+    parser.add_argument("--concurrency", type=int, default=DEFAULTS.concurrency,
+                        help="concurrent LLM calls per stage (default: %(default)s)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULTS.backend,
+                        help="LLM backend (default: %(default)s, or $LLM_BACKEND)")
+    parser.add_argument("--model", help="model name (default: the backend's default model)")
+    parser.add_argument("--request-timeout", type=float, default=DEFAULTS.request_timeout,
+                        help="LLM request timeout in seconds (default: %(default)s)")
+    parser.add_argument("--cache-dir", help="cache LLM responses in this directory")
+    parser.add_argument("--depths", nargs="+", type=int, help="only process these depths")
+    parser.add_argument("--epochs", nargs="+", type=int, help="only process these epochs")
+    parser.add_argument("--epoch-range", nargs=2, type=int, metavar=("FIRST", "LAST"),
+                        help="only process epochs in this inclusive range")
+    parser.add_argument("--clusters", nargs="+", type=int, help="only process these cluster IDs")
+    parser.add_argument("--min-cluster-size", type=int, default=DEFAULTS.min_cluster_size,
+                        help="skip clusters with fewer transactions than this")
+    parser.add_argument("--report-pdf", action="store_true", help="also render the run report as PDF")
+    args = parser.parse_args(argv)
+
+    return PipelineConfig(
+        input_file=args.input_file,
+        stages=[stage for stage in args.stages if stage not in args.skip],
+        output_root=args.output_root,
+        run_id=args.run_id,
+        intermediates_in_memory=args.intermediates_in_memory,
+        discard_intermediates=args.discard_intermediates,
+        concurrency=args.concurrency,
+        backend=args.backend,
+        model=args.model,
+        request_timeout=args.request_timeout,
+        cache_dir=args.cache_dir,
+        depths=args.depths,
+        epochs=args.epochs,
+        epoch_range=tuple(args.epoch_range) if args.epoch_range else None,
+        cluster_ids=args.clusters,
+        min_cluster_size=args.min_cluster_size,
+        report_pdf=args.report_pdf,
+    )
+
+
+def main(argv=None):
+    return run_pipeline(parse_args(argv))
 
-# 設定是否使用重新編碼
-USE_ENCODED_DATA = True
-
-# 設定是否重新處理 Data Transfer（檢查是否有新 data.csv）
-REFRESH_DATA_TRANSFER = True
-
-# 設定是否重新產生 Cluster Summary
-REGENERATE_SUMMARY = True
-
-# 設定是否重新產生 Cluster Comparison
-REGENERATE_CLUSTER_COMPARISON = True
-
-# 設定是否重新產生 Epoch Comparison
-REGENERATE_EPOCH_COMPARISON = True
-
-# 設定是否重新產生 Depth Summary
-REGENERATE_DEPTH_SUMMARY = True
-
-# 設定是否重新產生 Depth Comparison
-REGENERATE_DEPTH_COMPARISON = True
-
-def main():
-    data_file = "data.csv"
-
-    if USE_ENCODED_DATA:
-        print("🔄 Re-encoding data...")
-        re_encode.re_encode_data()
-        data_file = "data_encoded.csv"  # 使用重新編碼後的資料
-    else:
-        print("⚡ Skipping data re-encoding.")
-
-    if REFRESH_DATA_TRANSFER:
-        print("🔄 Starting data transfer...")
-        data_transfer.transfer_data(input_file=data_file)
-
-        print("🔄 Splitting data into clusters...")
-        to_cluster.split_into_clusters()
-    else:
-        print("⚡ Skipping data transfer and clustering.")
-
-    if REGENERATE_SUMMARY:
-        print("🔄 Generating summaries for clusters...")
-        cluster_summary.summarize_clustered_data()
-    else:
-        print("⚡ Skipping cluster summary generation.")
-
-    if REGENERATE_CLUSTER_COMPARISON:
-        print("🔍 Comparing clusters within each Depth and Epoch...")
-        cluster_checker.analyze_clusters()
-    else:
-        print("⚡ Skipping cluster comparison.")
-
-    if REGENERATE_EPOCH_COMPARISON:
-        print("🔍 Comparing Epochs within each Depth...")
-        epoch_comparison.summarize_depths()
-    else:
-        print("⚡ Skipping epoch comparison.")
-
-    if REGENERATE_DEPTH_SUMMARY:
-        print("🔍 Generating depth-wide summary...")
-        epoch_comparison.summarize_depths()
-    else:
-        print("⚡ Skipping depth-wide summary.")
-
-    if REGENERATE_DEPTH_COMPARISON:
-        print("🔍 Comparing all Depths...")
-        depth_comparison.compare_depths()
-    else:
-        print("⚡ Skipping depth comparison.")
-
-    print("✅ Processing complete!")
 
 if __name__ == "__main__":
     main()
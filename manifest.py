@@ -0,0 +1,246 @@
+# manifest.py
+
+import io
+import os
+import glob
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from selection import ALL
+from workspace import artifact_keys
+
+# 每個階段輸出目錄下的產物清單
+MANIFEST_FILE = "manifest.json"
+
+# 多個行程（或共用檔案系統的多台機器）同時更新 manifest 時使用的鎖檔
+LOCK_TIMEOUT = 60
+STALE_LOCK_SECONDS = 30
+
+# 寫出 CSV 產物時每次轉換的資料列數
+CSV_CHUNK_ROWS = 100000
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_lock_owner(lock_path):
+    """鎖檔內記錄的持有者 token，鎖檔不存在時回傳 None"""
+    try:
+        with open(lock_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def break_stale_lock(lock_path, token):
+    """移除持有者已異常結束的過期鎖檔，回傳是否應立即重新嘗試取得鎖；
+    先將鎖檔改名（只有一個等待者會成功）再確認持有者未變，避免兩個等待者都移除鎖、或誤刪剛建立的新鎖"""
+    try:
+        if time.time() - os.path.getmtime(lock_path) <= STALE_LOCK_SECONDS:
+            return False
+        owner = read_lock_owner(lock_path)
+        claimed = f"{lock_path}.{token.rsplit(':', 1)[-1]}.stale"
+        os.rename(lock_path, claimed)
+    except OSError:
+        # 鎖檔已被釋放或由其他等待者處理
+        return True
+    if read_lock_owner(claimed) != owner:
+        # 改名前鎖已換了新的持有者，放回原位（已有其他鎖檔時不覆蓋）
+        try:
+            os.link(claimed, lock_path)
+        except OSError:
+            pass
+    os.remove(claimed)
+    return True
+
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """以 O_EXCL 建立鎖檔的跨行程鎖（不依賴 fcntl，Windows 與網路檔案系統皆可使用），鎖檔內記錄持有者的 token"""
+    lock_path = f"{path}.lock"
+    token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if break_stale_lock(lock_path, token):
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"Timed out waiting for {lock_path}")
+            time.sleep(0.05)
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(token)
+        break
+    try:
+        yield
+    finally:
+        # 只移除自己的鎖檔；持有過久被判定過期時，鎖可能已屬於其他行程
+        if read_lock_owner(lock_path) == token:
+            os.remove(lock_path)
+
+
+def sort_key(entry):
+    """依 (depth, epoch, cluster) 數值排序，缺少的部分排在最前面"""
+    return tuple(-1 if entry.get(key) is None else entry[key] for key in ("depth", "epoch", "cluster"))
+
+
+class Manifest:
+    """記錄一個階段輸出目錄內的所有產物（路徑、depth / epoch / cluster、筆數、內容雜湊），供下一個階段直接讀取"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        # 沿用既有的清單，只重新執行部分 Depth / Epoch 時不會遺失其他產物
+        self._entries = self._load()
+        # (depth, epoch, cluster) -> 產物，讓 get() 不必逐一掃描所有紀錄
+        self._by_keys = self._index(self._entries)
+        # 這個實例新增或更新過的產物，儲存時只覆蓋這些紀錄
+        self._dirty = set()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return {entry["path"]: entry for entry in json.load(f)["artifacts"]}
+
+    @staticmethod
+    def _index(entries):
+        index = {}
+        for entry in entries.values():
+            index.setdefault((entry["depth"], entry["epoch"], entry["cluster"]), entry)
+        return index
+
+    def add(self, path, depth=None, epoch=None, cluster=None, rows=None, sha256=None, **extra):
+        """登記一個產物；未提供 depth / epoch / cluster 時從檔名解析"""
+        name = os.path.basename(path)
+        if depth is None and epoch is None and cluster is None:
+            depth, epoch, cluster = artifact_keys(name)
+        entry = {"path": name, "depth": depth, "epoch": epoch, "cluster": cluster, "rows": rows, "sha256": sha256, **extra}
+        key = (depth, epoch, cluster)
+        with self._lock:
+            previous = self._entries.get(name)
+            self._entries[name] = entry
+            self._dirty.add(name)
+            if previous is not None and (previous["depth"], previous["epoch"], previous["cluster"]) != key:
+                # 同一個檔名改登記為不同的 depth / epoch / cluster（很少見），重建索引
+                self._by_keys = self._index(self._entries)
+            elif key not in self._by_keys or self._by_keys[key]["path"] == name:
+                self._by_keys[key] = entry
+        return entry
+
+    def save(self):
+        """與磁碟上的清單合併後依數值順序寫出，其他行程同時登記的產物不會被覆蓋"""
+        with self._lock, file_lock(self.path):
+            entries = self._load()
+            entries.update({name: self._entries[name] for name in self._dirty})
+            self._entries = entries
+            self._by_keys = self._index(entries)
+            self._dirty.clear()
+            artifacts = sorted(entries.values(), key=sort_key)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"artifacts": artifacts}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def lookup(self, path):
+        """依檔名取得產物的紀錄，不存在時回傳 None"""
+        with self._lock:
+            return self._entries.get(os.path.basename(path))
+
+    def get(self, depth=None, epoch=None, cluster=None):
+        """依 (depth, epoch, cluster) 取得產物的紀錄，不存在時回傳 None"""
+        with self._lock:
+            return self._by_keys.get((depth, epoch, cluster))
+
+    def entries(self, selection=ALL):
+        """被選取且檔案仍存在的產物，依 depth / epoch / cluster 數值排序，並附上完整路徑 full_path"""
+        selected = []
+        for entry in sorted(self._entries.values(), key=sort_key):
+            # 別名產物一律指向被引用的產物；別名檔名下殘留的舊檔案（例如先前的 run 寫出的）不予採用
+            full_path = os.path.join(self.directory, entry.get("alias_of") or entry["path"])
+            if not selection.match_artifact(entry["path"]) or not os.path.exists(full_path):
+                continue
+            if entry["cluster"] is not None and entry.get("rows") is not None \
+                    and not selection.match_cluster(entry["cluster"], entry["rows"]):
+                continue
+            selected.append({**entry, "full_path": full_path})
+        return selected
+
+
+def discover(directory, pattern, selection=ALL):
+    """讀取上一個階段的產物清單；目錄內沒有 manifest.json（舊的輸出或手動放入的檔案）時才掃描目錄"""
+    if os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return Manifest(directory).entries(selection)
+    entries = []
+    for full_path in glob.glob(os.path.join(directory, pattern)):
+        name = os.path.basename(full_path)
+        if not selection.match_artifact(name):
+            continue
+        depth, epoch, cluster = artifact_keys(name)
+        entries.append({"path": name, "depth": depth, "epoch": epoch, "cluster": cluster, "rows": None,
+                        "sha256": None, "full_path": full_path})
+    return sorted(entries, key=sort_key)
+
+
+def write_text_artifact(manifest, path, text, **keys):
+    """寫出文字產物並登記到 manifest"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return manifest.add(path, sha256=sha256_text(text), **keys)
+
+
+def write_alias_artifact(manifest, path, source_path, note, rewrite=None, **keys):
+    """重複使用另一個產物的內容：寫出「說明 + 原內容」的檔案（rewrite 可改寫原內容），並在 manifest 記錄 reused_from；
+    與 alias_of 不同，此產物有自己的檔案"""
+    with open(source_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    text = f"{note}\n\n{rewrite(content) if rewrite else content}"
+    return write_text_artifact(manifest, path, text, reused_from=os.path.basename(source_path), **keys)
+
+
+class HashingWriter(io.TextIOBase):
+    """寫入底層二進位檔案的同時計算 sha256，不需保留整份內容也不需重新讀檔"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.digest.update(data)
+        self.raw.write(data)
+        return len(text)
+
+
+def write_csv_artifact(manifest, path, df, chunk_size=CSV_CHUNK_ROWS, **keys):
+    """寫出 CSV 產物並登記筆數與雜湊：分段寫入暫存檔、邊寫邊計算雜湊，完成後再改名為正式檔名"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as raw:
+            writer = HashingWriter(raw)
+            df.to_csv(writer, index=False, chunksize=chunk_size)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return manifest.add(path, rows=len(df), sha256=writer.digest.hexdigest(), **keys)
@@ -0,0 +1,197 @@
+# pipeline.py
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import os
+import importlib
+import llm
+from usage import LEDGER_FILE, UsageLedger, load_records, write_report
+from selection import ClusterSelection
+from workspace import DEFAULT_ROOT, RunWorkspace
+
+# 依執行順序排列的所有階段
+STAGES = [
+    "encode",              # 重新編碼 Hash / From / To
+    "transfer",            # 依 Depth / Epoch 拆分，再依 Cluster 拆分
+    "metrics",             # 各 Cluster 的數值指標（大小、中心距離、silhouette、分布差異）
+    "matching",            # 相鄰 Epoch / Depth 間的 cluster 對齊（Jaccard 轉移矩陣）
+    "anomalies",           # 各 Cluster 的異常（Value 離群值、時間突增、集中的 From / To、罕見 TokenSymbol）
+    "summary",             # Cluster Summary
+    "cluster-comparison",  # 同 Depth、Epoch 內的 Cluster 比較
+    "epoch-comparison",    # 同 Depth 內的 Epoch 比較（即 Depth Summary）
+    "depth-comparison",    # 所有 Depth 的比較
+    "report",              # 將所有分析結果輸出為一份 HTML（/PDF）報告
+]
+
+# 各階段實作所在的模組；只在該階段真的要執行時才 import（pandas / numpy / llama_index 等都很慢）
+STAGE_MODULES = {
+    "encode": "agents.reEncode",
+    "transfer": ("agents.dataTransferringAgent", "agents.toClustered"),
+    "metrics": "agents.clusterMetrics",
+    "matching": "agents.clusterMatching",
+    "anomalies": "agents.clusterAnomalies",
+    "summary": "agents.clusterSummary",
+    "cluster-comparison": "agents.clusterChecker",
+    "epoch-comparison": "agents.epochComparison",
+    "depth-comparison": "agents.depthComparison",
+    "report": "report",
+}
+
+
+def load_stage(stage):
+    """import 某個階段的模組（transfer 由兩個模組組成，回傳 tuple）"""
+    names = STAGE_MODULES[stage]
+    if isinstance(names, tuple):
+        return tuple(importlib.import_module(name) for name in names)
+    return importlib.import_module(names)
+
+
+@dataclass
+class PipelineConfig:
+    """pipeline 的完整設定，可由 CLI、Gradio 或其他程式建立"""
+    # 與原本 re_encode_data 預設讀取的檔案相同（量子模型輸出的分群結果）
+    input_file: str = "kmeans_clustered_results.csv"
+    stages: List[str] = field(default_factory=lambda: list(STAGES))
+    output_root: str = DEFAULT_ROOT
+    run_id: Optional[str] = None
+    intermediates_in_memory: bool = False
+    discard_intermediates: bool = False
+    concurrency: int = 1
+    backend: str = llm.DEFAULT_BACKEND
+    model: Optional[str] = None  # None 代表使用 backend 的預設模型
+    request_timeout: float = llm.REQUEST_TIMEOUT
+    cache_dir: Optional[str] = None
+    depths: Optional[List[int]] = None
+    epochs: Optional[List[int]] = None
+    epoch_range: Optional[Tuple[int, int]] = None
+    cluster_ids: Optional[List[int]] = None
+    min_cluster_size: int = 0
+    report_pdf: bool = False
+
+    def __post_init__(self):
+        unknown = [stage for stage in self.stages if stage not in STAGES]
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {', '.join(unknown)}. Choose from: {', '.join(STAGES)}")
+        if self.concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+    def selection(self) -> ClusterSelection:
+        """將篩選條件轉為各階段共用的 ClusterSelection"""
+        epoch_min, epoch_max = self.epoch_range or (None, None)
+        return ClusterSelection(
+            depths=set(self.depths) if self.depths is not None else None,
+            epochs=set(self.epochs) if self.epochs is not None else None,
+            epoch_min=epoch_min,
+            epoch_max=epoch_max,
+            cluster_ids=set(self.cluster_ids) if self.cluster_ids is not None else None,
+            min_cluster_size=self.min_cluster_size,
+        )
+
+
+def run_pipeline(config: PipelineConfig) -> RunWorkspace:
+    """依設定執行各階段，回傳本次 run 的 workspace"""
+    ws = RunWorkspace(config.output_root, run_id=config.run_id, intermediates_in_memory=config.intermediates_in_memory)
+    llm.configure(backend=config.backend, model=config.model, request_timeout=config.request_timeout,
+                  llm_cache_dir=config.cache_dir, ledger=UsageLedger(os.path.join(ws.run_dir, LEDGER_FILE)))
+    stages = set(config.stages)
+    selection = config.selection()
+    data_file = config.input_file
+    print(f"📄 Input file: {data_file}")
+    print(f"📁 Run directory: {ws.run_dir}")
+
+    if "encode" in stages:
+        print("🔄 Re-encoding data...")
+        re_encode = load_stage("encode")
+        re_encode.re_encode_data(input_file=data_file, output_file=ws.encoded_file, map_file=ws.map_file,
+                                 selection=selection)
+        data_file = ws.encoded_file  # 使用重新編碼後的資料
+    else:
+        print("⚡ Skipping data re-encoding.")
+
+    if "transfer" in stages:
+        data_transfer, to_cluster = load_stage("transfer")
+        print("🔄 Starting data transfer...")
+        data_transfer.transfer_data(input_file=data_file, output_dir=ws.output_csv, selection=selection)
+
+        print("🔄 Splitting data into clusters...")
+        to_cluster.split_into_clusters(input_dir=ws.output_csv, output_dir=ws.clustered_csv, selection=selection)
+    else:
+        print("⚡ Skipping data transfer and clustering.")
+
+    if "metrics" in stages:
+        print("📐 Computing cluster quality metrics...")
+        cluster_metrics = load_stage("metrics")
+        cluster_metrics.compute_cluster_metrics(input_file=data_file, output_dir=ws.cluster_metrics, selection=selection)
+    else:
+        print("⚡ Skipping cluster metrics.")
+
+    if "matching" in stages:
+        print("📐 Matching clusters across Epochs and Depths...")
+        cluster_matching = load_stage("matching")
+        cluster_matching.compute_cluster_matching(input_file=data_file, output_dir=ws.cluster_matching, selection=selection)
+    else:
+        print("⚡ Skipping cluster matching.")
+
+    if "anomalies" in stages:
+        print("🚩 Detecting anomalies in every cluster...")
+        cluster_anomalies = load_stage("anomalies")
+        cluster_anomalies.compute_cluster_anomalies(input_file=data_file, output_dir=ws.cluster_anomalies,
+                                                    selection=selection)
+    else:
+        print("⚡ Skipping anomaly detection.")
+
+    if "summary" in stages:
+        print("🔄 Generating summaries for clusters...")
+        cluster_summary = load_stage("summary")
+        cluster_summary.summarize_clustered_data(input_dir=ws.clustered_csv, output_dir=ws.cluster_summary,
+                                                 max_workers=config.concurrency, selection=selection,
+                                                 anomalies_dir=ws.cluster_anomalies)
+    else:
+        print("⚡ Skipping cluster summary generation.")
+
+    if "cluster-comparison" in stages:
+        print("🔍 Comparing clusters within each Depth and Epoch...")
+        cluster_checker = load_stage("cluster-comparison")
+        cluster_checker.analyze_clusters(input_dir=ws.cluster_summary, output_dir=ws.cluster_analysis,
+                                         max_workers=config.concurrency, selection=selection,
+                                         metrics_dir=ws.cluster_metrics)
+    else:
+        print("⚡ Skipping cluster comparison.")
+
+    if "epoch-comparison" in stages:
+        print("🔍 Comparing Epochs within each Depth...")
+        epoch_comparison = load_stage("epoch-comparison")
+        epoch_comparison.summarize_depths(input_dir=ws.cluster_analysis, output_dir=ws.epoch_summary,
+                                          max_workers=config.concurrency, selection=selection,
+                                          matching_dir=ws.cluster_matching)
+    else:
+        print("⚡ Skipping epoch comparison.")
+
+    if "depth-comparison" in stages:
+        print("🔍 Comparing all Depths...")
+        depth_comparison = load_stage("depth-comparison")
+        depth_comparison.compare_depths(input_dir=ws.epoch_summary, output_dir=ws.depth_comparison,
+                                        matching_dir=ws.cluster_matching)
+    else:
+        print("⚡ Skipping depth comparison.")
+
+    if "report" in stages:
+        print("📝 Rendering report...")
+        report = load_stage("report")
+        report.render_report(ws, pdf=config.report_pdf)
+    else:
+        print("⚡ Skipping report rendering.")
+
+    # 彙總本次 run 的 LLM 用量（tokens/sec、延遲百分位數）
+    ledger_file = os.path.join(ws.run_dir, LEDGER_FILE)
+    if os.path.exists(ledger_file):
+        report_file = write_report(load_records([ledger_file]), ws.path("usageReport"))
+        print(f"📊 Saved usage report: {report_file}")
+
+    ws.mark_latest()
+    if config.discard_intermediates:
+        ws.discard_intermediates()
+
+    print("✅ Processing complete!")
+    return ws
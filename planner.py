@@ -0,0 +1,365 @@
+# planner.py
+
+import os
+import glob
+import math
+import argparse
+from collections import defaultdict
+
+import llm
+from main import parse_args
+from manifest import discover
+from pipeline import load_stage
+from schema import BASE_COLUMNS, parse_timestamp, read_header, read_table
+from usage import LEDGER_FILE, load_records
+from workspace import RunWorkspace, artifact_keys
+from agents.evidence import format_evidence, format_transitions, load_anomalies, load_matching, load_metrics
+
+# 需要呼叫 LLM 的階段（依執行順序）
+LLM_STAGES = ["summary", "cluster-comparison", "epoch-comparison", "depth-comparison"]
+
+# 沒有 tokenizer 時的粗估：英數字約 4 個字元一個 token，中文等非 ASCII 字元約一字一個 token
+CHARS_PER_TOKEN = 4
+
+# 各 backend 預設的 context window（llama_index 的 Ollama 預設 num_ctx 為 3900）
+CONTEXT_TOKENS = {"ollama": 3900, "gemini": 1048576}
+
+# 沒有用量紀錄可參考時的預設值
+DEFAULT_COMPLETION_TOKENS = 600
+DEFAULT_TOKENS_PER_SEC = 20.0
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16]
+
+
+def count_tokens(text):
+    """粗估 prompt 的 token 數"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / CHARS_PER_TOKEN) + len(text) - ascii_chars
+
+
+def placeholder(tokens):
+    """上游階段尚未產生的輸出，以相同 token 數的文字代替"""
+    return "x" * (tokens * CHARS_PER_TOKEN)
+
+
+def is_continuation(record):
+    return (record.get("artifact") or "").endswith(llm.CONTINUATION_SUFFIX)
+
+
+def average_call(items):
+    """一組呼叫的平均延遲與回應 token 數"""
+    completions = [item["completion_tokens"] for item in items if item.get("completion_tokens")]
+    return {"latency": sum(item["latency"] for item in items) / len(items),
+            "completion_tokens": round(sum(completions) / len(completions)) if completions else DEFAULT_COMPLETION_TOKENS}
+
+
+def stage_throughput(records, model=None):
+    """由用量紀錄算出各階段每次呼叫的平均延遲與回應 token 數（有同一模型的紀錄時只採用該模型），
+    以及需要續寫呼叫的比例（continuation_rate，沒有紀錄時為 None）與續寫呼叫的平均延遲與 token 數"""
+    live = [record for record in records if not record.get("cached") and record.get("latency")]
+    if model and any(record["model"] == model for record in live):
+        live = [record for record in live if record["model"] == model]
+
+    grouped = defaultdict(list)
+    continued = defaultdict(list)
+    for record in live:
+        (continued if is_continuation(record) else grouped)[record["stage"]].append(record)
+    throughput = {}
+    for stage, items in grouped.items():
+        continuations = continued[stage]
+        throughput[stage] = {**average_call(items), "continuation_rate": min(len(continuations) / len(items), 1.0),
+                             "continuation": average_call(continuations) if continuations else None}
+
+    # 沒有該階段紀錄時，以所有呼叫的平均 tokens/sec 換算延遲
+    total_latency = sum(record["latency"] for record in live)
+    total_tokens = sum(record.get("completion_tokens") or 0 for record in live)
+    tokens_per_sec = total_tokens / total_latency if total_latency and total_tokens else DEFAULT_TOKENS_PER_SEC
+    for stage in LLM_STAGES:
+        throughput.setdefault(stage, {"latency": DEFAULT_COMPLETION_TOKENS / tokens_per_sec,
+                                      "completion_tokens": DEFAULT_COMPLETION_TOKENS,
+                                      "continuation_rate": None, "continuation": None})
+        current = throughput[stage]
+        if current["continuation"] is None:
+            # 沒有續寫紀錄時，以一般呼叫的平均值代替（延遲再由 plan_run 依續寫的 token 上限等比例縮短）
+            current["continuation"] = {"latency": current["latency"], "completion_tokens": current["completion_tokens"]}
+    return throughput
+
+
+def input_clusters(config):
+    """直接從輸入檔推算每個 cluster 的筆數與摘要用的前 10 筆資料（與 encode / transfer 階段的處理相同）"""
+    selection = config.selection()
+    header = read_header(config.input_file)
+    df = read_table(config.input_file, usecols=selection.usecols(header))
+    load_stage("encode").encode_columns(df)
+    data_transfer, _ = load_stage("transfer")
+
+    partitions = {}  # (depth, 分群指紋) -> 第一個出現此分群的 Epoch
+    clusters = []
+    for column in sorted(selection.cluster_columns(df.columns), key=artifact_keys):
+        depth, epoch, _ = artifact_keys(column)
+        subset = df[BASE_COLUMNS + [column]].rename(columns={column: "Cluster_Value"})
+        if not selection.selects_all:
+            subset = subset[selection.filter_clusters(subset["Cluster_Value"])]
+        fingerprint, _ = data_transfer.partition_fingerprint(subset["Cluster_Value"])
+        source_epoch = partitions.setdefault((depth, fingerprint), epoch)
+
+        for cluster, cluster_df in subset.groupby("Cluster_Value"):
+            if not selection.match_cluster(int(cluster), len(cluster_df)):
+                continue
+            sample = cluster_df.head(10).copy()
+            sample["TimeStamp"] = parse_timestamp(sample["TimeStamp"])
+            clusters.append({"depth": depth, "epoch": epoch, "cluster": int(cluster), "rows": len(cluster_df),
+                             "sample": sample if source_epoch == epoch else None,
+                             "source_epoch": source_epoch if source_epoch != epoch else None})
+    return clusters
+
+
+def run_clusters(ws, config):
+    """從既有 run 的 clustered_csv 讀取 cluster（只讀取摘要用的前 10 筆資料）"""
+    clusters = []
+    for entry in discover(ws.locate("clustered_csv"), "Depth_*_Epoch_*_Cluster_*.csv", config.selection()):
+        alias_of = entry.get("alias_of")
+        clusters.append({"depth": entry["depth"], "epoch": entry["epoch"], "cluster": entry["cluster"],
+                         "rows": entry["rows"],
+                         "sample": None if alias_of else read_table(entry["full_path"], parse_time=True, nrows=10),
+                         "source_epoch": artifact_keys(alias_of)[1] if alias_of else None})
+    return clusters
+
+
+def existing_text(directory, filename, tokens):
+    """讀取上游階段已產生的輸出，不存在時以預估長度的文字代替"""
+    path = os.path.join(directory, filename) if directory else None
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return placeholder(tokens)
+
+
+def build_calls(clusters, stages, throughput, ws=None):
+    """建立每個 LLM 呼叫的 prompt（不呼叫模型），回傳 [(stage, 產物檔名, prompt)]"""
+    def path(name):
+        return ws.locate(name) if ws else None
+
+    calls = []
+    if "summary" in stages:
+        cluster_summary = load_stage("summary")
+        for c in clusters:
+            if c["sample"] is not None:
+                anomalies = load_anomalies(path("clusterAnomalies"), c["depth"], c["epoch"], c["cluster"])
+                calls.append(("summary", f"summary_Depth_{c['depth']}_Epoch_{c['epoch']}_Cluster_{c['cluster']}.txt",
+                              cluster_summary.build_prompt(c["sample"], anomalies)))
+
+    groups = defaultdict(list)
+    reused = set()
+    for c in clusters:
+        groups[(c["depth"], c["epoch"])].append(c)
+        if c["source_epoch"] is not None:
+            reused.add((c["depth"], c["epoch"]))
+
+    if "cluster-comparison" in stages:
+        cluster_checker = load_stage("cluster-comparison")
+        summary_tokens = throughput["summary"]["completion_tokens"]
+        for (depth, epoch), members in sorted(groups.items()):
+            if (depth, epoch) in reused:
+                continue
+            summaries = []
+            for c in members:
+                filename = f"summary_Depth_{depth}_Epoch_{epoch}_Cluster_{c['cluster']}.txt"
+                summaries.append(f"📌 **Cluster {c['cluster']} Summary:**\n"
+                                 f"{existing_text(path('clusterSummary'), filename, summary_tokens)}\n")
+            metrics = load_metrics(path("clusterMetrics"), depth, epoch)
+            calls.append(("cluster-comparison", f"analysis_Depth_{depth}_Epoch_{epoch}.txt",
+                          cluster_checker.build_prompt(depth, epoch, summaries,
+                                                       format_evidence(metrics) if metrics else None)))
+
+    depths = sorted({depth for depth, _ in groups})
+    if "epoch-comparison" in stages:
+        epoch_comparison = load_stage("epoch-comparison")
+        analysis_tokens = throughput["cluster-comparison"]["completion_tokens"]
+        for depth in depths:
+            analyses = []
+            for epoch in sorted(epoch for d, epoch in groups if d == depth):
+                filename = f"analysis_Depth_{depth}_Epoch_{epoch}.txt"
+                analyses.append(f"📌 **Epoch {epoch} Analysis:**\n"
+                                f"{existing_text(path('clusterAnalysis'), filename, analysis_tokens)}\n")
+            matching = load_matching(path("clusterMatching"), depth)
+            calls.append(("epoch-comparison", f"summary_Depth_{depth}.txt",
+                          epoch_comparison.build_prompt(depth, analyses, format_transitions(matching) if matching else None)))
+
+    if "depth-comparison" in stages and depths:
+        depth_tokens = throughput["epoch-comparison"]["completion_tokens"]
+        summaries = [f"📌 **Depth {depth} Summary:**\n"
+                     f"{existing_text(path('epochSummary'), 'summary_Depth_%d.txt' % depth, depth_tokens)}\n"
+                     for depth in depths]
+        calls.append(("depth-comparison", "final_summary.txt",
+                      load_stage("depth-comparison").build_prompt(summaries, load_matching(path("clusterMatching")))))
+    return calls
+
+
+def continuation_call(stage, artifact, prompt, completion_tokens, throughput, limits, backend, cache_dir, response=None):
+    """回應缺少必要段落時的續寫呼叫：已快取的回應可直接檢查，其餘依用量紀錄中的續寫比例估算 probability"""
+    stage_limits = limits[stage]
+    if response is not None:
+        missing = llm.missing_sections(response, stage_limits.required)
+        if not missing:
+            return None
+        prompt = llm.continuation_prompt(prompt, response, missing)
+        path = llm.cache_path(prompt, backend, stage_limits.continuation_tokens, stage_limits.stop, cache_dir)
+        probability = 1.0
+        prompt_tokens = count_tokens(prompt)
+    else:
+        path = None
+        probability = throughput[stage]["continuation_rate"] or 0.0
+        # 續寫的 prompt 包含原 prompt 與截斷的回應
+        prompt_tokens = count_tokens(prompt) + completion_tokens
+    if not stage_limits.required or not probability:
+        return None
+    continuation = throughput[stage]["continuation"]
+    tokens = min(continuation["completion_tokens"], stage_limits.continuation_tokens)
+    return {
+        "stage": stage,
+        "artifact": f"{artifact}{llm.CONTINUATION_SUFFIX}",
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": tokens,
+        "cached": bool(path and os.path.exists(path)),
+        "latency": continuation["latency"] * tokens / max(continuation["completion_tokens"], 1),
+        "probability": probability,
+    }
+
+
+def plan_run(config, records=(), context_tokens=None, ws=None):
+    """不呼叫模型，估算每個 LLM 呼叫的 prompt / 回應 token 數、是否命中快取、預估延遲與是否超過 context window；
+    只讀取快取，不設定 llm 的全域狀態也不建立任何目錄"""
+    backend = llm.get_backend(config.backend, config.model)
+    throughput = stage_throughput(records, backend.model)
+    clusters = run_clusters(ws, config) if ws else input_clusters(config)
+    stages = [stage for stage in LLM_STAGES if stage in config.stages]
+
+    # 回應長度不會超過各階段的 max_tokens（續寫呼叫另計）
+    limits = {stage: load_stage(stage).LIMITS for stage in LLM_STAGES}
+    for stage, stage_limits in limits.items():
+        if stage_limits.max_tokens:
+            throughput[stage]["completion_tokens"] = min(throughput[stage]["completion_tokens"], stage_limits.max_tokens)
+
+    calls = []
+    for stage, artifact, prompt in build_calls(clusters, stages, throughput, ws):
+        path = llm.cache_path(prompt, backend, limits[stage].max_tokens, limits[stage].stop, config.cache_dir)
+        cached = bool(path and os.path.exists(path))
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = throughput[stage]["completion_tokens"]
+        calls.append({
+            "stage": stage,
+            "artifact": artifact,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached": cached,
+            "latency": throughput[stage]["latency"],
+            "probability": 1.0,
+        })
+        response = None
+        if cached:
+            with open(path, "r", encoding="utf-8") as f:
+                response = f.read()
+        continuation = continuation_call(stage, artifact, prompt, completion_tokens, throughput, limits, backend,
+                                         config.cache_dir, response)
+        if continuation:
+            calls.append(continuation)
+    for call in calls:
+        call["overflow"] = bool(context_tokens and call["prompt_tokens"] + call["completion_tokens"] > context_tokens)
+    # 沒有用量紀錄、且有未快取呼叫的階段無法估算續寫呼叫，在輸出中註明
+    unknown = [stage for stage in stages if limits[stage].required and throughput[stage]["continuation_rate"] is None
+               and any(call["stage"] == stage and not call["cached"] for call in calls)]
+    return {"clusters": clusters, "calls": calls, "backend": backend.name, "model": backend.model,
+            "context_tokens": context_tokens, "unknown_continuations": unknown}
+
+
+def wall_time(calls, concurrency):
+    """各階段依序執行，階段內最多 concurrency 個呼叫同時進行；快取命中不計時間，續寫呼叫依發生機率計入"""
+    total = 0.0
+    for stage in LLM_STAGES:
+        latencies = [call["latency"] * call["probability"] for call in calls if call["stage"] == stage and not call["cached"]]
+        if latencies:
+            total += max(sum(latencies) / min(concurrency, len(latencies)), max(latencies))
+    return total
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+
+def print_plan(plan, concurrency):
+    clusters, calls = plan["clusters"], plan["calls"]
+    print(f"🧮 Plan for {plan['backend']} / {plan['model']} "
+          f"(context window: {plan['context_tokens'] or 'unlimited'} tokens)")
+
+    by_depth = defaultdict(lambda: {"epochs": set(), "clusters": 0, "reused": set()})
+    for c in clusters:
+        depth = by_depth[c["depth"]]
+        depth["epochs"].add(c["epoch"])
+        depth["clusters"] += 1
+        if c["source_epoch"] is not None:
+            depth["reused"].add(c["epoch"])
+    for depth, info in sorted(by_depth.items()):
+        print(f"   Depth {depth}: {len(info['epochs'])} epoch(s), {info['clusters']} cluster(s), "
+              f"{len(info['reused'])} epoch(s) reusing an earlier partition")
+
+    # 續寫呼叫以發生機率加權（已快取的回應可確定是否需要續寫），因此呼叫數可能不是整數
+    print(f"\n{'stage':<20}{'calls':>7}{'cached':>8}{'prompt tok':>12}{'output tok':>12}{'max prompt':>12}{'time':>10}")
+    for stage in LLM_STAGES + [None]:
+        items = [call for call in calls if stage is None or call["stage"] == stage]
+        if not items:
+            continue
+        live = [call for call in items if not call["cached"]]
+        count = sum(call["probability"] for call in items)
+        print(f"{stage or 'total':<20}{count:>7,.4g}{count - sum(call['probability'] for call in live):>8,.4g}"
+              f"{round(sum(call['prompt_tokens'] * call['probability'] for call in items)):>12,}"
+              f"{round(sum(call['completion_tokens'] * call['probability'] for call in live)):>12,}"
+              f"{max(call['prompt_tokens'] for call in items):>12,}{format_duration(wall_time(items, concurrency)):>10}")
+
+    continuations = [call for call in calls if call["artifact"].endswith(llm.CONTINUATION_SUFFIX)]
+    if continuations:
+        print(f"↪ Includes ~{sum(call['probability'] for call in continuations):,.4g} continuation call(s) for responses "
+              f"missing a required section, estimated from the recorded continuation rate and cached responses.")
+    if plan["unknown_continuations"]:
+        print(f"↪ No recorded calls for {', '.join(plan['unknown_continuations'])}; continuation calls for responses "
+              f"missing a required section are not included for these stages.")
+
+    print("\n⏱ Estimated wall time by concurrency: " + ", ".join(
+        f"{level}: {format_duration(wall_time(calls, level))}" for level in sorted(set(CONCURRENCY_LEVELS + [concurrency]))))
+    overflow = [call for call in calls if call["overflow"]]
+    if overflow:
+        print(f"⚠ {len(overflow)} prompt(s) plus their expected output exceed the {plan['context_tokens']:,}-token "
+              f"context window and would be truncated:")
+        for call in sorted(overflow, key=lambda call: -call["prompt_tokens"]):
+            print(f"   {call['stage']:<20}{call['artifact']:<45}{call['prompt_tokens']:>10,} prompt tokens")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the LLM calls, tokens and wall time of a pipeline run "
+                                                 "without calling the model. Accepts every main.py option.")
+    parser.add_argument("--ledger", nargs="+", default=[],
+                        help=f"{LEDGER_FILE} files to take throughput from (default: every run under --output-root)")
+    parser.add_argument("--context-tokens", type=int, help="context window to check prompts against "
+                                                           "(default: the backend's default)")
+    args, pipeline_argv = parser.parse_known_args(argv)
+    config = parse_args(pipeline_argv)
+
+    ledgers = args.ledger or glob.glob(os.path.join(config.output_root, "*", LEDGER_FILE))
+    records = load_records(ledgers)
+    # 指定既有的 run 時，沿用其 clustered_csv、異常與已完成的上游輸出，prompt 與實際執行時完全相同
+    # 只估算、不執行：以 resolve 取得既有 run 的路徑，不建立任何目錄
+    ws = None
+    if config.run_id and os.path.isdir(os.path.join(config.output_root, config.run_id)):
+        ws = RunWorkspace.resolve(config.output_root, config.run_id)
+    context_tokens = args.context_tokens or CONTEXT_TOKENS.get(config.backend)
+
+    print(f"📄 Planning {config.input_file if ws is None else ws.run_dir} with throughput from {len(records)} recorded call(s)")
+    plan = plan_run(config, records, context_tokens, ws)
+    print_plan(plan, config.concurrency)
+    return plan
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# report.py
+
+import os
+import html
+import json
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from manifest import discover
+from workspace import DEFAULT_ROOT, RunWorkspace
+
+REPORT_DIR = "report"
+SECTION_CACHE_FILE = ".sections.json"
+
+# 所有頁面共用的樣式（字型可用 --font 指定本機字型檔，例如 NotoSansTC-Regular.ttf）
+FONT_FACE_CSS = "@font-face { font-family: 'Report Font'; src: url('%s'); }"
+REPORT_CSS = """
+body { font-family: 'Report Font', 'Noto Sans TC', sans-serif; margin: 2em auto; max-width: 60em; line-height: 1.5; }
+nav ul { list-style: none; padding-left: 1em; }
+section { page-break-before: always; border-top: 1px solid #ccc; margin-top: 2em; }
+table { border-collapse: collapse; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; }
+pre { white-space: pre-wrap; }
+"""
+
+
+def collect_sections(ws):
+    """依 Depth 數值排序收集所有要發布的段落：(section_id, 標題, 檔案路徑)"""
+    sections = []
+    final_summary = os.path.join(ws.run_dir, "depthComparison", "final_summary.txt")
+    if os.path.exists(final_summary):
+        sections.append(("depth-comparison", "Depth Comparison", final_summary))
+
+    for entry in discover(os.path.join(ws.run_dir, "epochSummary"), "summary_Depth_*.txt"):
+        depth = entry["depth"]
+        sections.append((f"depth-{depth}", f"Depth {depth} – Epoch Comparison", entry["full_path"]))
+    for entry in discover(os.path.join(ws.run_dir, "clusterAnalysis"), "analysis_Depth_*_Epoch_*.txt"):
+        depth, epoch = entry["depth"], entry["epoch"]
+        sections.append((f"depth-{depth}-epoch-{epoch}", f"Depth {depth}, Epoch {epoch} – Cluster Comparison", entry["full_path"]))
+    return sections
+
+
+def render_markdown(text):
+    """Markdown 轉 HTML；沒有安裝 markdown 套件時以預先格式化的文字呈現"""
+    try:
+        import markdown
+    except ImportError:
+        return f"<pre>{html.escape(text)}</pre>"
+    return markdown.markdown(text, extensions=["tables"])
+
+
+def render_section(args):
+    section_id, title, text = args
+    return section_id, f'<section id="{section_id}">\n<h1>{html.escape(title)}</h1>\n{render_markdown(text)}\n</section>'
+
+
+def load_section_cache(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def find_wkhtmltopdf():
+    """依序從環境變數 WKHTMLTOPDF 與 PATH 尋找 wkhtmltopdf"""
+    return os.getenv("WKHTMLTOPDF") or shutil.which("wkhtmltopdf")
+
+
+def write_pdf(html_file, pdf_file):
+    """以單一行程將整份報告轉成 PDF，優先使用 wkhtmltopdf，其次 WeasyPrint"""
+    wkhtmltopdf = find_wkhtmltopdf()
+    if wkhtmltopdf:
+        import pdfkit
+        config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf)
+        pdfkit.from_file(html_file, pdf_file, configuration=config, options={"enable-local-file-access": ""})
+        return True
+    try:
+        from weasyprint import HTML
+    except ImportError:
+        print("⚠ Neither wkhtmltopdf nor WeasyPrint is available. Skipping PDF output.")
+        return False
+    HTML(filename=html_file).write_pdf(pdf_file)
+    return True
+
+
+def render_report(ws, output_dir=None, pdf=False, max_workers=None, font_path=None):
+    """將 run 的所有分析結果合併成一份有目錄連結的 HTML（以及選用的 PDF），內容未變動的段落直接沿用"""
+    output_dir = output_dir or ws.path(REPORT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    cache_file = os.path.join(output_dir, SECTION_CACHE_FILE)
+    cache = load_section_cache(cache_file)
+
+    sections = collect_sections(ws)
+    if not sections:
+        print("⚠ No analysis outputs found. Skipping report.")
+        return None
+
+    rendered = {}
+    pending = []
+    for section_id, title, path in sections:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        digest = hashlib.sha256(f"{title}\n{text}".encode("utf-8")).hexdigest()
+        cached = cache.get(section_id)
+        if cached and cached["hash"] == digest:
+            rendered[section_id] = cached["html"]
+        else:
+            pending.append((section_id, title, text, digest))
+
+    # 只有變動過的段落才重新轉換，並以多個行程平行處理
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(render_section, [(sid, title, text) for sid, title, text, _ in pending])
+            for (section_id, section_html), (_, _, _, digest) in zip(results, pending):
+                rendered[section_id] = section_html
+                cache[section_id] = {"hash": digest, "html": section_html}
+    print(f"Rendered {len(pending)} section(s), reused {len(sections) - len(pending)} unchanged.")
+
+    toc = "\n".join(f'<li><a href="#{section_id}">{html.escape(title)}</a></li>' for section_id, title, _ in sections)
+    css = REPORT_CSS
+    if font_path:
+        css = FONT_FACE_CSS % ("file:///" + os.path.abspath(font_path).replace("\\", "/")) + css
+    body = "\n".join(rendered[section_id] for section_id, _, _ in sections)
+    document = f"""<html>
+<head>
+    <meta charset="utf-8">
+    <title>Run {html.escape(ws.run_id)} report</title>
+    <style>{css}</style>
+</head>
+<body>
+    <h1>Run {html.escape(ws.run_id)}</h1>
+    <nav><ul>
+{toc}
+    </ul></nav>
+{body}
+</body>
+</html>
+"""
+    html_file = os.path.join(output_dir, "report.html")
+    document_hash = hashlib.sha256(document.encode("utf-8")).hexdigest()
+    unchanged = cache.get("__document__") == document_hash and os.path.exists(html_file)
+    if not unchanged:
+        with open(html_file, "w", encoding="utf-8") as f:
+            f.write(document)
+    cache["__document__"] = document_hash
+
+    # 只保留目前仍存在的段落
+    cache = {key: value for key, value in cache.items() if key == "__document__" or key in rendered}
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    print(f"✅ Saved report: {html_file}")
+
+    if pdf:
+        pdf_file = os.path.join(output_dir, "report.pdf")
+        if unchanged and os.path.exists(pdf_file):
+            print(f"⚡ Report unchanged, keeping {pdf_file}")
+        elif write_pdf(html_file, pdf_file):
+            print(f"✅ Saved PDF report: {pdf_file}")
+    return html_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render all analyses of a run into one linked HTML/PDF report.")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="run workspace root (default: %(default)s)")
+    parser.add_argument("--run-id", help="run to render (default: the latest run)")
+    parser.add_argument("--pdf", action="store_true", help="also write report.pdf")
+    parser.add_argument("--workers", type=int, help="processes used to render sections")
+    parser.add_argument("--font", help="font file embedded in the report CSS")
+    args = parser.parse_args(argv)
+
+    try:
+        ws = RunWorkspace.open(args.root, args.run_id) if args.run_id else RunWorkspace.latest(args.root)
+    except FileNotFoundError as e:
+        print(f"⚠ {e}.")
+        return
+    if ws is None:
+        print(f"⚠ No runs found in {args.root}.")
+        return
+    render_report(ws, pdf=args.pdf, max_workers=args.workers, font_path=args.font)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,164 @@
 import os
-import glob
-
-# 定義要清除的目錄和檔案類型
-OUTPUT_DIRS = ["output_csv", "clustered_csv"]
-ENCODED_FILES = ["data_encoded.csv", "encoding_map.json"]
-SUMMARY_DIR = "clusterSummary"  # 摘要資料夾
-
-def reset_generated_files():
-    """刪除所有被生成的小 CSV 檔案與編碼對應表"""
-
-    # 提示使用者是否確定刪除一般輸出檔案
-    confirm_general = input("Are you sure you want to delete all generated CSV files and encoded data? (y/n): ").strip().lower()
-    
-    if confirm_general == "y":
-        # 清除一般 CSV 檔案
-        for directory in OUTPUT_DIRS:
-            if os.path.exists(directory):
-                files = glob.glob(os.path.join(directory, "*.csv"))
-                for file in files:
-                    os.remove(file)
-                print(f"Cleared CSV files in {directory}")
-
-        # 刪除 data_encoded.csv 和 encoding_map.json
-        for file in ENCODED_FILES:
-            if os.path.exists(file):
-                os.remove(file)
-                print(f"Deleted {file}")
-
-        print("General reset complete!")
-    else:
-        print("Skipping general CSV file deletion.")
-
-    # **額外詢問是否刪除 clusterSummary**
-    confirm_summary = input("Do you want to delete all generated summaries in clusterSummary? (y/n): ").strip().lower()
-
-    if confirm_summary == "y":
-        if os.path.exists(SUMMARY_DIR):
-            summary_files = glob.glob(os.path.join(SUMMARY_DIR, "*.txt"))
-            for file in summary_files:
-                os.remove(file)
-            print(f"Cleared summary files in {SUMMARY_DIR}")
-        print("Summary reset complete!")
-    else:
-        print("Keeping summary files.")
+import shutil
+import time
+import argparse
+
+from workspace import DEFAULT_ROOT, LATEST_FILE, STAGE_DIRS, list_runs, owned_intermediates
+
+# 舊版（未使用 run workspace 時）直接產生在專案根目錄的目錄與檔案
+OUTPUT_DIRS = STAGE_DIRS
+ENCODED_FILES = ["data_encoded.csv", "encoding_map.json", "uploaded_data.csv"]
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(text):
+    """將 '500M'、'10G' 這類字串轉為 bytes"""
+    text = text.strip().upper().rstrip("B")
+    unit = text[-1] if text and text[-1] in SIZE_UNITS else ""
+    number = text[:-1] if unit else text
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def format_size(num_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def path_size(path):
+    """計算檔案或整個目錄的大小（不跟隨 symlink）"""
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size if os.path.lexists(path) else 0
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def read_latest(root):
+    latest_file = os.path.join(root, LATEST_FILE)
+    if not os.path.exists(latest_file):
+        return None
+    with open(latest_file, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def plan_cleanup(root=DEFAULT_ROOT, keep_last=None, max_age_days=None, max_total_bytes=None, now=None):
+    """依保留規則決定要刪除哪些 run，回傳 [(path, size, reason), ...]（LATEST 指向的 run 一律保留，且不計入 keep_last）"""
+    now = now if now is not None else time.time()
+    latest = read_latest(root)
+
+    # 由新到舊排序
+    runs = [(path, os.stat(path).st_mtime, path_size(path)) for path in reversed(list_runs(root))]
+
+    plan = []
+    kept = []
+    recent = 0
+    for path, mtime, size in runs:
+        if os.path.basename(path) == latest:
+            kept.append((path, size))
+            continue
+        recent += 1
+        if keep_last is not None and recent > keep_last:
+            plan.append((path, size, f"beyond last {keep_last} runs"))
+        elif max_age_days is not None and now - mtime > max_age_days * 86400:
+            plan.append((path, size, f"older than {max_age_days} days"))
+        else:
+            kept.append((path, size))
+
+    # 總容量超過上限時，由最舊的 run 開始刪除
+    if max_total_bytes is not None:
+        total = sum(size for _, size in kept)
+        for path, size in reversed(kept):
+            if total <= max_total_bytes:
+                break
+            if os.path.basename(path) == latest:
+                continue
+            plan.append((path, size, f"total size above {format_size(max_total_bytes)}"))
+            total -= size
+
+    return plan
+
+
+def plan_intermediates(root=DEFAULT_ROOT, removed=()):
+    """tmpfs 上屬於此根目錄、但 run 目錄已不存在（或即將刪除）的中間產物，回傳 [(path, size, reason), ...]"""
+    run_ids = {os.path.basename(path) for path in list_runs(root)}
+    removed = {os.path.basename(path) for path in removed}
+    plan = []
+    for run_id, path in sorted(owned_intermediates(root).items()):
+        if run_id in removed:
+            plan.append((path, path_size(path), "intermediates of removed run"))
+        elif run_id not in run_ids:
+            plan.append((path, path_size(path), "orphaned intermediates"))
+    return plan
+
+
+def remove_paths(plan, dry_run=False):
+    """整個目錄一次刪除，回傳釋放的 bytes"""
+    reclaimed = 0
+    for path, size, reason in plan:
+        action = "Would remove" if dry_run else "Removed"
+        if not dry_run:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.lexists(path):
+                os.remove(path)
+        reclaimed += size
+        print(f"{action} {path} ({format_size(size)}, {reason})")
+    return reclaimed
+
+
+def cleanup_runs(root=DEFAULT_ROOT, keep_last=None, max_age_days=None, max_total_bytes=None, dry_run=False):
+    """依保留規則清理 run 目錄以及 tmpfs 上的中間產物"""
+    plan = plan_cleanup(root, keep_last, max_age_days, max_total_bytes)
+    # 只清理記錄為屬於此根目錄的 tmpfs 中間產物，其他根目錄的 run 不受影響
+    plan += plan_intermediates(root, removed=[path for path, _, _ in plan])
+    reclaimed = remove_paths(plan, dry_run)
+
+    label = "would be reclaimed" if dry_run else "reclaimed"
+    print(f"{len(plan)} path(s), {format_size(reclaimed)} {label}.")
+    return reclaimed
+
+
+def reset_generated_files(assume_yes=False, dry_run=False):
+    """刪除舊版直接產生在專案根目錄的所有輸出目錄與編碼檔案"""
+    if not assume_yes and not dry_run:
+        confirm = input("Delete all generated directories and encoded data in the project root? (y/n): ").strip().lower()
+        if confirm != "y":
+            print("Skipping reset.")
+            return 0
+
+    plan = [(path, path_size(path), "legacy output") for path in OUTPUT_DIRS + ENCODED_FILES if os.path.lexists(path)]
+    reclaimed = remove_paths(plan, dry_run)
+    label = "would be reclaimed" if dry_run else "reclaimed"
+    print(f"Reset complete: {format_size(reclaimed)} {label}.")
+    return reclaimed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean up pipeline outputs (suitable for cron).")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="run workspace root")
+    parser.add_argument("--keep-last", type=int, help="keep only the N most recent runs, not counting the run in LATEST (always kept)")
+    parser.add_argument("--max-age-days", type=float, help="remove runs older than this many days")
+    parser.add_argument("--max-size", type=parse_size, help="keep total run size under this limit, e.g. 20G")
+    parser.add_argument("--legacy", action="store_true", help="also remove outputs written to the project root")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without deleting")
+    parser.add_argument("-y", "--yes", action="store_true", help="do not prompt for confirmation")
+    args = parser.parse_args(argv)
+
+    has_policy = args.keep_last is not None or args.max_age_days is not None or args.max_size is not None
+    if has_policy:
+        cleanup_runs(args.root, args.keep_last, args.max_age_days, args.max_size, args.dry_run)
+    if args.legacy or not has_policy:
+        reset_generated_files(assume_yes=args.yes, dry_run=args.dry_run)
+
 
 if __name__ == "__main__":
-    reset_generated_files()
+    main()
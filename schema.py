@@ -0,0 +1,55 @@
+# schema.py
+
+import pandas as pd
+
+# 交易資料的共用欄位型別：
+# - 重複度高的地址 / 代幣欄位用 category，只存一次字串與整數代碼
+# - Hash 幾乎每筆都不同，用 category 沒有好處，維持字串
+# - Value 可能超過 float 的精確範圍（例如 wei），以字串保存原始數值，需要計算時再轉換
+# - TimeStamp 以原始文字讀入以便原樣寫回，需要時間運算時用 parse_timestamp() 轉換
+BASE_COLUMNS = ["layer", "BlockNumber", "TimeStamp", "Hash", "From", "To", "Value", "TokenName", "TokenSymbol"]
+CATEGORY_COLUMNS = ["layer", "From", "To", "TokenName", "TokenSymbol"]
+DTYPES = {
+    **{col: "category" for col in CATEGORY_COLUMNS},
+    "BlockNumber": "Int64",
+    "TimeStamp": str,
+    "Hash": str,
+    "Value": str,
+}
+
+# Cluster_Depth_i_Epoch_j 與 Cluster_Value 欄位（可為空值的整數，避免被讀成 1.0 這類浮點數）
+CLUSTER_DTYPE = "Int32"
+CLUSTER_COLUMNS = ("Cluster_Depth_", "Cluster_Value")
+
+
+def dtypes_for(columns):
+    """依實際欄位產生 read_csv 的 dtype 對應（未知欄位交給 pandas 自行判斷）"""
+    mapping = {col: DTYPES[col] for col in columns if col in DTYPES}
+    mapping.update({col: CLUSTER_DTYPE for col in columns if col.startswith(CLUSTER_COLUMNS)})
+    return mapping
+
+
+def read_header(path):
+    return pd.read_csv(path, nrows=0).columns
+
+
+def read_table(path, usecols=None, parse_time=False, **kwargs):
+    """以共用 schema 讀取交易 CSV；parse_time=True 時將 TimeStamp 轉為 datetime"""
+    columns = usecols if usecols is not None else read_header(path)
+    df = pd.read_csv(path, usecols=usecols, dtype=dtypes_for(columns), **kwargs)
+    if parse_time and "TimeStamp" in df.columns:
+        df["TimeStamp"] = parse_timestamp(df["TimeStamp"])
+    return df
+
+
+def parse_timestamp(series):
+    """Unix 秒數或日期字串都轉為 datetime，無法解析的值為 NaT"""
+    numeric = pd.to_numeric(series, errors="coerce")
+    if numeric.notna().all():
+        return pd.to_datetime(numeric, unit="s")
+    return pd.to_datetime(series, errors="coerce")
+
+
+def value_as_float(series):
+    """將字串形式的 Value 轉為 float 以進行數值運算（無法解析的值為 NaN）"""
+    return pd.to_numeric(series, errors="coerce").astype(float)
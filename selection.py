@@ -0,0 +1,77 @@
+# selection.py
+
+from dataclasses import dataclass
+from typing import Optional, Set
+
+from workspace import artifact_keys
+
+CLUSTER_COLUMN_PREFIX = "Cluster_Depth_"
+
+
+@dataclass
+class ClusterSelection:
+    """限定只處理部分 Depth / Epoch / Cluster，並盡早在讀取資料時套用"""
+    depths: Optional[Set[int]] = None
+    epochs: Optional[Set[int]] = None
+    epoch_min: Optional[int] = None
+    epoch_max: Optional[int] = None
+    cluster_ids: Optional[Set[int]] = None
+    min_cluster_size: int = 0
+
+    @property
+    def selects_all(self):
+        return (self.depths is None and self.epochs is None and self.epoch_min is None
+                and self.epoch_max is None and self.cluster_ids is None and self.min_cluster_size <= 0)
+
+    def match_depth_epoch(self, depth, epoch):
+        if self.depths is not None and depth not in self.depths:
+            return False
+        if epoch is None:
+            return True
+        if self.epochs is not None and epoch not in self.epochs:
+            return False
+        if self.epoch_min is not None and epoch < self.epoch_min:
+            return False
+        if self.epoch_max is not None and epoch > self.epoch_max:
+            return False
+        return True
+
+    def match_cluster(self, cluster, size=None):
+        if self.cluster_ids is not None and cluster not in self.cluster_ids:
+            return False
+        if size is not None and size < self.min_cluster_size:
+            return False
+        return True
+
+    def match_artifact(self, filename):
+        """依檔名判斷產物是否在選取範圍內（無法得知大小時不檢查 min_cluster_size）"""
+        depth, epoch, cluster = artifact_keys(filename)
+        if depth is None:
+            return True
+        if not self.match_depth_epoch(depth, epoch):
+            return False
+        return cluster is None or self.match_cluster(cluster)
+
+    def cluster_columns(self, columns):
+        """從欄位清單挑出被選取的 Cluster_Depth_i_Epoch_j 欄位"""
+        return [col for col in columns
+                if col.startswith(CLUSTER_COLUMN_PREFIX) and self.match_depth_epoch(*artifact_keys(col)[:2])]
+
+    def usecols(self, columns):
+        """讀取 CSV 時的欄位投影：保留所有非分群欄位，以及被選取的分群欄位"""
+        selected = set(self.cluster_columns(columns))
+        return [col for col in columns if not col.startswith(CLUSTER_COLUMN_PREFIX) or col in selected]
+
+    def filter_clusters(self, cluster_series):
+        """回傳 cluster 欄位的布林遮罩，套用 cluster_ids 與 min_cluster_size"""
+        mask = cluster_series.notna()
+        if self.cluster_ids is not None:
+            mask &= cluster_series.isin(self.cluster_ids)
+        if self.min_cluster_size > 0:
+            sizes = cluster_series.map(cluster_series.value_counts())
+            mask &= sizes >= self.min_cluster_size
+        return mask
+
+
+# 不做任何篩選的預設選取
+ALL = ClusterSelection()
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+from agents.artifactIndex import ArtifactIndex
+
+
+def setup_test_outputs():
+    """建立測試用的 clusterSummary / clusterAnalysis 檔案"""
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "clusterSummary"))
+    os.makedirs(os.path.join(root, "clusterAnalysis"))
+    for depth in (1, 2, 10):
+        for epoch in (1, 2):
+            for cluster in (0, 1):
+                path = os.path.join(root, "clusterSummary", f"summary_Depth_{depth}_Epoch_{epoch}_Cluster_{cluster}.txt")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(f"Cluster {cluster} 主要交易 Token 為 USDT")
+            path = os.path.join(root, "clusterAnalysis", f"analysis_Depth_{depth}_Epoch_{epoch}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("Clusters 之間的差異")
+    with open(os.path.join(root, "clusterSummary", "summary_Depth_2_Epoch_2_Cluster_1.txt"), "a", encoding="utf-8") as f:
+        f.write(" airdrop")
+    return root
+
+
+def test_metadata_query_selects_depth_and_epoch():
+    root = setup_test_outputs()
+    try:
+        index = ArtifactIndex(root, dirs=["clusterSummary"])
+        assert index.search("比較同樣為深度2epoch1時，每一個Cluster的差異") == [
+            os.path.join("clusterSummary", "summary_Depth_2_Epoch_1_Cluster_0.txt"),
+            os.path.join("clusterSummary", "summary_Depth_2_Epoch_1_Cluster_1.txt"),
+        ]
+        # Depth 1 不應該誤選到 Depth 10
+        assert all("Depth_1_" in path for path in index.search("depth 1 epoch 2"))
+    finally:
+        shutil.rmtree(root)
+
+
+def test_keyword_query_uses_bm25_and_refreshes():
+    root = setup_test_outputs()
+    try:
+        index = ArtifactIndex(root)
+        assert index.search("airdrop") == [os.path.join("clusterSummary", "summary_Depth_2_Epoch_2_Cluster_1.txt")]
+
+        os.remove(os.path.join(root, "clusterSummary", "summary_Depth_2_Epoch_2_Cluster_1.txt"))
+        assert index.search("airdrop") == []
+    finally:
+        shutil.rmtree(root)
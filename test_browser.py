@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import pytest
+import browser
+import report
+import workspace
+from manifest import Manifest, write_text_artifact
+
+
+def setup_test_run(run_id="run-1"):
+    """建立測試用的 run：3 個 Depth、各 2 個 Epoch、各 2 個 Cluster 的摘要，並登記到 manifest"""
+    root = tempfile.mkdtemp()
+    directory = os.path.join(root, run_id, "clusterSummary")
+    os.makedirs(directory)
+    manifest = Manifest(directory)
+    for depth in (1, 2, 10):
+        for epoch in (1, 2):
+            for cluster in (0, 1):
+                write_text_artifact(manifest, os.path.join(directory, f"summary_Depth_{depth}_Epoch_{epoch}_Cluster_{cluster}.txt"),
+                                    f"#### Cluster {cluster}\n**Key participants**")
+    manifest.save()
+    return root, directory
+
+
+def test_browse_paginates_and_filters():
+    root, _ = setup_test_run()
+    try:
+        first = browser.browse("run-1", "Cluster Summary", page=1, root=root, page_size=5)
+        assert (first["page"], first["pages"], first["total"]) == (1, 3, 12)
+        assert first["depths"] == [1, 2, 10]
+        assert first["entries"][0]["path"] == "summary_Depth_1_Epoch_1_Cluster_0.txt"
+        # 超出範圍的頁數會調整為最後一頁
+        last = browser.browse("run-1", "Cluster Summary", page=99, root=root, page_size=5)
+        assert last["page"] == 3 and len(last["entries"]) == 2
+
+        filtered = browser.browse("run-1", "Cluster Summary", depth=10, epoch=2, root=root)
+        assert [entry["path"] for entry in filtered["entries"]] == [
+            "summary_Depth_10_Epoch_2_Cluster_0.txt", "summary_Depth_10_Epoch_2_Cluster_1.txt"]
+        assert filtered["epochs"] == [1, 2]
+    finally:
+        shutil.rmtree(root)
+
+
+def test_listing_and_rendering_are_cached_until_files_change():
+    root, directory = setup_test_run()
+    try:
+        entries = browser.list_artifacts(directory, "summary_*.txt")
+        assert browser.list_artifacts(directory, "summary_*.txt") is entries
+
+        path = os.path.join(directory, "summary_Depth_1_Epoch_1_Cluster_0.txt")
+        rendered = browser.render_artifact(path)
+        assert browser.render_artifact(path) is rendered
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\nupdated")
+        assert "updated" in browser.render_artifact(path)
+    finally:
+        shutil.rmtree(root)
+
+
+def test_cluster_csvs_of_in_memory_runs_are_listed(monkeypatch):
+    root, _ = setup_test_run()
+    monkeypatch.setattr(workspace, "TMPFS_ROOT", tempfile.mkdtemp())
+    try:
+        # --intermediates-in-memory 的 run，clustered_csv 在 tmpfs 上而不在 run 目錄
+        ws = workspace.RunWorkspace(root=root, run_id="run-1", intermediates_in_memory=True)
+        manifest = Manifest(ws.clustered_csv)
+        write_text_artifact(manifest, os.path.join(ws.clustered_csv, "Depth_1_Epoch_1_Cluster_0.csv"), "Hash\n0x1\n")
+        manifest.save()
+
+        listing = browser.browse("run-1", "Cluster CSV", root=root)
+        assert [entry["path"] for entry in listing["entries"]] == ["Depth_1_Epoch_1_Cluster_0.csv"]
+        assert listing["entries"][0]["full_path"].startswith(workspace.TMPFS_ROOT)
+        assert not os.path.exists(os.path.join(root, "run-1", "clustered_csv"))
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(workspace.TMPFS_ROOT)
+
+
+def test_unknown_run_is_not_created(monkeypatch):
+    root, _ = setup_test_run()
+    monkeypatch.setattr(workspace, "TMPFS_ROOT", tempfile.mkdtemp())
+    try:
+        # 打錯的 run ID：瀏覽時清單為空，產生報告時只顯示警告，都不會建立 run 目錄
+        assert browser.browse("run-2", "Cluster CSV", root=root)["entries"] == []
+        with pytest.raises(FileNotFoundError):
+            workspace.RunWorkspace.resolve(root, "run-2")
+        report.main(["--root", root, "--run-id", "run-2"])
+        assert sorted(os.listdir(root)) == ["run-1"]
+        assert os.listdir(workspace.TMPFS_ROOT) == []
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(workspace.TMPFS_ROOT)
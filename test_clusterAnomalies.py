@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from agents.clusterAnomalies import (bursts, column_anomalies, dominant_participants, rare_tokens, shared_features,
+                                     value_outliers)
+from selection import ClusterSelection
+
+
+def test_shared_features():
+    df = pd.DataFrame({"Hash": ["a", "b", "c", "d"], "Value": ["0", "9", "99", "x"],
+                       "TimeStamp": ["0", "3599", "3600", "7300"], "TokenSymbol": ["USDT", "USDT", "ETH", "USDT"],
+                       "From": ["f1", "f1", "f2", "f1"], "To": ["t1", "t2", "t1", "t1"]})
+    features, names, global_share = shared_features(df)
+    # log10(1 + Value)，無法解析的 Value 為 NaN；時間窗以 3600 秒為單位
+    assert features["log_value"].tolist()[:3] == [0.0, 1.0, 2.0] and np.isnan(features["log_value"][3])
+    assert features["window"].tolist() == [0, 0, 1, 2]
+    assert names["token"][features["token"]].tolist() == ["USDT", "USDT", "ETH", "USDT"]
+    assert global_share["token"].tolist() == [0.75, 0.25]
+    assert names["To"].tolist() == ["t1", "t2"] and global_share["To"].tolist() == [0.75, 0.25]
+
+
+def test_value_outliers_use_median_and_mad():
+    # cluster 0：中位數 1、MAD 0.05，log Value 5 的 z = 0.6745 * 4 / 0.05；cluster 1 的值完全相同（MAD 為 0）不算異常
+    frame = pd.DataFrame({"cluster": [0] * 6 + [1] * 3, "log_value": [1, 1, 1, 1.1, 0.9, 5, 2, 2, 2],
+                          "hash": [f"h{i}" for i in range(9)], "value": [str(i) for i in range(9)]})
+    anomalies = value_outliers(frame)
+    assert list(anomalies) == [0]
+    assert anomalies[0] == [{"type": "value_outliers", "rows": 1, "threshold": 3.5,
+                             "examples": [{"hash": "h5", "value": "5", "z": 53.96}], "severity": 15.42}]
+
+
+def test_bursts_compare_against_the_median_window():
+    # cluster 0 在時間窗 0~4 各 1 筆、時間窗 5 有 6 筆；cluster 1 的 2 筆未達 BURST_MIN_ROWS
+    frame = pd.DataFrame({"cluster": [0] * 11 + [1] * 2, "window": [0, 1, 2, 3, 4, 5, 5, 5, 5, 5, 5, 0, 0]})
+    assert bursts(frame) == {0: [{"type": "burst", "start": "1970-01-01T05:00:00", "window_seconds": 3600,
+                                  "rows": 6, "median_rows": 1.0, "severity": 1.2}]}
+
+
+def test_dominant_participants():
+    # cluster 0 的 10 筆中 6 筆來自 From 0；cluster 1 全部來自 From 0，但筆數未達 DOMINANT_MIN_ROWS
+    frame = pd.DataFrame({"cluster": [0] * 10 + [1] * 3, "From": [0] * 6 + [1] * 4 + [0] * 3,
+                          "To": list(range(10)) + [0, 1, 2]})
+    sizes = frame.groupby("cluster").size()
+    names = {"From": np.array(["0xf0", "0xf1"], dtype=object), "To": np.array([f"0xt{i}" for i in range(10)], dtype=object)}
+    global_share = {"From": np.array([9 / 13, 4 / 13]), "To": np.full(10, 0.1)}
+    assert dominant_participants(frame, sizes, names, global_share) == {0: [
+        {"type": "dominant_from", "address": "0xf0", "share": 0.6, "global_share": 0.6923, "severity": 1.2}]}
+
+
+def test_rare_tokens():
+    frame = pd.DataFrame({"cluster": [0, 0, 1, 1, 1], "token": [0, 0, 0, 1, 1]})
+    names = {"token": np.array(["USDT", "SHIB"], dtype=object)}
+    # SHIB 只佔整份資料的 0.5%（低於 RARE_SHARE 1%）
+    assert rare_tokens(frame, names, {"token": np.array([0.995, 0.005])}) == {1: [
+        {"type": "rare_token", "token": "SHIB", "rows": 2, "global_share": 0.005, "severity": 2.0}]}
+
+
+def test_column_anomalies_rank_by_severity_and_apply_selection():
+    # cluster 0：時間窗 5 的突增（severity 1.2）與一筆極端 Value（MAD 0.1，severity 0.6745 * 4 / 0.1 / 3.5），cluster 1 沒有異常
+    features = pd.DataFrame({"hash": [f"h{i}" for i in range(13)], "value": ["1"] * 13,
+                             "log_value": [1, 1.1, 0.9, 1, 1.1, 0.9, 1, 1.1, 0.9, 1, 5, 2, 2],
+                             "window": [0, 1, 2, 3, 4, 5, 5, 5, 5, 5, 5, 0, 0],
+                             "token": [0] * 13, "From": list(range(13)), "To": list(range(13))})
+    names = {"token": np.array(["USDT"], dtype=object), "From": np.arange(13).astype(str).astype(object),
+             "To": np.arange(13).astype(str).astype(object)}
+    global_share = {"token": np.array([1.0]), "From": np.full(13, 1 / 13), "To": np.full(13, 1 / 13)}
+    labels = pd.Series(pd.array([0] * 11 + [1, None], dtype="Int32"))
+
+    clusters = column_anomalies(labels, features, names, global_share)
+    assert list(clusters) == ["0", "1"]
+    assert clusters["0"]["rows"] == 11
+    assert [(item["type"], item["severity"]) for item in clusters["0"]["anomalies"]] == [
+        ("value_outliers", 7.71), ("burst", 1.2)]
+    assert clusters["1"] == {"rows": 1, "anomalies": []}
+
+    selected = column_anomalies(labels, features, names, global_share, ClusterSelection(min_cluster_size=2))
+    assert list(selected) == ["0"]
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from agents.clusterMatching import compute_cluster_matching, contingency, match_partitions
+from manifest import Manifest, sha256_file
+
+NA = np.nan
+
+
+def test_contingency_counts_only_rows_labeled_on_both_sides():
+    source = np.array([0, 0, 1, 1, NA])
+    target = np.array([5, 5, 5, NA, 7])
+    overlap, source_ids, target_ids, source_sizes, target_sizes = contingency(source, target)
+    assert overlap.tolist() == [[2, 0], [1, 0]]
+    assert source_ids.tolist() == [0, 1] and target_ids.tolist() == [5, 7]
+    assert source_sizes.tolist() == [2, 2] and target_sizes.tolist() == [3, 1]
+
+
+def test_match_partitions_classifies_events():
+    # 0 -> 20 原封不動；1 平均分到 21 / 22 / 23；2 消失；3 與 4 合併為 24；25 是新的 cluster
+    source = np.array([0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 2, 3, 3, 4, 4, 4, NA])
+    target = np.array([20, 20, 20, 20, 21, 21, 22, 22, 23, 23, NA, 24, 24, 24, 24, 24, 25])
+    result = match_partitions(source, target, "Epoch 1", "Epoch 2")
+
+    assert result["source_clusters"] == [0, 1, 2, 3, 4]
+    assert result["target_clusters"] == [20, 21, 22, 23, 24, 25]
+    assert result["transition"][1] == [0.0, 0.333, 0.333, 0.333, 0.0, 0.0]
+    # Jaccard(3, 24) = 2 / (2 + 5 - 2)，Jaccard(4, 24) = 3 / (3 + 5 - 3)
+    assert result["jaccard"][3][4] == 0.4 and result["jaccard"][4][4] == 0.6
+    assert result["events"] == [
+        {"type": "stable", "source": [0], "target": [20], "jaccard": 1.0},
+        {"type": "split", "source": [1], "target": [21, 22, 23], "shares": [0.333, 0.333, 0.333]},
+        {"type": "dissolved", "source": [2], "target": []},
+        {"type": "stable", "source": [4], "target": [24], "jaccard": 0.6},
+        {"type": "merged", "source": [3, 4], "target": [24], "shares": [0.4, 0.6]},
+        {"type": "new", "source": [], "target": [25]},
+    ]
+
+
+def test_matching_outputs_are_registered_in_the_manifest():
+    root = tempfile.mkdtemp()
+    try:
+        input_file = os.path.join(root, "data_encoded.csv")
+        pd.DataFrame({"Hash": ["H0", "H1", "H2"], "Cluster_Depth_1_Epoch_1": [0, 0, 1],
+                      "Cluster_Depth_1_Epoch_2": [1, 1, 0], "Cluster_Depth_2_Epoch_1": [0, 1, 1]}).to_csv(input_file, index=False)
+        output_dir = os.path.join(root, "clusterMatching")
+        compute_cluster_matching(input_file, output_dir)
+
+        entries = Manifest(output_dir).entries()
+        assert [(entry["path"], entry["depth"]) for entry in entries] == [
+            ("matching_depths.json", None), ("matching_Depth_1.json", 1), ("matching_Depth_2.json", 2)]
+        assert all(entry["sha256"] == sha256_file(entry["full_path"]) for entry in entries)
+    finally:
+        shutil.rmtree(root)
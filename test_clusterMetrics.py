@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from agents.clusterMetrics import column_metrics, js_divergence, numeric_matrix, sampled_silhouette, top_pairs
+from selection import ClusterSelection
+
+COLUMN = "Cluster_Depth_1_Epoch_1"
+
+
+def test_numeric_matrix_logs_value_and_fills_missing_with_median():
+    # log10(1 + Value) = 0, 1, 2，無法解析的值以中位數 1 補齊，再標準化（標準差 sqrt(0.5)）
+    matrix, names = numeric_matrix(pd.DataFrame({"Value": ["0", "9", "99", "abc"]}))
+    assert names == ["Value"]
+    assert np.allclose(matrix[:, 0], [-np.sqrt(2), 0, np.sqrt(2), 0])
+
+
+def test_js_divergence():
+    # 相同分布為 0、完全不重疊為 1；[1/2, 1/2] 與 [1, 0]：
+    # M = [3/4, 1/4]，KL(P||M) = 1/2 log2(2/3) + 1/2 log2(2)，KL(Q||M) = log2(4/3)
+    divergence = js_divergence(np.array([[1.0, 1.0], [1.0, 0.0], [0.0, 2.0], [2.0, 2.0]]))
+    expected = (0.5 * np.log2(2 / 3) + 0.5 + np.log2(4 / 3)) / 2
+    assert np.isclose(divergence[0, 1], expected)
+    assert np.isclose(divergence[1, 2], 1.0)
+    assert np.isclose(divergence[0, 3], 0.0)
+    assert np.allclose(divergence, divergence.T)
+
+
+def test_sampled_silhouette():
+    # 一維的兩群 {0, 1} 與 {10, 11}：a = 1，b 分別為 10.5 與 9.5
+    features = np.array([[0.0], [1.0], [10.0], [11.0]])
+    overall, per_cluster = sampled_silhouette(features, np.array([0, 0, 1, 1]), 2)
+    expected = (9.5 / 10.5 + 8.5 / 9.5) / 2
+    assert np.isclose(overall, expected)
+    assert np.allclose(per_cluster, [expected, expected])
+
+    # 只有一個成員的 cluster silhouette 為 0
+    _, per_cluster = sampled_silhouette(np.array([[0.0], [1.0], [10.0]]), np.array([0, 0, 1]), 2)
+    assert per_cluster[1] == 0
+
+
+def test_top_pairs():
+    matrix = np.array([[0, 3, 1], [3, 0, 2], [1, 2, 0]], dtype=float)
+    assert top_pairs([5, 6, 7], matrix, n=2) == [{"clusters": [5, 6], "value": 3.0}, {"clusters": [6, 7], "value": 2.0}]
+    assert top_pairs([5, 6, 7], matrix, n=1, largest=False) == [{"clusters": [5, 7], "value": 1.0}]
+
+
+def test_column_metrics():
+    df = pd.DataFrame({COLUMN: pd.array([0, 0, 1, 1, None], dtype="Int32")})
+    features = np.array([[0.0], [1.0], [10.0], [11.0], [50.0]])
+    # 兩個 cluster 的 TokenSymbol 與 Value 區間完全不同
+    codes = np.array([0, 0, 1, 1, 0])
+    metrics = column_metrics(df, COLUMN, features, ["Value"], codes, 2, codes)
+
+    # 沒有分群標籤的資料不列入計算
+    assert (metrics["rows"], metrics["n_clusters"], metrics["silhouette"]) == (4, 2, 0.8997)
+    assert metrics["clusters"][0] == {"cluster": 0, "size": 2, "share": 0.5, "centroid": {"Value": 0.5},
+                                      "silhouette": 0.8997, "nearest_cluster": 1}
+    assert metrics["closest_centroids"] == [{"clusters": [0, 1], "value": 10.0}]
+    assert metrics["token_divergence"] == metrics["value_divergence"] == [{"clusters": [0, 1], "value": 1.0}]
+
+    # 篩選條件只影響列出的 clusters，整體指標仍以全部 clusters 計算
+    selected = column_metrics(df, COLUMN, features, ["Value"], codes, 2, codes, ClusterSelection(cluster_ids={1}))
+    assert [c["cluster"] for c in selected["clusters"]] == [1]
+    assert selected["silhouette"] == metrics["silhouette"]
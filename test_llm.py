@@ -0,0 +1,84 @@
+import pytest
+import llm
+from llm import FakeBackend, OutputLimits, get_llm_response, limits_from_format
+
+SYSTEM_PROMPT = """
+### **Output Format (Follow this structure exactly):**
+#### Summary for Depth {depth}:
+1. **Overview:**
+   - {overview}
+
+2. **Comparing Epochs within Depth {depth}:**
+   - {comparison}
+"""
+
+FULL_RESPONSE = "1. **Overview:** stable clusters\n\n2. **Comparing Epochs within Depth 1:** no change\n\n3. **Extra:** rambling"
+
+
+def test_limits_follow_output_format():
+    limits = limits_from_format(SYSTEM_PROMPT, max_tokens=100)
+    assert limits.required == ((1, "Overview"), (2, "Comparing Epochs within Depth"))
+    assert limits.stop == ()
+    # 段落內的編號粗體清單（看起來像下一個段落）不會截斷回應，也不需要續寫
+    nested = ("1. **Overview:** three groups\n3. **Largest sender** dominates\n\n"
+              "### 2. Comparing Epochs\n- stable\n3. **Outlier:** one burst")
+    prompts = []
+    backend = FakeBackend(responder=lambda prompt: prompts.append(prompt) or nested)
+    assert get_llm_response("prompt", backend=backend, limits=limits) == nested
+    assert len(prompts) == 1
+
+
+def test_truncated_response_is_continued():
+    prompts = []
+
+    def responder(prompt):
+        prompts.append(prompt)
+        if "stopped before" in prompt:
+            return "2. **Comparing Epochs within Depth 1:** no change"
+        return FULL_RESPONSE
+
+    limits = OutputLimits(max_tokens=4, required=((1, "Overview"), (2, "Comparing Epochs within Depth")))
+    assert llm.cache_dir is None
+    response = get_llm_response("prompt", backend=FakeBackend(responder=responder), limits=limits)
+    # 只有第一個段落在 max_tokens 內完成，續寫呼叫只補上缺少的段落
+    assert len(prompts) == 2
+    assert "Comparing Epochs within Depth" in prompts[1] and "Overview" not in prompts[1].split("---")[1]
+    assert response == "1. **Overview:** stable clusters\n\n2. **Comparing Epochs within Depth 1:** no change"
+
+    # 回應完整時不會多呼叫一次
+    prompts.clear()
+    get_llm_response("prompt", backend=FakeBackend(responder=responder), limits=OutputLimits(required=((1, "Overview"),)))
+    assert len(prompts) == 1
+
+
+def test_sections_match_by_number_and_title_prefix():
+    required = ((1, "Cluster Characteristics"), (3, "Additional Observations by LLM"))
+    assert llm.missing_sections("1. **Cluster Characteristics:** x\n3. **Additional Observations:** y", required) == []
+    assert llm.missing_sections("#### 1. Cluster characteristics\n**Additional Observations by LLM:** y", required) == []
+    # 編號不同的段落，或只出現在段落內文的字詞不算
+    assert llm.missing_sections("1. **Cluster Characteristics:** x\n2. **Additional notes**", required) == [
+        "3. Additional Observations by LLM"]
+
+
+def test_only_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(llm.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def flaky(prompt):
+        calls.append(prompt)
+        if len(calls) == 1:
+            raise llm.TransientLLMError("503")
+        return "ok"
+
+    assert FakeBackend(responder=flaky).complete("prompt").text == "ok"
+    assert len(calls) == 2
+
+    # 設定錯誤（例如缺少 API key 或 4xx）直接失敗，不等待重試
+    def misconfigured(prompt):
+        calls.append(prompt)
+        raise Exception("請在 .env 檔中設定 GEMINI_API_KEY")
+
+    calls.clear()
+    with pytest.raises(Exception, match="GEMINI_API_KEY"):
+        FakeBackend(responder=misconfigured).complete("prompt")
+    assert len(calls) == 1
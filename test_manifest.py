@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+import pytest
+import manifest
+from manifest import MANIFEST_FILE, Manifest, discover, file_lock, sha256_file, write_csv_artifact, write_text_artifact
+from selection import ClusterSelection
+
+
+def setup_test_dir(depths):
+    """建立測試用的 epochSummary 目錄，並登記到 manifest"""
+    directory = tempfile.mkdtemp()
+    manifest = Manifest(directory)
+    for depth in depths:
+        write_text_artifact(manifest, os.path.join(directory, f"summary_Depth_{depth}.txt"), f"Depth {depth}")
+    manifest.save()
+    return directory
+
+
+def test_manifest_orders_depths_numerically():
+    directory = setup_test_dir([10, 2, 1])
+    try:
+        assert [entry["depth"] for entry in discover(directory, "summary_Depth_*.txt")] == [1, 2, 10]
+        # 沒有 manifest 時退回掃描目錄，排序結果相同
+        os.remove(os.path.join(directory, MANIFEST_FILE))
+        assert [entry["depth"] for entry in discover(directory, "summary_Depth_*.txt")] == [1, 2, 10]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_manifest_keeps_entries_and_applies_selection():
+    directory = setup_test_dir([1, 2])
+    try:
+        # 重新開啟 manifest 只更新一個產物，其他產物仍保留
+        manifest = Manifest(directory)
+        entry = write_text_artifact(manifest, os.path.join(directory, "summary_Depth_2.txt"), "updated")
+        manifest.save()
+        entries = discover(directory, "summary_Depth_*.txt")
+        assert [e["depth"] for e in entries] == [1, 2]
+        assert entries[1]["sha256"] == entry["sha256"]
+
+        selected = discover(directory, "summary_Depth_*.txt", ClusterSelection(depths={2}))
+        assert [e["depth"] for e in selected] == [2]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_get_by_keys_follows_add_and_reload():
+    directory = setup_test_dir([1, 2])
+    try:
+        manifest = Manifest(directory)
+        assert manifest.get(depth=2)["path"] == "summary_Depth_2.txt"
+        assert manifest.get(depth=3) is None
+        entry = write_text_artifact(manifest, os.path.join(directory, "summary_Depth_3.txt"), "Depth 3")
+        assert manifest.get(depth=3) is entry
+        # 同一個檔名重新登記時取得最新的紀錄
+        updated = write_text_artifact(manifest, os.path.join(directory, "summary_Depth_2.txt"), "updated")
+        assert manifest.get(depth=2) is updated
+        manifest.save()
+        assert Manifest(directory).get(depth=3)["sha256"] == entry["sha256"]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_csv_artifact_is_written_in_chunks_and_hashed_while_writing():
+    directory = tempfile.mkdtemp()
+    try:
+        df = pd.DataFrame({"Hash": [f"0x{i}" for i in range(10)], "Value": [f"{i},5" for i in range(10)]})
+        path = os.path.join(directory, "Depth_1_Epoch_1.csv")
+        entry = write_csv_artifact(Manifest(directory), path, df, chunk_size=3, depth=1, epoch=1)
+        with open(path, encoding="utf-8", newline="") as f:
+            assert f.read() == df.to_csv(index=False)
+        assert entry["rows"] == 10 and entry["sha256"] == sha256_file(path)
+        # 暫存檔已改名為正式檔名
+        assert os.listdir(directory) == ["Depth_1_Epoch_1.csv"]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_file_lock_breaks_stale_locks_but_never_removes_another_owner():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, MANIFEST_FILE)
+    lock_path = f"{path}.lock"
+    try:
+        # 持有者已異常結束的過期鎖檔會被移除
+        with open(lock_path, "w", encoding="utf-8") as f:
+            f.write("dead-owner")
+        old = os.path.getmtime(lock_path) - manifest.STALE_LOCK_SECONDS - 1
+        os.utime(lock_path, (old, old))
+        with file_lock(path, timeout=1):
+            assert manifest.read_lock_owner(lock_path) not in (None, "dead-owner")
+        assert not os.path.exists(lock_path)
+
+        # 持有過久而被其他行程接手時，釋放鎖不會刪除新持有者的鎖檔
+        with file_lock(path, timeout=1):
+            with open(lock_path, "w", encoding="utf-8") as f:
+                f.write("new-owner")
+        assert manifest.read_lock_owner(lock_path) == "new-owner"
+
+        # 尚未過期的鎖不會被移除
+        with pytest.raises(TimeoutError):
+            with file_lock(path, timeout=0.2):
+                pass
+        assert manifest.read_lock_owner(lock_path) == "new-owner"
+        assert os.listdir(directory) == [f"{MANIFEST_FILE}.lock"]
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import llm
+from planner import LLM_STAGES, continuation_call, stage_throughput
+from pipeline import load_stage
+
+
+def record(stage, artifact, latency, completion_tokens):
+    return {"stage": stage, "model": "fake", "artifact": artifact, "latency": latency,
+            "completion_tokens": completion_tokens, "cached": False}
+
+
+def test_continuations_are_measured_separately():
+    records = [record("summary", f"summary_{i}.txt", 2.0, 600) for i in range(4)]
+    records.append(record("summary", "summary_0.txt (continuation)", 1.0, 200))
+    throughput = stage_throughput(records, "fake")
+    # 續寫呼叫不計入一般呼叫的平均值
+    assert throughput["summary"]["latency"] == 2.0 and throughput["summary"]["completion_tokens"] == 600
+    assert throughput["summary"]["continuation_rate"] == 0.25
+    assert throughput["summary"]["continuation"] == {"latency": 1.0, "completion_tokens": 200}
+    assert throughput["depth-comparison"]["continuation_rate"] is None
+
+
+def test_cached_truncated_response_predicts_its_continuation():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        backend = llm.get_backend("fake")
+        limits = {stage: load_stage(stage).LIMITS for stage in LLM_STAGES}
+        throughput = stage_throughput([])
+        response = "1. **Cluster Characteristics:** only the first section"
+        call = continuation_call("summary", "summary_x.txt", "prompt", 600, throughput, limits, backend, cache_dir, response)
+        assert call["probability"] == 1.0 and not call["cached"]
+        assert call["artifact"] == "summary_x.txt (continuation)"
+
+        # 續寫的回應也已快取
+        missing = llm.missing_sections(response, limits["summary"].required)
+        path = llm.cache_path(llm.continuation_prompt("prompt", response, missing), backend,
+                              limits["summary"].continuation_tokens, limits["summary"].stop, cache_dir)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("2. **Justification:** ...")
+        assert continuation_call("summary", "summary_x.txt", "prompt", 600, throughput, limits, backend, cache_dir,
+                                 response)["cached"]
+
+        # 完整的回應不需要續寫；沒有快取也沒有用量紀錄時無法估算
+        complete = response + "\n2. **Justification:** a\n3. **Additional Observations:** b"
+        assert continuation_call("summary", "summary_x.txt", "prompt", 600, throughput, limits, backend, cache_dir,
+                                 complete) is None
+        assert continuation_call("summary", "summary_x.txt", "prompt", 600, throughput, limits, backend, cache_dir) is None
+        assert os.listdir(cache_dir) == [os.path.basename(path)]
+    finally:
+        shutil.rmtree(cache_dir)
@@ -0,0 +1,113 @@
+import os
+import time
+import shutil
+import tempfile
+import reset
+import workspace
+
+DAY = 86400
+
+
+def setup_test_runs(ages_in_days, size=1024):
+    """建立測試用的 run 目錄，每個 run 內含一個指定大小的摘要檔案"""
+    root = tempfile.mkdtemp()
+    now = time.time()
+    for index, age in enumerate(ages_in_days):
+        run_dir = os.path.join(root, f"run-{index}")
+        os.makedirs(os.path.join(run_dir, "clusterSummary"))
+        with open(os.path.join(run_dir, "clusterSummary", "summary.txt"), "wb") as f:
+            f.write(b"x" * size)
+        os.utime(run_dir, (now - age * DAY, now - age * DAY))
+    return root
+
+
+def planned_names(plan):
+    return sorted(os.path.basename(path) for path, _, _ in plan)
+
+
+def test_parse_size():
+    assert reset.parse_size("512") == 512
+    assert reset.parse_size("2K") == 2048
+    assert reset.parse_size("1.5G") == int(1.5 * 1024 ** 3)
+    assert reset.parse_size("10mb") == 10 * 1024 ** 2
+
+
+def test_keep_last_and_age():
+    root = setup_test_runs([5, 4, 3, 2, 1])
+    try:
+        assert planned_names(reset.plan_cleanup(root, keep_last=2)) == ["run-0", "run-1", "run-2"]
+        assert planned_names(reset.plan_cleanup(root, max_age_days=3.5)) == ["run-0", "run-1"]
+    finally:
+        shutil.rmtree(root)
+
+
+def test_latest_run_is_never_removed():
+    root = setup_test_runs([5, 4, 3])
+    try:
+        with open(os.path.join(root, reset.LATEST_FILE), "w", encoding="utf-8") as f:
+            f.write("run-0")
+        assert planned_names(reset.plan_cleanup(root, keep_last=1)) == ["run-1"]
+    finally:
+        shutil.rmtree(root)
+
+
+def test_latest_run_is_not_counted_toward_keep_last():
+    root = setup_test_runs([4, 3, 2, 1])
+    try:
+        with open(os.path.join(root, reset.LATEST_FILE), "w", encoding="utf-8") as f:
+            f.write("run-3")
+        # LATEST 之外再保留最新的 2 個 run
+        assert planned_names(reset.plan_cleanup(root, keep_last=2)) == ["run-0"]
+    finally:
+        shutil.rmtree(root)
+
+
+def test_max_total_size_removes_oldest_first():
+    root = setup_test_runs([3, 2, 1], size=1000)
+    try:
+        plan = reset.plan_cleanup(root, max_total_bytes=2000)
+        assert planned_names(plan) == ["run-0"]
+    finally:
+        shutil.rmtree(root)
+
+
+def test_dry_run_keeps_files(monkeypatch):
+    root = setup_test_runs([3, 2, 1], size=1000)
+    # 不碰開發機上真正的 tmpfs 中間產物
+    monkeypatch.setattr(workspace, "TMPFS_ROOT", tempfile.mkdtemp())
+    try:
+        reclaimed = reset.cleanup_runs(root, keep_last=1, dry_run=True)
+        assert reclaimed == 2000
+        assert len(os.listdir(root)) == 3
+
+        reset.cleanup_runs(root, keep_last=1)
+        assert os.listdir(root) == ["run-2"]
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(workspace.TMPFS_ROOT)
+
+
+def test_only_intermediates_of_the_same_root_are_removed(monkeypatch):
+    root = setup_test_runs([2, 1])
+    other_root = setup_test_runs([1])
+    monkeypatch.setattr(workspace, "TMPFS_ROOT", tempfile.mkdtemp())
+    try:
+        workspace.RunWorkspace(root=root, run_id="run-0", intermediates_in_memory=True)
+        workspace.RunWorkspace(root=root, run_id="gone", intermediates_in_memory=True)
+        shutil.rmtree(os.path.join(root, "gone"))
+        # 其他根目錄的 run（以及未記錄所屬根目錄的舊目錄）不屬於此根目錄
+        workspace.RunWorkspace(root=other_root, run_id="elsewhere", intermediates_in_memory=True)
+        os.makedirs(os.path.join(workspace.tmpfs_runs_dir(), "unknown"))
+
+        plan = reset.plan_cleanup(root, keep_last=1)
+        assert planned_names(plan + reset.plan_intermediates(root, removed=[path for path, _, _ in plan])) == [
+            "gone", "run-0", "run-0"]
+
+        reset.cleanup_runs(root, keep_last=1, dry_run=True)
+        assert sorted(os.listdir(workspace.tmpfs_runs_dir())) == ["elsewhere", "gone", "run-0", "unknown"]
+        reset.cleanup_runs(root, keep_last=1)
+        assert sorted(os.listdir(workspace.tmpfs_runs_dir())) == ["elsewhere", "unknown"]
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(other_root)
+        shutil.rmtree(workspace.TMPFS_ROOT)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+import llm
+from agents.clusterChecker import analyze_clusters
+from agents.clusterSummary import summarize_clustered_data
+from agents.dataTransferringAgent import partition_fingerprint
+from agents.toClustered import split_into_clusters
+from manifest import Manifest, discover, write_csv_artifact
+from selection import ClusterSelection
+
+
+def setup_test_partitions(partitions):
+    """建立測試用的 output_csv 目錄：每個 Epoch 一個 Depth_1_Epoch_j.csv，並如 transfer_data 一樣登記分群指紋"""
+    root = tempfile.mkdtemp()
+    input_dir = os.path.join(root, "output_csv")
+    os.makedirs(input_dir)
+    manifest = Manifest(input_dir)
+    for epoch, labels in enumerate(partitions, start=1):
+        df = pd.DataFrame({"Hash": [f"0x{i}" for i in range(len(labels))], "Value": ["1"] * len(labels),
+                           "Cluster_Value": labels})
+        fingerprint, canonical_labels = partition_fingerprint(df["Cluster_Value"])
+        write_csv_artifact(manifest, os.path.join(input_dir, f"Depth_1_Epoch_{epoch}.csv"), df, depth=1, epoch=epoch,
+                           fingerprint=fingerprint, canonical_labels=canonical_labels)
+    manifest.save()
+    return root, input_dir
+
+
+def test_fingerprint_ignores_labels_but_not_membership():
+    fingerprint, canonical = partition_fingerprint(pd.Series([0, 0, 1, 2]))
+    relabeled, relabeled_canonical = partition_fingerprint(pd.Series([7, 7, 3, 5]))
+    assert relabeled == fingerprint == partition_fingerprint(pd.Series([0, 0, 1, 2]))[0]
+    assert canonical == {"0": 0, "1": 1, "2": 2} and relabeled_canonical == {"7": 0, "3": 1, "5": 2}
+    # 成員不同（或資料列不同）就是不同的分群
+    assert partition_fingerprint(pd.Series([0, 1, 1, 2]))[0] != fingerprint
+    assert partition_fingerprint(pd.Series([0, 0, 1, 2], index=[0, 1, 2, 4]))[0] != fingerprint
+
+
+def test_repeated_partition_is_registered_as_aliases():
+    # Epoch 2 只是 Epoch 1 換了標籤；Epoch 3 是不同的分群
+    root, input_dir = setup_test_partitions([[0, 0, 1], [1, 1, 0], [0, 1, 1]])
+    output_dir = os.path.join(root, "clustered_csv")
+    try:
+        split_into_clusters(input_dir, output_dir)
+        assert sorted(os.listdir(output_dir)) == [
+            "Depth_1_Epoch_1_Cluster_0.csv", "Depth_1_Epoch_1_Cluster_1.csv",
+            "Depth_1_Epoch_3_Cluster_0.csv", "Depth_1_Epoch_3_Cluster_1.csv", "manifest.json"]
+
+        aliases = {entry["path"]: entry for entry in Manifest(output_dir).entries(ClusterSelection(epochs={2}))}
+        assert aliases["Depth_1_Epoch_2_Cluster_1.csv"]["alias_of"] == "Depth_1_Epoch_1_Cluster_0.csv"
+        assert aliases["Depth_1_Epoch_2_Cluster_1.csv"]["full_path"] == os.path.join(output_dir, "Depth_1_Epoch_1_Cluster_0.csv")
+        assert aliases["Depth_1_Epoch_2_Cluster_0.csv"]["rows"] == 1
+
+        # 別名檔名下殘留的舊檔案不會取代被引用的產物
+        with open(os.path.join(output_dir, "Depth_1_Epoch_2_Cluster_1.csv"), "w", encoding="utf-8") as f:
+            f.write("Hash,Value,Cluster_Value\nstale,0,0\n")
+        entry = Manifest(output_dir).entries(ClusterSelection(epochs={2}))[1]
+        assert entry["full_path"] == os.path.join(output_dir, "Depth_1_Epoch_1_Cluster_0.csv")
+    finally:
+        shutil.rmtree(root)
+
+
+def test_alias_without_source_summary_is_summarized(monkeypatch):
+    monkeypatch.setattr(llm, "active_backend", llm.FakeBackend())
+    root, input_dir = setup_test_partitions([[0, 0, 1], [1, 1, 0]])
+    clustered_dir = os.path.join(root, "clustered_csv")
+    summary_dir = os.path.join(root, "clusterSummary")
+    try:
+        split_into_clusters(input_dir, clustered_dir)
+        # 只選取 Epoch 2 時，被引用的 Epoch 1 摘要不存在，改為直接摘要原 cluster 的資料
+        summarize_clustered_data(clustered_dir, summary_dir, selection=ClusterSelection(epochs={2}))
+        entries = discover(summary_dir, "summary_*.txt")
+        assert [(e["epoch"], e["cluster"], e["rows"]) for e in entries] == [(2, 0, 1), (2, 1, 2)]
+        assert not any(e.get("alias_of") for e in entries)
+    finally:
+        shutil.rmtree(root)
+
+
+def analyze_partitions(monkeypatch, partitions):
+    """對測試用的分群依序執行 cluster 分割、摘要與比較，回傳 (root, 比較目錄, LLM 比較呼叫次數)"""
+    comparisons = []
+
+    def responder(prompt):
+        if "Cluster Comparison" in prompt:
+            comparisons.append(prompt)
+        return ("1. **Cluster Summaries:** Cluster 0 holds two transactions; Cluster 1 holds one.\n"
+                "2. **Key Differences:** size\n3. **Justification:** size\n4. **Additional Insights:** none")
+
+    monkeypatch.setattr(llm, "active_backend", llm.FakeBackend(responder=responder))
+    root, input_dir = setup_test_partitions(partitions)
+    clustered_dir, summary_dir, analysis_dir = (os.path.join(root, name) for name in
+                                                ("clustered_csv", "clusterSummary", "clusterAnalysis"))
+    split_into_clusters(input_dir, clustered_dir)
+    summarize_clustered_data(clustered_dir, summary_dir)
+    analyze_clusters(summary_dir, analysis_dir)
+    return root, analysis_dir, len(comparisons)
+
+
+def read_analysis(analysis_dir, epoch):
+    with open(os.path.join(analysis_dir, f"analysis_Depth_1_Epoch_{epoch}.txt"), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_identical_partition_reuses_analysis_verbatim(monkeypatch):
+    root, analysis_dir, calls = analyze_partitions(monkeypatch, [[0, 0, 1], [0, 0, 1]])
+    try:
+        assert calls == 1
+        note, body = read_analysis(analysis_dir, 2).split("\n\n", 1)
+        assert "same partition and cluster labels as Epoch 1" in note
+        assert body == read_analysis(analysis_dir, 1)
+        assert Manifest(analysis_dir).lookup("analysis_Depth_1_Epoch_2.txt")["reused_from"] == "analysis_Depth_1_Epoch_1.txt"
+    finally:
+        shutil.rmtree(root)
+
+
+def test_relabeled_partition_rewrites_cluster_ids(monkeypatch):
+    # Epoch 2 的 cluster 1 就是 Epoch 1 的 cluster 0（反之亦然）
+    root, analysis_dir, calls = analyze_partitions(monkeypatch, [[0, 0, 1], [1, 1, 0]])
+    try:
+        assert calls == 1
+        note, body = read_analysis(analysis_dir, 2).split("\n\n", 1)
+        assert "Cluster 0 → Cluster 1, Cluster 1 → Cluster 0" in note
+        assert body == read_analysis(analysis_dir, 1).replace("Cluster 0 holds two transactions; Cluster 1 holds one",
+                                                              "Cluster 1 holds two transactions; Cluster 0 holds one")
+    finally:
+        shutil.rmtree(root)
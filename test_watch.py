@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import pytest
+import llm
+import watch
+from manifest import Manifest
+from pipeline import PipelineConfig
+from workspace import RunWorkspace
+
+HEADER = "layer,BlockNumber,TimeStamp,Hash,From,To,Value,TokenName,TokenSymbol,Cluster_Depth_1_Epoch_1\n"
+
+
+def transaction(index, cluster):
+    return f"L1,{100 + index},{1700000000 + index},0xh{index},0xa{index % 2},0xb{index % 3},{index},Tether,USDT,{cluster}\n"
+
+
+def append(path, *lines):
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def cluster_rows(ws):
+    return {entry["path"]: entry["rows"] for entry in Manifest(ws.clustered_csv).entries()}
+
+
+def setup_test_run(monkeypatch, header=HEADER, row=transaction):
+    """以 fake backend 建立測試用的 run：4 筆交易分成 2 個 cluster，另有一行尚未寫完的資料"""
+    # pipeline 會設定全域的 backend 與用量紀錄，測試結束後還原
+    monkeypatch.setattr(llm, "active_backend", None)
+    monkeypatch.setattr(llm, "usage_ledger", None)
+    root = tempfile.mkdtemp()
+    input_file = os.path.join(root, "input.csv")
+    append(input_file, header, *(row(i, i % 2) for i in range(4)), "L1,104,17000")
+    config = PipelineConfig(input_file=input_file, output_root=os.path.join(root, "runs"), backend="fake")
+    ws = RunWorkspace(config.output_root)
+    state = watch.bootstrap(ws, config)
+    return root, input_file, config, ws, state
+
+
+def test_new_rows_update_only_affected_clusters(monkeypatch):
+    root, input_file, config, ws, state = setup_test_run(monkeypatch)
+    try:
+        # 不完整的最後一行不在快照中
+        assert state["offset"] == len(HEADER) + sum(len(transaction(i, i % 2)) for i in range(4))
+        assert cluster_rows(ws) == {"Depth_1_Epoch_1_Cluster_0.csv": 2, "Depth_1_Epoch_1_Cluster_1.csv": 2}
+
+        # 補完那一行並新增一筆，兩筆都屬於 cluster 0
+        append(input_file, "0,0xh4,0xa0,0xb1,4,Tether,USDT,0\n", transaction(5, 0))
+        assert watch.process_new_rows(ws, config, state, threshold=0.1) == 2
+        assert cluster_rows(ws) == {"Depth_1_Epoch_1_Cluster_0.csv": 4, "Depth_1_Epoch_1_Cluster_1.csv": 2}
+        assert state["summarized_rows"]["Depth_1_Epoch_1_Cluster_0.csv"] == 4
+        assert state["pending"] is None
+        assert watch.process_new_rows(ws, config, state, threshold=0.1) == 0
+    finally:
+        shutil.rmtree(root)
+
+
+def test_failed_refresh_is_retried_without_duplicating_rows(monkeypatch):
+    root, input_file, config, ws, state = setup_test_run(monkeypatch)
+    try:
+        append(input_file, "0,0xh4,0xa0,0xb1,4,Tether,USDT,1\n")
+
+        def unavailable(prompt):
+            raise RuntimeError("backend unavailable")
+
+        monkeypatch.setattr(llm, "active_backend", llm.FakeBackend(responder=unavailable))
+        with pytest.raises(RuntimeError, match="backend unavailable"):
+            watch.process_new_rows(ws, config, state, threshold=0.1)
+
+        # 重新啟動：資料已附加且 offset 已存檔，只重試重新整理
+        state = watch.load_state(ws)
+        assert state["pending"] == {"stale": ["Depth_1_Epoch_1_Cluster_1.csv"], "data_changed": True}
+        monkeypatch.setattr(llm, "active_backend", llm.FakeBackend())
+        assert watch.process_new_rows(ws, config, state, threshold=0.1) == 0
+        assert cluster_rows(ws) == {"Depth_1_Epoch_1_Cluster_0.csv": 2, "Depth_1_Epoch_1_Cluster_1.csv": 3}
+        with open(os.path.join(ws.clustered_csv, "Depth_1_Epoch_1_Cluster_1.csv"), encoding="utf-8") as f:
+            assert len(f.readlines()) == 1 + 3
+        assert watch.load_state(ws)["pending"] is None
+        assert state["summarized_rows"]["Depth_1_Epoch_1_Cluster_1.csv"] == 3
+    finally:
+        shutil.rmtree(root)
+
+
+def test_relabeled_alias_gets_its_own_labels_when_rows_arrive(monkeypatch):
+    # Epoch 2 與 Epoch 1 分群相同但標籤互換，Epoch 2 的 cluster 檔案一開始都是別名
+    def relabeled(index, cluster):
+        return transaction(index, cluster).rstrip("\n") + f",{1 - cluster}\n"
+
+    root, input_file, config, ws, state = setup_test_run(monkeypatch, HEADER.rstrip("\n") + ",Cluster_Depth_1_Epoch_2\n",
+                                                         relabeled)
+    try:
+        assert Manifest(ws.clustered_csv).lookup("Depth_1_Epoch_2_Cluster_1.csv")["alias_of"] == "Depth_1_Epoch_1_Cluster_0.csv"
+        append(input_file, "0,0xh4,0xa0,0xb1,4,Tether,USDT,0,1\n")
+        assert watch.process_new_rows(ws, config, state, threshold=0.1) == 1
+
+        entry = Manifest(ws.clustered_csv).lookup("Depth_1_Epoch_2_Cluster_1.csv")
+        assert entry["rows"] == 3 and not entry.get("alias_of")
+        with open(os.path.join(ws.clustered_csv, "Depth_1_Epoch_2_Cluster_1.csv"), encoding="utf-8") as f:
+            # 原 cluster 已先附加同一筆新資料，只複製登記別名時的 2 筆
+            assert [line.rstrip("\n").split(",")[3::6] for line in f][1:] == [["H0", "1"], ["H2", "1"], ["H4", "1"]]
+        assert cluster_rows(ws)["Depth_1_Epoch_1_Cluster_0.csv"] == 3
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,80 @@
+import os
+import json
+import shutil
+import tempfile
+from selection import ClusterSelection
+from workqueue import WorkQueue, selection_from_payload, selection_payload
+
+
+def setup_test_queue(**kwargs):
+    """建立測試用的佇列：兩個摘要任務與一個相依於它們的比較任務"""
+    directory = tempfile.mkdtemp()
+    queue = WorkQueue(os.path.join(directory, "queue.sqlite"), **kwargs)
+    queue.enqueue("summary", "summary:a", {"file": "a"})
+    queue.enqueue("summary", "summary:b", {"file": "b"})
+    queue.enqueue("cluster-comparison", "cluster-comparison:1:1", {}, ["summary:a", "summary:b"])
+    return directory, queue
+
+
+def test_queue_respects_dependencies():
+    directory, queue = setup_test_queue()
+    try:
+        # 重複加入相同 key 的任務不會產生新任務
+        assert not queue.enqueue("summary", "summary:a", {"file": "a"})
+        first = queue.lease("w1")
+        second = queue.lease("w2")
+        assert {first["key"], second["key"]} == {"summary:a", "summary:b"}
+        # 摘要尚未完成前，比較任務無法領取
+        assert queue.lease("w3") is None
+        assert queue.complete(first["id"], "w1")
+        assert queue.lease("w3") is None
+        assert queue.complete(second["id"], "w2")
+        assert queue.lease("w3")["key"] == "cluster-comparison:1:1"
+        assert not queue.is_finished()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_queue_expired_lease_and_retries():
+    directory, queue = setup_test_queue(lease_seconds=10, max_attempts=2)
+    try:
+        task = queue.lease("w1", kinds=["summary"], now=100)
+        # 租約過期後由其他 worker 接手，原 worker 無法再回報完成
+        stolen = queue.lease("w2", kinds=["summary"], now=111)
+        assert stolen["key"] == task["key"] and stolen["attempts"] == 2
+        assert not queue.complete(task["id"], "w1")
+
+        queue.fail(stolen["id"], "w2", "boom")
+        other = queue.lease("w2", kinds=["summary"])
+        assert other["key"] != task["key"]
+        assert queue.complete(other["id"], "w2")
+        # 達到 max_attempts 的任務標記為 failed，相依於它的比較任務永遠無法執行
+        assert queue.counts() == {"done": 1, "failed": 1, "pending": 1}
+        assert queue.lease("w3") is None
+        assert queue.is_finished()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_queue_fails_task_whose_workers_keep_dying():
+    directory, queue = setup_test_queue(lease_seconds=10, max_attempts=2)
+    try:
+        first = queue.lease("w1", kinds=["summary"], now=100)
+        # 每個 worker 都在執行中當機，從未回報 fail()
+        assert queue.lease("w2", kinds=["summary"], now=111)["key"] == first["key"]
+        retry = queue.lease("w3", kinds=["summary"], now=122)
+        assert retry["key"] != first["key"]
+        assert queue.counts() == {"failed": 1, "leased": 1, "pending": 1}
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_selection_survives_the_task_payload():
+    selection = ClusterSelection(depths={1, 2}, epoch_min=3, epoch_max=5, cluster_ids={0, 4}, min_cluster_size=10)
+    payload = json.loads(json.dumps({"depth": 2, "selection": selection_payload(selection)}))
+    assert selection_from_payload(payload) == selection
+    # 每個比較任務只處理自己的 Depth / Epoch，其餘條件沿用 enqueue 時的設定
+    assert selection_from_payload(payload, depths={2}, epochs={4}) == ClusterSelection(
+        depths={2}, epochs={4}, epoch_min=3, epoch_max=5, cluster_ids={0, 4}, min_cluster_size=10)
+    # 舊版佇列的任務沒有 selection，等同全部選取
+    assert selection_from_payload({"depth": 1}, depths={1}) == ClusterSelection(depths={1})
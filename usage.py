@@ -0,0 +1,158 @@
+# usage.py
+
+import os
+import csv
+import json
+import html
+import time
+import argparse
+import threading
+from collections import defaultdict
+
+# 每個 run 的用量紀錄檔（放在 run 目錄下）
+LEDGER_FILE = "usage.jsonl"
+
+CALL_FIELDS = ["timestamp", "stage", "backend", "model", "artifact", "prompt_tokens",
+               "completion_tokens", "latency", "cached"]
+SUMMARY_FIELDS = ["stage", "model", "calls", "cached", "prompt_tokens", "completion_tokens",
+                  "total_latency", "tokens_per_sec", "latency_p50", "latency_p90", "latency_p99"]
+
+
+class UsageLedger:
+    """以 JSON Lines 逐筆附加 LLM 呼叫的 token 用量與延遲，可供多執行緒同時寫入"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def record(self, stage, model, artifact=None, prompt_tokens=None, completion_tokens=None,
+               latency=0.0, backend=None, cached=False):
+        entry = {
+            "timestamp": time.time(),
+            "stage": stage or "unknown",
+            "backend": backend,
+            "model": model,
+            "artifact": artifact,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": round(latency, 4),
+            "cached": cached,
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def percentile(values, fraction):
+    """線性內插的百分位數（values 需已排序）"""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(records):
+    """依 (stage, model) 彙總呼叫次數、token、tokens/sec 與延遲百分位數；快取命中不計入延遲統計"""
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record["stage"], record["model"])].append(record)
+
+    rows = []
+    for (stage, model), items in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        live = [item for item in items if not item.get("cached")]
+        latencies = sorted(item["latency"] for item in live)
+        completion_tokens = sum(item["completion_tokens"] or 0 for item in live)
+        total_latency = sum(latencies)
+        rows.append({
+            "stage": stage,
+            "model": model,
+            "calls": len(items),
+            "cached": len(items) - len(live),
+            "prompt_tokens": sum(item["prompt_tokens"] or 0 for item in items),
+            "completion_tokens": sum(item["completion_tokens"] or 0 for item in items),
+            "total_latency": round(total_latency, 2),
+            "tokens_per_sec": round(completion_tokens / total_latency, 2) if total_latency else 0.0,
+            "latency_p50": round(percentile(latencies, 0.5), 2),
+            "latency_p90": round(percentile(latencies, 0.9), 2),
+            "latency_p99": round(percentile(latencies, 0.99), 2),
+        })
+    return rows
+
+
+def write_csv(path, fields, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def html_table(fields, rows):
+    header = "".join(f"<th>{html.escape(field)}</th>" for field in fields)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(row.get(field, '')))}</td>" for field in fields) + "</tr>"
+        for row in rows
+    )
+    return f"<table><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>"
+
+
+def write_report(records, output_dir, top_n=20):
+    """輸出 usage_summary.csv、usage_calls.csv 與 usage_report.html"""
+    os.makedirs(output_dir, exist_ok=True)
+    summary = summarize(records)
+    write_csv(os.path.join(output_dir, "usage_summary.csv"), SUMMARY_FIELDS, summary)
+    write_csv(os.path.join(output_dir, "usage_calls.csv"), CALL_FIELDS, records)
+
+    slowest = sorted((r for r in records if not r.get("cached")), key=lambda r: -r["latency"])[:top_n]
+    total_latency = sum(row["total_latency"] for row in summary)
+    report = f"""<html>
+<head>
+    <meta charset="utf-8">
+    <title>LLM usage report</title>
+    <style>
+        body {{ font-family: sans-serif; margin: 2em; }}
+        table {{ border-collapse: collapse; margin-bottom: 2em; }}
+        th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: right; }}
+        th {{ background: #f0f0f0; }}
+        td:first-child, td:nth-child(2) {{ text-align: left; }}
+    </style>
+</head>
+<body>
+    <h1>LLM usage report</h1>
+    <p>{len(records)} calls, {total_latency:.1f} s of LLM time.</p>
+    <h2>Per stage and model</h2>
+    {html_table(SUMMARY_FIELDS, summary)}
+    <h2>Slowest {len(slowest)} calls</h2>
+    {html_table(["stage", "model", "artifact", "prompt_tokens", "completion_tokens", "latency"], slowest)}
+</body>
+</html>
+"""
+    report_file = os.path.join(output_dir, "usage_report.html")
+    with open(report_file, "w", encoding="utf-8") as f:
+        f.write(report)
+    return report_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate LLM usage ledgers into CSV/HTML reports.")
+    parser.add_argument("ledgers", nargs="+", help=f"{LEDGER_FILE} files to aggregate")
+    parser.add_argument("--output", default="usage_report", help="report directory (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    report_file = write_report(load_records(args.ledgers), args.output)
+    print(f"✅ Saved usage report: {report_file}")
+
+
+if __name__ == "__main__":
+    main()
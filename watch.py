@@ -0,0 +1,329 @@
+# watch.py
+
+import io
+import os
+import json
+import time
+import argparse
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import llm
+from manifest import CSV_CHUNK_ROWS, Manifest, sha256_file
+from pipeline import PipelineConfig, load_stage, run_pipeline
+from schema import BASE_COLUMNS, dtypes_for, read_header
+from usage import LEDGER_FILE, UsageLedger
+from workspace import DEFAULT_ROOT, RunWorkspace, artifact_keys
+
+# 監看狀態（已處理到的 byte offset、各 cluster 上次摘要時的筆數、尚未完成的重新整理）存放在 run 目錄下
+STATE_FILE = "watch_state.json"
+# 第一次執行時 pipeline 讀取的輸入檔快照（放在中間產物目錄，完成後刪除）
+SNAPSHOT_FILE = "watch_snapshot.csv"
+SNAPSHOT_CHUNK = 1024 * 1024
+DEFAULT_INTERVAL = 30
+# cluster 筆數成長超過此比例才重新摘要
+DEFAULT_THRESHOLD = 0.1
+ENCODED_COLUMNS = ["Hash", "From", "To"]
+
+
+def load_state(ws):
+    path = os.path.join(ws.run_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(ws, state):
+    path = os.path.join(ws.run_dir, STATE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def snapshot_input(input_file, path):
+    """複製輸入檔目前所有完整的資料列（最後一行可能還在寫入中），回傳快照的大小"""
+    size = os.path.getsize(input_file)
+    with open(input_file, "rb") as src, open(path, "wb") as dst:
+        remaining = size
+        while remaining > 0:
+            chunk = src.read(min(SNAPSHOT_CHUNK, remaining))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+    # 從檔尾往前找最後一個換行，之後不完整的資料列留待監看時讀取
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - SNAPSHOT_CHUNK)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        f.truncate(end)
+    return end
+
+
+def bootstrap(ws, config):
+    """第一次執行時先以輸入檔的快照跑完整的 pipeline，offset 即為快照的大小，pipeline 執行期間新增的資料列留待監看時處理"""
+    snapshot = os.path.join(ws.intermediate_dir, SNAPSHOT_FILE)
+    offset = snapshot_input(config.input_file, snapshot)
+    try:
+        run_pipeline(dataclasses.replace(config, input_file=snapshot, run_id=ws.run_id))
+        header = list(read_header(snapshot))
+    finally:
+        os.remove(snapshot)
+    clusters = Manifest(ws.clustered_csv).entries()
+    state = {
+        "input_file": os.path.abspath(config.input_file),
+        "offset": offset,
+        "header": header,
+        "summarized_rows": {entry["path"]: entry["rows"] for entry in clusters if entry.get("rows") is not None},
+        "pending": None,
+    }
+    save_state(ws, state)
+    return state
+
+
+def read_new_rows(input_file, offset, header):
+    """從 byte offset 開始讀取新增的完整資料列，回傳 (DataFrame 或 None, 新的 offset)；最後一行不完整時留待下次讀取"""
+    with open(input_file, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end == 0:
+        return None, offset
+    text = data[:end].decode("utf-8")
+    if not text.strip():
+        return None, offset + end
+    df = pd.read_csv(io.StringIO(text), header=None, names=header, dtype=dtypes_for(header))
+    return df, offset + end
+
+
+def encode_rows(df, map_file):
+    """沿用既有的編碼對應表編碼 Hash / From / To，新出現的值接續編號"""
+    with open(map_file, "r", encoding="utf-8") as f:
+        encoding_map = json.load(f)
+    for col in ENCODED_COLUMNS:
+        mapping = encoding_map.setdefault(col, {})
+        for value in df[col].dropna().unique():
+            if value not in mapping:
+                mapping[value] = f"{col[:1]}{len(mapping)}"
+        df[col] = df[col].map(mapping)
+    with open(map_file, "w", encoding="utf-8") as f:
+        json.dump(encoding_map, f, indent=4)
+    return df
+
+
+def materialize_alias(manifest, path, entry, label):
+    """沿用其他 Epoch 的 cluster 第一次有新資料時寫出自己的檔案：分段複製原 cluster 登記別名時的資料列
+    （原 cluster 本身可能已附加同一批新資料），Cluster_Value 改為此 Epoch 的標籤（分群相同但標籤可能不同），
+    並覆蓋別名檔名下殘留的舊檔案"""
+    source = os.path.join(manifest.directory, entry["alias_of"])
+    mode = "w"
+    for chunk in pd.read_csv(source, dtype=str, keep_default_na=False, nrows=entry["rows"], chunksize=CSV_CHUNK_ROWS):
+        chunk["Cluster_Value"] = label
+        chunk.to_csv(path, mode=mode, header=mode == "w", index=False, encoding="utf-8")
+        mode = "a"
+
+
+def append_rows(manifest, path, df, **keys):
+    """將新資料列附加到 CSV 並更新 manifest 的筆數與雜湊（分群已改變，不再保留指紋與別名）"""
+    entry = manifest.lookup(path)
+    if entry and entry.get("alias_of"):
+        # 原本沿用其他 Epoch 的 cluster，資料增加後需要有自己的檔案；新資料列都屬於此 cluster，沿用其標籤
+        materialize_alias(manifest, path, entry, df["Cluster_Value"].iloc[0])
+    df.to_csv(path, mode="a", header=not os.path.exists(path), index=False, encoding="utf-8")
+    rows = (entry["rows"] if entry and entry.get("rows") is not None else 0) + len(df)
+    return manifest.add(path, rows=rows, sha256=sha256_file(path), **keys)
+
+
+def route_rows(ws, df, selection):
+    """將新資料列分配到受影響的 Depth_i_Epoch_j 與 cluster 檔案，回傳有新增資料的 (depth, epoch, cluster)"""
+    transfer_manifest = Manifest(ws.output_csv)
+    cluster_manifest = Manifest(ws.clustered_csv)
+    changed = set()
+    for column in selection.cluster_columns(df.columns):
+        depth, epoch, _ = artifact_keys(column)
+        subset = df[BASE_COLUMNS + [column]].rename(columns={column: "Cluster_Value"})
+        subset = subset[subset["Cluster_Value"].notna()]
+        if subset.empty:
+            continue
+        append_rows(transfer_manifest, os.path.join(ws.output_csv, f"Depth_{depth}_Epoch_{epoch}.csv"), subset,
+                    depth=depth, epoch=epoch)
+        for cluster_id, cluster_df in subset.groupby("Cluster_Value"):
+            if not selection.match_cluster(int(cluster_id)):
+                continue
+            path = os.path.join(ws.clustered_csv, f"Depth_{depth}_Epoch_{epoch}_Cluster_{cluster_id}.csv")
+            append_rows(cluster_manifest, path, cluster_df, depth=depth, epoch=epoch, cluster=int(cluster_id))
+            changed.add((depth, epoch, int(cluster_id)))
+    transfer_manifest.save()
+    cluster_manifest.save()
+    return changed
+
+
+def stale_clusters(ws, changed, summarized_rows, threshold):
+    """筆數成長超過 threshold（或尚未摘要過）的 cluster 檔案"""
+    cluster_manifest = Manifest(ws.clustered_csv)
+    stale = []
+    for depth, epoch, cluster in sorted(changed):
+        entry = cluster_manifest.lookup(f"Depth_{depth}_Epoch_{epoch}_Cluster_{cluster}.csv")
+        before = summarized_rows.get(entry["path"], 0)
+        if before == 0 or (entry["rows"] - before) / before >= threshold:
+            stale.append(entry)
+    return stale
+
+
+def refresh(ws, config, stale, data_changed):
+    """只重新摘要變動的 cluster，並重新比較受影響的 Epoch / Depth"""
+    selection = config.selection()
+    if data_changed:
+        # 數值指標、對齊與異常不需要 LLM，直接以完整資料重新計算
+        load_stage("metrics").compute_cluster_metrics(input_file=ws.encoded_file, output_dir=ws.cluster_metrics,
+                                                      selection=selection)
+        load_stage("matching").compute_cluster_matching(input_file=ws.encoded_file, output_dir=ws.cluster_matching,
+                                                        selection=selection)
+        load_stage("anomalies").compute_cluster_anomalies(input_file=ws.encoded_file, output_dir=ws.cluster_anomalies,
+                                                          selection=selection)
+    if not stale:
+        return []
+
+    cluster_summary = load_stage("summary")
+    summary_manifest = Manifest(ws.cluster_summary)
+    with ThreadPoolExecutor(max_workers=config.concurrency) as pool:
+        outputs = list(pool.map(lambda entry: cluster_summary.summarize_cluster_file(
+            os.path.join(ws.clustered_csv, entry["path"]), ws.cluster_summary, selection, summary_manifest,
+            ws.cluster_anomalies), stale))
+    summary_manifest.save()
+    summarized = [entry for entry, output in zip(stale, outputs) if output]
+
+    groups = sorted({(entry["depth"], entry["epoch"]) for entry in summarized})
+    cluster_checker = load_stage("cluster-comparison")
+    for depth, epoch in groups:
+        cluster_checker.analyze_clusters(input_dir=ws.cluster_summary, output_dir=ws.cluster_analysis,
+                                         max_workers=config.concurrency,
+                                         selection=dataclasses.replace(selection, depths={depth}, epochs={epoch}),
+                                         metrics_dir=ws.cluster_metrics)
+    depths = sorted({depth for depth, _ in groups})
+    if depths:
+        load_stage("epoch-comparison").summarize_depths(input_dir=ws.cluster_analysis, output_dir=ws.epoch_summary,
+                                                        max_workers=config.concurrency,
+                                                        selection=dataclasses.replace(selection, depths=set(depths)),
+                                                        matching_dir=ws.cluster_matching)
+        load_stage("depth-comparison").compare_depths(input_dir=ws.epoch_summary, output_dir=ws.depth_comparison,
+                                                      matching_dir=ws.cluster_matching)
+        load_stage("report").render_report(ws)
+    return summarized
+
+
+def ingest_new_rows(ws, config, state, threshold):
+    """將新增的資料列附加到各 partition，並立即記錄新的 offset 與待重新整理的 cluster，回傳新增的筆數"""
+    size = os.path.getsize(state["input_file"])
+    if size < state["offset"]:
+        raise RuntimeError(f"{state['input_file']} shrank from {state['offset']} to {size} bytes; start a new run instead.")
+    df, offset = read_new_rows(state["input_file"], state["offset"], state["header"])
+    if df is None:
+        state["offset"] = offset
+        return 0
+
+    print(f"📥 {len(df)} new row(s) in {state['input_file']}")
+    if os.path.exists(ws.map_file):
+        df = encode_rows(df, ws.map_file)
+    if os.path.exists(ws.encoded_file):
+        df.reindex(columns=read_header(ws.encoded_file)).to_csv(ws.encoded_file, mode="a", header=False, index=False,
+                                                                encoding="utf-8")
+    changed = route_rows(ws, df, config.selection())
+    stale = stale_clusters(ws, changed, state["summarized_rows"], threshold)
+    print(f"🔄 {len(changed)} cluster(s) received rows, {len(stale)} exceed the {threshold:.0%} re-summary threshold.")
+
+    # 資料已附加就先存檔，之後重新整理失敗（或行程中止）也不會再次附加同一段資料
+    pending = state.get("pending") or {"stale": [], "data_changed": False}
+    state["pending"] = {
+        "stale": sorted(set(pending["stale"]) | {entry["path"] for entry in stale}),
+        "data_changed": pending["data_changed"] or bool(changed),
+    }
+    state["offset"] = offset
+    save_state(ws, state)
+    return len(df)
+
+
+def refresh_pending(ws, config, state):
+    """執行尚未完成的重新整理；失敗時保留在狀態檔中，下一次輪詢（或重新啟動後）再重試"""
+    pending = state.get("pending")
+    if not pending:
+        return []
+    cluster_manifest = Manifest(ws.clustered_csv)
+    stale = [entry for entry in map(cluster_manifest.lookup, pending["stale"]) if entry]
+    summarized = refresh(ws, config, stale, pending["data_changed"])
+    for entry in summarized:
+        state["summarized_rows"][entry["path"]] = entry["rows"]
+    state["pending"] = None
+    save_state(ws, state)
+    ws.mark_latest()
+    return summarized
+
+
+def process_new_rows(ws, config, state, threshold):
+    """處理一次新增的資料（並完成先前失敗的重新整理），回傳新增的筆數"""
+    rows = ingest_new_rows(ws, config, state, threshold)
+    refresh_pending(ws, config, state)
+    return rows
+
+
+def watch(config, threshold=DEFAULT_THRESHOLD, interval=DEFAULT_INTERVAL, once=False):
+    """持續監看輸入檔，新增的交易只更新受影響的 partition 與分析"""
+    ws = RunWorkspace(config.output_root, run_id=config.run_id, intermediates_in_memory=config.intermediates_in_memory)
+    state = load_state(ws)
+    if state is None:
+        print(f"🆕 No watch state in {ws.run_dir}; running the full pipeline first.")
+        state = bootstrap(ws, config)
+    else:
+        llm.configure(backend=config.backend, model=config.model, request_timeout=config.request_timeout,
+                      llm_cache_dir=config.cache_dir, ledger=UsageLedger(os.path.join(ws.run_dir, LEDGER_FILE)))
+    print(f"👀 Watching {state['input_file']} from byte {state['offset']} (run {ws.run_id})")
+
+    while True:
+        try:
+            process_new_rows(ws, config, state, threshold)
+        except Exception as e:
+            if once:
+                raise
+            # 已附加的資料與待重新整理的 cluster 都已存檔，下一次輪詢會重試
+            print(f"⚠ Update failed ({e}); retrying in {interval}s.")
+        if once:
+            return ws
+        time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch the clustered results CSV and incrementally update a run.")
+    parser.add_argument("--input", dest="input_file", default=PipelineConfig.input_file,
+                        help="clustered results CSV to tail (default: %(default)s)")
+    parser.add_argument("--output-root", default=DEFAULT_ROOT, help="root directory for run workspaces (default: %(default)s)")
+    parser.add_argument("--run-id", help="run to keep up to date (default: a new run, built with a full pipeline pass)")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between polls (default: %(default)s)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="re-summarize a cluster once it grew by this fraction (default: %(default)s)")
+    parser.add_argument("--once", action="store_true", help="process the rows appended so far and exit")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent LLM calls (default: %(default)s)")
+    parser.add_argument("--backend", choices=sorted(llm.BACKENDS), default=llm.DEFAULT_BACKEND, help="LLM backend")
+    parser.add_argument("--model", help="model name (default: the backend's default model)")
+    parser.add_argument("--cache-dir", help="cache LLM responses in this directory")
+    args = parser.parse_args(argv)
+
+    config = PipelineConfig(input_file=args.input_file, output_root=args.output_root, run_id=args.run_id,
+                            concurrency=args.concurrency, backend=args.backend, model=args.model, cache_dir=args.cache_dir)
+    try:
+        watch(config, threshold=args.threshold, interval=args.interval, once=args.once)
+    except KeyboardInterrupt:
+        print("👋 Stopped watching.")
+
+
+if __name__ == "__main__":
+    main()
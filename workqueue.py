@@ -0,0 +1,371 @@
+# workqueue.py
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import dataclasses
+from collections import defaultdict
+from contextlib import closing, contextmanager
+
+import llm
+from manifest import Manifest, discover
+from pipeline import PipelineConfig, load_stage, run_pipeline
+from selection import ClusterSelection
+from usage import LEDGER_FILE, UsageLedger
+from workspace import DEFAULT_ROOT, RunWorkspace, artifact_keys
+
+# 佇列資料庫放在 run 目錄下，共用檔案系統的其他機器也能存取
+QUEUE_FILE = "queue.sqlite"
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 5
+
+# 佇列只負責需要 LLM 的階段，其餘階段在 enqueue 時直接執行
+LOCAL_STAGES = ["encode", "transfer", "metrics", "matching", "anomalies"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    task_key TEXT NOT NULL,
+    depends_on TEXT NOT NULL,
+    PRIMARY KEY (task_key, depends_on)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+"""
+
+
+class WorkQueue:
+    """以 SQLite 保存的工作佇列：任務有相依關係，worker 以租約（lease）領取，租約過期的任務會被重新分配"""
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE 立即取得寫入鎖，多個 worker 不會領到同一個任務"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def enqueue(self, kind, key, payload, depends_on=()):
+        """加入任務（相同 key 的任務已存在時不重複加入），回傳是否為新任務"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO tasks (key, kind, payload, updated) VALUES (?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            conn.executemany("INSERT OR IGNORE INTO dependencies (task_key, depends_on) VALUES (?, ?)",
+                             [(key, dependency) for dependency in depends_on])
+            return cursor.rowcount > 0
+
+    def lease(self, owner, kinds=None, now=None):
+        """領取一個相依任務都已完成的任務（含租約已過期的任務），沒有可執行的任務時回傳 None"""
+        now = now if now is not None else time.time()
+        kind_filter = f"AND kind IN ({', '.join('?' for _ in kinds)})" if kinds else ""
+        with self.transaction() as conn:
+            # 租約過期且已用完重試次數的任務（worker 當機或被 OOM 終止）標記為 failed，不再無限重試
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                "error = 'lease expired after ' || attempts || ' attempt(s); the worker stopped responding', updated = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                f"""
+                SELECT * FROM tasks t
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) {kind_filter}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM dependencies d JOIN tasks dep ON dep.key = d.depends_on
+                      WHERE d.task_key = t.key AND dep.status != 'done')
+                ORDER BY id LIMIT 1
+                """,
+                (now, *(kinds or ())),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE id = ?",
+                (owner, now + self.lease_seconds, now, row["id"]),
+            )
+            task = dict(row)
+            task["payload"] = json.loads(task["payload"])
+            task["attempts"] += 1
+            return task
+
+    def renew(self, task_id, owner, now=None):
+        """延長租約，回傳租約是否仍屬於此 worker"""
+        now = now if now is not None else time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now + self.lease_seconds, now, task_id, owner),
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, task_id, owner):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'done', lease_owner = NULL, lease_expires = NULL, error = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (time.time(), task_id, owner),
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, task_id, owner, error):
+        """任務失敗：未達 max_attempts 時放回佇列，否則標記為 failed"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_owner = NULL, lease_expires = NULL, error = ?, updated = ? WHERE id = ? AND lease_owner = ?",
+                (self.max_attempts, str(error), time.time(), task_id, owner),
+            )
+
+    def counts(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def is_finished(self):
+        """所有任務都已完成或放棄（直接或間接相依於 failed 任務的任務永遠無法執行，也視為結束）"""
+        with closing(self._connect()) as conn:
+            statuses = {row["key"]: row["status"] for row in conn.execute("SELECT key, status FROM tasks")}
+            dependencies = defaultdict(list)
+            for row in conn.execute("SELECT task_key, depends_on FROM dependencies"):
+                dependencies[row["task_key"]].append(row["depends_on"])
+        if "leased" in statuses.values():
+            return False
+
+        blocked = {key for key, status in statuses.items() if status == "failed"}
+        pending = {key for key, status in statuses.items() if status == "pending"}
+        changed = True
+        while changed:
+            newly_blocked = {key for key in pending - blocked if any(dep in blocked for dep in dependencies[key])}
+            blocked |= newly_blocked
+            changed = bool(newly_blocked)
+        return not (pending - blocked)
+
+
+def open_queue(ws, **kwargs):
+    return WorkQueue(os.path.join(ws.run_dir, QUEUE_FILE), **kwargs)
+
+
+def selection_payload(selection):
+    """將 ClusterSelection 轉為可存入任務 payload 的 JSON 格式"""
+    return {name: sorted(value) if isinstance(value, set) else value
+            for name, value in dataclasses.asdict(selection).items()}
+
+
+def selection_from_payload(payload, **narrow):
+    """還原 enqueue 時的 ClusterSelection，narrow 可再限定於單一 Depth / Epoch"""
+    fields = {name: set(value) if isinstance(value, list) else value for name, value in payload.get("selection", {}).items()}
+    return ClusterSelection(**{**fields, **narrow})
+
+
+def enqueue_run(ws, config):
+    """為 run 中的每個 cluster、(Depth, Epoch)、Depth 建立 LLM 任務與相依關係，回傳新增的任務數"""
+    queue = open_queue(ws)
+    selection = config.selection()
+    added = 0
+
+    summary_keys = {}
+    groups = defaultdict(list)
+    alias_sources = defaultdict(set)
+    for entry in discover(ws.clustered_csv, "Depth_*_Epoch_*_Cluster_*.csv", selection):
+        key = f"summary:{entry['path']}"
+        summary_keys[entry["path"]] = key
+        depends_on = []
+        if entry.get("alias_of") in summary_keys:
+            # 沿用其他 Epoch 的 cluster 需要等原 cluster 的摘要完成
+            depends_on.append(summary_keys[entry["alias_of"]])
+            alias_sources[(entry["depth"], entry["epoch"])].add(artifact_keys(entry["alias_of"])[1])
+        added += queue.enqueue("summary", key, {"file": entry["path"], "alias": bool(entry.get("alias_of")),
+                                                "min_cluster_size": config.min_cluster_size}, depends_on)
+        groups[(entry["depth"], entry["epoch"])].append(key)
+
+    for (depth, epoch), keys in sorted(groups.items()):
+        # 沿用其他 Epoch 分析的 (Depth, Epoch) 也要等原 Epoch 的比較完成
+        sources = [f"cluster-comparison:{depth}:{source}" for source in sorted(alias_sources[(depth, epoch)])]
+        added += queue.enqueue("cluster-comparison", f"cluster-comparison:{depth}:{epoch}",
+                               {"depth": depth, "epoch": epoch, "selection": selection_payload(selection)}, keys + sources)
+
+    depths = sorted({depth for depth, _ in groups})
+    for depth in depths:
+        keys = [f"cluster-comparison:{d}:{e}" for d, e in groups if d == depth]
+        added += queue.enqueue("epoch-comparison", f"epoch-comparison:{depth}",
+                               {"depth": depth, "selection": selection_payload(selection)}, keys)
+    if depths:
+        added += queue.enqueue("depth-comparison", "depth-comparison", {},
+                               [f"epoch-comparison:{depth}" for depth in depths])
+    return added
+
+
+def run_task(ws, task):
+    """執行單一任務（各階段的最小工作單位）"""
+    kind, payload = task["kind"], task["payload"]
+    if kind == "summary":
+        cluster_summary = load_stage("summary")
+        if payload["alias"]:
+            entry = next(e for e in discover(ws.clustered_csv, payload["file"]) if e["path"] == payload["file"])
+            manifest = Manifest(ws.cluster_summary)
+            output = cluster_summary.reuse_summary(entry, ws.cluster_summary, manifest,
+                                                   ClusterSelection(min_cluster_size=payload["min_cluster_size"]),
+                                                   anomalies_dir=ws.cluster_anomalies)
+            manifest.save()
+            return output
+        return cluster_summary.summarize_cluster_file(os.path.join(ws.clustered_csv, payload["file"]), ws.cluster_summary,
+                                                      ClusterSelection(min_cluster_size=payload["min_cluster_size"]),
+                                                      anomalies_dir=ws.cluster_anomalies)
+    if kind == "cluster-comparison":
+        # 同一個 Depth 的其他 Epoch 可能沿用此分析，因此 cluster-comparison 依 (Depth, Epoch) 各自執行
+        return load_stage("cluster-comparison").analyze_clusters(
+            input_dir=ws.cluster_summary, output_dir=ws.cluster_analysis,
+            selection=selection_from_payload(payload, depths={payload["depth"]}, epochs={payload["epoch"]}),
+            metrics_dir=ws.cluster_metrics)
+    if kind == "epoch-comparison":
+        return load_stage("epoch-comparison").summarize_depths(
+            input_dir=ws.cluster_analysis, output_dir=ws.epoch_summary,
+            selection=selection_from_payload(payload, depths={payload["depth"]}), matching_dir=ws.cluster_matching)
+    if kind == "depth-comparison":
+        return load_stage("depth-comparison").compare_depths(input_dir=ws.epoch_summary, output_dir=ws.depth_comparison,
+                                                             matching_dir=ws.cluster_matching)
+    raise ValueError(f"Unknown task kind '{kind}'")
+
+
+class LeaseKeeper:
+    """任務執行期間定期延長租約，避免長時間的 LLM 呼叫被誤判為 worker 當機"""
+
+    def __init__(self, queue, task_id, owner):
+        self.queue, self.task_id, self.owner = queue, task_id, owner
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            self.queue.renew(self.task_id, self.owner)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def work(ws, owner=None, kinds=None, poll=POLL_SECONDS, forever=False):
+    """worker 主迴圈：領取任務、執行、回報結果；佇列結束時離開（forever=True 時持續等待新任務）"""
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    queue = open_queue(ws)
+    done = 0
+    while True:
+        task = queue.lease(owner, kinds)
+        if task is None:
+            if not forever and queue.is_finished():
+                print(f"✅ Queue finished ({queue.counts()}); {owner} completed {done} task(s).")
+                return done
+            time.sleep(poll)
+            continue
+
+        print(f"🔧 {owner} running {task['key']} (attempt {task['attempts']})")
+        try:
+            with LeaseKeeper(queue, task["id"], owner):
+                run_task(ws, task)
+        except Exception as e:
+            print(f"❌ {task['key']} failed: {e}")
+            queue.fail(task["id"], owner, e)
+            continue
+        if queue.complete(task["id"], owner):
+            done += 1
+        else:
+            print(f"⚠ Lease on {task['key']} expired before completion; another worker may redo it.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distribute the LLM stages of a run across worker processes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="run the local stages and enqueue the LLM tasks of a run")
+    enqueue_parser.add_argument("--input", dest="input_file", default=PipelineConfig.input_file)
+    enqueue_parser.add_argument("--depths", nargs="+", type=int, help="only process these depths")
+    enqueue_parser.add_argument("--epochs", nargs="+", type=int, help="only process these epochs")
+    enqueue_parser.add_argument("--epoch-range", nargs=2, type=int, metavar=("FIRST", "LAST"),
+                                help="only process epochs in this inclusive range")
+    enqueue_parser.add_argument("--clusters", nargs="+", type=int, help="only process these cluster IDs")
+    enqueue_parser.add_argument("--min-cluster-size", type=int, default=0,
+                                help="skip clusters with fewer transactions than this")
+
+    work_parser = subparsers.add_parser("work", help="lease and run tasks until the queue is finished")
+    work_parser.add_argument("--backend", choices=sorted(llm.BACKENDS), default=llm.DEFAULT_BACKEND)
+    work_parser.add_argument("--model", help="model name (default: the backend's default model)")
+    work_parser.add_argument("--cache-dir", help="cache LLM responses in this directory")
+    work_parser.add_argument("--kinds", nargs="+", help="only lease these task kinds (e.g. summary)")
+    work_parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="seconds between polls when idle")
+    work_parser.add_argument("--forever", action="store_true", help="keep waiting for new tasks")
+
+    subparsers.add_parser("status", help="show task counts")
+
+    for sub in subparsers.choices.values():
+        sub.add_argument("--output-root", default=DEFAULT_ROOT, help="root directory for run workspaces")
+        sub.add_argument("--run-id", help="run to use (default: a new run for enqueue, the latest run otherwise)")
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue":
+        config = PipelineConfig(input_file=args.input_file, stages=LOCAL_STAGES, output_root=args.output_root,
+                                run_id=args.run_id, depths=args.depths, epochs=args.epochs,
+                                epoch_range=tuple(args.epoch_range) if args.epoch_range else None,
+                                cluster_ids=args.clusters, min_cluster_size=args.min_cluster_size)
+        ws = run_pipeline(config)
+        print(f"📬 Enqueued {enqueue_run(ws, config)} task(s) for run {ws.run_id}")
+        return
+
+    try:
+        ws = RunWorkspace.open(args.output_root, args.run_id) if args.run_id else RunWorkspace.latest(args.output_root)
+    except FileNotFoundError as e:
+        print(f"⚠ {e}.")
+        return
+    if ws is None:
+        print(f"⚠ No runs found in {args.output_root}.")
+        return
+    if args.command == "status":
+        print(f"{ws.run_id}: {open_queue(ws).counts()}")
+        return
+
+    llm.configure(backend=args.backend, model=args.model, llm_cache_dir=args.cache_dir,
+                  ledger=UsageLedger(os.path.join(ws.run_dir, LEDGER_FILE)))
+    work(ws, kinds=args.kinds, poll=args.poll, forever=args.forever)
+
+
+if __name__ == "__main__":
+    main()
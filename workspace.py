@@ -0,0 +1,204 @@
+# workspace.py
+
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+# 所有 run 的預設根目錄
+DEFAULT_ROOT = "runs"
+
+# 記錄最新一次 run 的檔案（放在根目錄下）
+LATEST_FILE = "LATEST"
+
+# RAM-disk / tmpfs 的預設位置（不存在時退回系統暫存目錄）
+TMPFS_ROOT = "/dev/shm"
+
+# 記錄 tmpfs 中間產物屬於哪個根目錄的檔案（放在 tmpfs 的 run 目錄下）
+OWNER_FILE = "ROOT"
+
+# 各階段的輸出目錄，中間產物可放在 tmpfs，最終分析結果一律放在 run 目錄
+INTERMEDIATE_DIRS = ["output_csv", "clustered_csv"]
+RESULT_DIRS = ["clusterMetrics", "clusterMatching", "clusterAnomalies", "clusterSummary", "clusterAnalysis", "epochSummary", "depthComparison"]
+STAGE_DIRS = INTERMEDIATE_DIRS + RESULT_DIRS
+
+ENCODED_FILE = "data_encoded.csv"
+MAP_FILE = "encoding_map.json"
+
+
+def new_run_id():
+    """產生依時間排序、且多個行程同時建立也不會衝突的 run ID"""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def tmpfs_runs_dir():
+    """tmpfs 上放置各 run 中間產物的目錄"""
+    tmp_root = TMPFS_ROOT if os.path.isdir(TMPFS_ROOT) else tempfile.gettempdir()
+    return os.path.join(tmp_root, "quantum-runs")
+
+
+def intermediates_owner(path):
+    """tmpfs 中間產物目錄所屬的根目錄，舊版未記錄時回傳 None"""
+    try:
+        with open(os.path.join(path, OWNER_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def owned_intermediates(root=DEFAULT_ROOT):
+    """tmpfs 上屬於此根目錄的中間產物：run ID -> 目錄"""
+    tmp_runs = tmpfs_runs_dir()
+    if not os.path.isdir(tmp_runs):
+        return {}
+    root = os.path.abspath(root)
+    return {entry.name: entry.path for entry in os.scandir(tmp_runs)
+            if entry.is_dir() and intermediates_owner(entry.path) == root}
+
+
+class RunWorkspace:
+    """單次 pipeline 執行的工作目錄，所有階段的輸入輸出路徑都由這裡決定"""
+
+    def __init__(self, root=DEFAULT_ROOT, run_id=None, intermediates_in_memory=False, create=True):
+        self.root = os.path.abspath(root)
+        self.run_id = run_id or new_run_id()
+        self.run_dir = os.path.join(self.root, self.run_id)
+        self.intermediates_in_memory = intermediates_in_memory
+
+        if intermediates_in_memory:
+            self.intermediate_dir = os.path.join(tmpfs_runs_dir(), self.run_id)
+        else:
+            self.intermediate_dir = self.run_dir
+
+        # create=False 只決定路徑，不建立目錄或寫入任何檔案（唯讀的工具使用）
+        if not create:
+            return
+        os.makedirs(self.run_dir, exist_ok=True)
+        os.makedirs(self.intermediate_dir, exist_ok=True)
+        if intermediates_in_memory:
+            # 記錄所屬的根目錄，清理其他根目錄時才不會誤刪
+            with open(os.path.join(self.intermediate_dir, OWNER_FILE), "w", encoding="utf-8") as f:
+                f.write(self.root)
+
+    def locate(self, name):
+        """某個階段目錄的路徑（不建立目錄）"""
+        base = self.intermediate_dir if name in INTERMEDIATE_DIRS else self.run_dir
+        return os.path.join(base, name)
+
+    def path(self, name):
+        """取得某個階段目錄的路徑（會自動建立）"""
+        directory = self.locate(name)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    @property
+    def encoded_file(self):
+        return os.path.join(self.intermediate_dir, ENCODED_FILE)
+
+    @property
+    def map_file(self):
+        # 編碼對應表需要保留下來才能還原原始 Hash / From / To
+        return os.path.join(self.run_dir, MAP_FILE)
+
+    @property
+    def output_csv(self):
+        return self.path("output_csv")
+
+    @property
+    def clustered_csv(self):
+        return self.path("clustered_csv")
+
+    @property
+    def cluster_metrics(self):
+        return self.path("clusterMetrics")
+
+    @property
+    def cluster_matching(self):
+        return self.path("clusterMatching")
+
+    @property
+    def cluster_anomalies(self):
+        return self.path("clusterAnomalies")
+
+    @property
+    def cluster_summary(self):
+        return self.path("clusterSummary")
+
+    @property
+    def cluster_analysis(self):
+        return self.path("clusterAnalysis")
+
+    @property
+    def epoch_summary(self):
+        return self.path("epochSummary")
+
+    @property
+    def depth_comparison(self):
+        return self.path("depthComparison")
+
+    def mark_latest(self):
+        """將此 run 記錄為最新一次的結果，供 FileReviewer 等工具使用"""
+        with open(os.path.join(self.root, LATEST_FILE), "w", encoding="utf-8") as f:
+            f.write(self.run_id)
+
+    def discard_intermediates(self):
+        """一次刪除整個中間產物目錄（output_csv、clustered_csv、data_encoded.csv）"""
+        if self.intermediate_dir != self.run_dir:
+            shutil.rmtree(self.intermediate_dir, ignore_errors=True)
+            return
+        for name in INTERMEDIATE_DIRS:
+            shutil.rmtree(os.path.join(self.run_dir, name), ignore_errors=True)
+        if os.path.exists(self.encoded_file):
+            os.remove(self.encoded_file)
+
+    @classmethod
+    def resolve(cls, root, run_id):
+        """找出既有 run 各目錄的位置，不建立目錄也不寫入任何檔案；run 不存在時拋出 FileNotFoundError
+        （讀取用，取得目錄請用 locate()）"""
+        if not run_id or not os.path.isdir(os.path.join(root, run_id)):
+            raise FileNotFoundError(f"Run '{run_id}' not found in {root}")
+        tmp_dir = os.path.join(tmpfs_runs_dir(), run_id)
+        in_memory = intermediates_owner(tmp_dir) == os.path.abspath(root)
+        return cls(root=root, run_id=run_id, intermediates_in_memory=in_memory, create=False)
+
+    @classmethod
+    def open(cls, root, run_id):
+        """開啟既有的 run 以寫入輸出；中間產物記錄在 tmpfs 上（--intermediates-in-memory）時沿用該位置，
+        run 不存在時拋出 FileNotFoundError（打錯的 run ID 不會建立新的 run 目錄）"""
+        resolved = cls.resolve(root, run_id)
+        return cls(root=root, run_id=run_id, intermediates_in_memory=resolved.intermediates_in_memory)
+
+    @classmethod
+    def latest(cls, root=DEFAULT_ROOT):
+        """開啟最新一次的 run，沒有任何 run 時回傳 None"""
+        latest_file = os.path.join(root, LATEST_FILE)
+        if not os.path.exists(latest_file):
+            return None
+        with open(latest_file, "r", encoding="utf-8") as f:
+            run_id = f.read().strip()
+        if not run_id or not os.path.isdir(os.path.join(root, run_id)):
+            return None
+        return cls.open(root, run_id)
+
+
+def list_runs(root=DEFAULT_ROOT):
+    """列出根目錄下所有 run 目錄，依建立時間由舊到新排序"""
+    if not os.path.isdir(root):
+        return []
+    runs = [entry for entry in os.scandir(root) if entry.is_dir()]
+    runs.sort(key=lambda entry: (entry.stat().st_mtime, entry.name))
+    return [entry.path for entry in runs]
+
+
+# 解析 Depth_i_Epoch_j_Cluster_k 形式的檔名（前綴如 summary_、analysis_ 皆可）
+ARTIFACT_PATTERN = re.compile(r"Depth_(\d+)(?:_Epoch_(\d+))?(?:_Cluster_(-?\d+))?")
+
+
+def artifact_keys(filename):
+    """從產物檔名或 Cluster_Depth_i_Epoch_j 欄位名稱取出 (depth, epoch, cluster)，缺少的部分為 None"""
+    match = ARTIFACT_PATTERN.search(os.path.basename(filename))
+    if not match:
+        return None, None, None
+    return tuple(int(value) if value is not None else None for value in match.groups())